@@ -1,5 +1,6 @@
 import asyncio
 import collections
+from functools import partial
 from dataclasses import dataclass
 import json
 import random
@@ -16,8 +17,9 @@ from discord.utils import utcnow
 from discord.errors import NotFound, HTTPException, Forbidden
 
 from cogs.BaseCog import BaseCog
-from utils import Lang, Utils, Questions, Emoji, Configuration, Logging
+from utils import Lang, Utils, Questions, Emoji, Configuration, Logging, Retry
 from utils.Database import AutoResponder
+from utils.TTLMap import TTLMap
 
 
 @dataclass
@@ -40,6 +42,9 @@ class ArFlags(Enum):
 
 
 class AutoResponders(BaseCog):
+    state_containers = ("ar_list_messages", "mod_messages", "mod_action_expiry")
+    reload_state = ("triggers", "mod_messages", "expired_actions", "mod_action_expiry", "ar_list", "ar_list_messages",
+                    "loaded")
     flags = {
         'active': 0,
         'full_match': 1,
@@ -60,6 +65,8 @@ class AutoResponders(BaseCog):
         super().__init__(bot)
         self.triggers = dict()
         self.mod_messages = dict()
+        # (guild id, message id, action) of mod actions nobody acted on in time, for the clean task to mark expired
+        self.expired_actions = collections.deque()
         self.mod_action_expiry = dict()
         self.ar_list = dict()
         self.ar_list_messages = dict()
@@ -68,7 +75,6 @@ class AutoResponders(BaseCog):
     async def on_ready(self):
         for guild in self.bot.guilds:
             await self.init_guild(guild)
-        self.reload_mod_actions()
         await self.reload_triggers()
         if not self.clean_old_autoresponders.is_running():
             self.clean_old_autoresponders.start()
@@ -76,15 +82,21 @@ class AutoResponders(BaseCog):
     def cog_unload(self):
         self.clean_old_autoresponders.cancel()
 
+    async def import_state(self, state):
+        await super().import_state(state)
+        # expiry callbacks still point at the unloaded cog
+        for guild_id, actions in self.mod_messages.items():
+            actions.on_expire = partial(self.queue_expired_action, guild_id)
+
     async def init_guild(self, guild):
         self.triggers[guild.id] = dict()
-        self.mod_messages[guild.id] = dict()
         self.ar_list[guild.id] = []
         self.ar_list_messages[guild.id] = dict()
         self.mod_action_expiry[guild.id] = Configuration.get_var(
             f'auto_action_expiry_seconds_{guild.id}',
             self.action_expiry_default
         )
+        self.load_mod_actions(guild)
 
     @commands.Cog.listener()
     async def on_guild_join(self, guild):
@@ -135,49 +147,54 @@ class AutoResponders(BaseCog):
             if value is index:
                 return key
 
-    def reload_mod_actions(self, ctx=None):
-        guilds = self.bot.guilds if ctx is None else [ctx.guild]
-        for guild in guilds:
-            self.mod_messages[guild.id] = dict()
-            saved_mod_messages = Configuration.get_persistent_var(f"mod_messages_{guild.id}")
-            if saved_mod_messages:
-                for channel_id, actions in saved_mod_messages.items():
-                    # Convert json str keys to int
-                    channel_id = int(channel_id)
-                    if channel_id not in self.mod_messages[guild.id]:
-                        self.mod_messages[guild.id][channel_id] = dict()
-                    for message_id, action in actions.items():
-                        message_id = int(message_id)
-                        self.mod_messages[guild.id][channel_id][message_id] = action
+    def load_mod_actions(self, guild):
+        persist_key = f"mod_messages_{guild.id}"
+        saved_mod_messages = Configuration.get_persistent_var(persist_key)
+        converted = None
+        if saved_mod_messages and all(isinstance(actions, dict) for actions in saved_mod_messages.values()):
+            # saved by channel before actions expired on their own. flatten to message id -> action
+            converted = {
+                message_id: [{**action, "response_channel_id": int(channel_id)},
+                             action['event_datetime'] + self.mod_action_expiry[guild.id]]
+                for channel_id, actions in saved_mod_messages.items()
+                for message_id, action in actions.items()}
+        # message id of the mod action message -> action
+        self.mod_messages[guild.id] = TTLMap("AutoResponders.mod_messages",
+                                             ttl=self.mod_action_expiry[guild.id],
+                                             max_size=5000,
+                                             on_expire=partial(self.queue_expired_action, guild.id),
+                                             persist_key=persist_key,
+                                             key_type=int,
+                                             initial=converted)
+
+    def queue_expired_action(self, guild_id, message_id, action):
+        self.expired_actions.append((guild_id, message_id, action))
 
     @tasks.loop(seconds=60)
     async def clean_old_autoresponders(self):
-        for guild_id, channels in self.mod_messages.items():
-            for channel_id, messages in channels.items():
-                for message_id, action in dict(messages).items():
-                    now = datetime.now().timestamp()
-                    if (now - action['event_datetime']) > self.mod_action_expiry[guild_id]:
-                        #  expire very old mod action messages --- remove reacts and add "expired" react
-                        try:
-                            del self.mod_messages[guild_id][channel_id][message_id]
-                            Configuration.set_persistent_var(f"mod_messages_{guild_id}", self.mod_messages[guild_id])
-
-                            guild = self.bot.get_guild(guild_id)
-                            channel = guild.get_channel(channel_id)
-                            message = await channel.fetch_message(message_id)
-                            await message.clear_reactions()
-
-                            # replace mod action list with acting mod name and datetime
-                            my_embed = message.embeds[0]
-                            start = message.created_at
-                            react_time = utcnow()
-                            time_d = Utils.to_pretty_time((react_time - start).seconds)
-                            my_embed.set_field_at(-1, name="Expired", value=f'No action taken for {time_d}', inline=True)
-                            edited_message = await message.edit(embed=my_embed)
-                            await edited_message.add_reaction(Emoji.get_emoji("SNAIL"))
-                        except Exception as e:
-                            pass
-                        pass
+        for actions in self.mod_messages.values():
+            # expired actions are queued in expired_actions
+            actions.expire()
+
+        while self.expired_actions:
+            guild_id, message_id, action = self.expired_actions.popleft()
+            #  expire very old mod action messages --- remove reacts and add "expired" react
+            try:
+                guild = self.bot.get_guild(guild_id)
+                channel = guild.get_channel(action['response_channel_id'])
+                message = await channel.fetch_message(message_id)
+                await message.clear_reactions()
+
+                # replace mod action list with acting mod name and datetime
+                my_embed = message.embeds[0]
+                start = message.created_at
+                react_time = utcnow()
+                time_d = Utils.to_pretty_time((react_time - start).seconds)
+                my_embed.set_field_at(-1, name="Expired", value=f'No action taken for {time_d}', inline=True)
+                edited_message = await message.edit(embed=my_embed)
+                await edited_message.add_reaction(Emoji.get_emoji("SNAIL"))
+            except Exception as e:
+                pass
 
     async def reload_triggers(self, ctx=None):
         guilds = self.bot.guilds if ctx is None else [ctx.guild]
@@ -439,31 +456,19 @@ class AutoResponders(BaseCog):
             DESTROY: {Emoji.get_emoji("NO")}
         """)
 
-        # message add reactions
-        # try a few times to send message if it fails
-        tries = 0
-        max_tries = 10
-        sent_response = None
-        while tries < max_tries:
-            try:
-                sent_response = await response_channel.send(embed=embed)
-                break
-            except Exception as e:
-                tries = tries + 1
-                if tries == max_tries:
-                    await Utils.handle_exception("failed to send mod-action message", self.bot, e)
-                    return
+        # send message and add reactions. transient failures are retried with backoff
+        try:
+            sent_response = await Retry.call("send", response_channel.send, embed=embed, scope=response_channel.id)
+        except Exception as e:
+            await Utils.handle_exception("failed to send mod-action message", self.bot, e)
+            return
 
         for action_emoji in ("YES", "CANDLE", "WARNING", "NO"):
-            tries = 0
-            while tries < max_tries:
-                try:
-                    await sent_response.add_reaction(Emoji.get_emoji(action_emoji))
-                    break
-                except Exception as e:
-                    tries = tries + 1
-                    if tries == max_tries:
-                        await Utils.handle_exception(f"failed to add {action_emoji} react to mod-action message", self.bot, e)
+            try:
+                await Retry.call("add_reaction", sent_response.add_reaction, Emoji.get_emoji(action_emoji),
+                                 scope=response_channel.id)
+            except Exception as e:
+                await Utils.handle_exception(f"failed to add {action_emoji} react to mod-action message", self.bot, e)
 
         # a record of the event
         record = {"channel_id": message.channel.id,
@@ -473,12 +478,9 @@ class AutoResponders(BaseCog):
 
         guild_id = response_channel.guild.id
 
-        # init dict where necessary
-        if response_channel.id not in self.mod_messages[guild_id]:
-            self.mod_messages[guild_id][response_channel.id] = dict()
-
-        self.mod_messages[guild_id][response_channel.id][sent_response.id] = record
-        Configuration.set_persistent_var(f"mod_messages_{guild_id}", self.mod_messages[guild_id])
+        record["response_channel_id"] = response_channel.id
+        # saved by the map, and marked expired by the clean task if nobody acts on it in time
+        self.mod_messages[guild_id][sent_response.id] = record
 
     @commands.group(name="autoresponder", aliases=['ar', 'auto'])
     @commands.guild_only()
@@ -509,6 +511,10 @@ class AutoResponders(BaseCog):
             Configuration.MASTER_CONFIG[f'auto_action_expiry_seconds_{ctx.guild.id}'] = expiry_seconds
             Configuration.save()
             self.mod_action_expiry[ctx.guild.id] = expiry_seconds
+            actions = self.mod_messages[ctx.guild.id]
+            actions.ttl = expiry_seconds
+            for message_id, action in list(actions.items()):
+                actions.set(message_id, action, expires_at=action['event_datetime'] + expiry_seconds)
             await ctx.send(f"Configuration saved. Autoresponder mod action messages are now valid for {exp}")
         except Exception as e:
             await ctx.send(f"Failed while saving configuration. check the logs...")
@@ -1103,10 +1109,9 @@ class AutoResponders(BaseCog):
                 await self.update_list_message(self.ar_list_messages[channel.guild.id][event.message_id], event)
                 return
 
-            if event.message_id in self.mod_messages[channel.guild.id][channel.id]:
-                action = self.mod_messages[channel.guild.id][channel.id].pop(event.message_id)
+            if event.message_id in self.mod_messages[channel.guild.id]:
+                action = self.mod_messages[channel.guild.id].pop(event.message_id)
                 message = await channel.fetch_message(event.message_id)
-                Configuration.set_persistent_var(f"mod_messages_{channel.guild.id}", self.mod_messages[channel.guild.id])
 
         except (NotFound, KeyError, AttributeError, HTTPException) as e:
             # couldn't find channel, message, member, or action
@@ -1,8 +1,49 @@
+from discord.ext import tasks
 from discord.ext.commands import Cog
 
 from sky import Skybot
 
 
 class BaseCog(Cog):
+    # cogs that go through every member of a guild set this, and get them with get_members
+    needs_member_list = False
+    # attributes holding state that can grow while the bot runs. their sizes show in `debug memory` and metrics
+    state_containers = ()
+    # attributes handed to the new instance on hot reload, instead of loading them again in on_ready
+    reload_state = ()
+    # names of cogs that have to be reloaded before this one
+    depends_on = ()
+
     def __init__(self, bot):
-        self.bot: Skybot = bot
\ No newline at end of file
+        self.bot: Skybot = bot
+
+    async def get_members(self, guild):
+        """Every member of the guild. The list is fetched on first use when guilds are not chunked at startup"""
+        await self.bot.ensure_chunked(guild)
+        return guild.members
+
+    def get_loops(self):
+        """name -> this instance's task loop"""
+        return {name: getattr(self, name) for name in dir(type(self))
+                if isinstance(getattr(type(self), name, None), tasks.Loop)}
+
+    def export_state(self):
+        """
+        State to hand to the reloaded cog, called before unloading. None when the cog has to start cold
+        :return: {"attributes": {name: value}, "loops": names of the task loops that were running}
+        """
+        if not self.reload_state:
+            return None
+        return {
+            "attributes": {name: getattr(self, name) for name in self.reload_state if hasattr(self, name)},
+            "loops": [name for name, loop in self.get_loops().items() if loop.is_running()],
+        }
+
+    async def import_state(self, state):
+        """Take over what export_state returned, instead of on_ready, and restart the loops that were running"""
+        for name, value in state["attributes"].items():
+            setattr(self, name, value)
+        loops = self.get_loops()
+        for name in state["loops"]:
+            if name in loops and not loops[name].is_running():
+                loops[name].start()
@@ -1,24 +1,30 @@
 import asyncio
+import io
 import re
 import time
-from dataclasses import dataclass
+import typing
+from dataclasses import dataclass, field, replace
 
 import discord
 
 from utils.Utils import get_member_log_name
-from sky import queue_worker
+from sky import WorkerPool
 from asyncio import CancelledError
 from datetime import datetime
 
-from discord import Forbidden, Embed, NotFound, HTTPException, TextChannel, AllowedMentions
+from discord import Forbidden, Embed, NotFound, HTTPException, TextChannel, AllowedMentions, Interaction, TextStyle
+from discord import ButtonStyle, SelectOption, File, ui
 from discord.ext import commands, tasks
 from discord.ext.commands import Context
 from discord.utils import utcnow
+from tortoise import Tortoise
 from tortoise.exceptions import DoesNotExist, OperationalError, IntegrityError
+from tortoise.transactions import in_transaction
 
 import sky
 from cogs.BaseCog import BaseCog
-from utils import Questions, Emoji, Utils, Configuration, Lang, Logging
+from utils import Questions, Emoji, Utils, Configuration, Lang, Logging, Retry, StickyMessages, DuplicateIndex
+from utils.Converters import BugReportingField
 from utils.Database import BugReport, Attachments, BugReportingPlatform, BugReportingChannel
 from utils.Database import Guild, BugReportFieldLength
 from utils.Logging import TCol
@@ -30,9 +36,267 @@ class BugReportingAction:
     channel: discord.TextChannel
 
 
-class Bugs(BaseCog):
+@dataclass()
+class BugReportForm:
+    platform: str = ""
+    branch: str = ""
+    platform_version: str = ""
+    app_version: str = ""
+    app_build: str = None
+    deviceinfo: str = ""
+    title: str = ""
+    actual: str = ""
+    steps: str = ""
+    expected: str = ""
+    additional_text: str = ""
+    attachment_links: list = field(default_factory=list)
 
-    bug_report_queue = asyncio.Queue()
+
+@dataclass()
+class BugFormField:
+    attr: str
+    label_key: str
+    question_key: str
+    max_length: int
+    version: bool = False
+    required: bool = True
+    style: TextStyle = TextStyle.paragraph
+
+
+# modal fields, in the same order the DM dialog asks them. a field is left out if its lang keys are not defined
+DEVICE_FIELDS = [
+    BugFormField("platform_version", "bugs/platform", "bugs/question_platform_version",
+                 BugReportFieldLength.generic_version, version=True, style=TextStyle.short),
+    BugFormField("deviceinfo", "bugs/device_info", "bugs/question_device_info", BugReportFieldLength.deviceinfo),
+    BugFormField("app_version", "bugs/app_version", "bugs/question_app_version",
+                 BugReportFieldLength.generic_version, version=True, style=TextStyle.short),
+    BugFormField("app_build", "bugs/app_build", "bugs/question_app_build",
+                 BugReportFieldLength.generic_version, version=True, style=TextStyle.short),
+]
+REPORT_FIELDS = [
+    BugFormField("title", "bugs/title", "bugs/question_title", BugReportFieldLength.title, style=TextStyle.short),
+    BugFormField("actual", "bugs/description", "bugs/question_actual", BugReportFieldLength.actual),
+    BugFormField("steps", "bugs/steps_to_reproduce", "bugs/question_steps", BugReportFieldLength.steps),
+    BugFormField("expected", "bugs/expected", "bugs/question_expected", BugReportFieldLength.expected),
+    BugFormField("additional_text", "bugs/additional_info", "bugs/question_additional_info",
+                 BugReportFieldLength.additional, required=False),
+]
+
+
+def verify_version(ctx, v):
+    if "latest" in v:
+        return Lang.get_locale_string("bugs/latest_not_allowed", ctx)
+    # TODO: double check if we actually want to enforce this
+    if len(Utils.NUMBER_MATCHER.findall(v)) == 0:
+        return Lang.get_locale_string("bugs/no_numbers", ctx)
+    if len(v) > BugReportFieldLength.generic_version:
+        return Lang.get_locale_string("bugs/love_letter", ctx)
+    return True
+
+
+def max_length(ctx, length):
+    def real_check(text):
+        if len(text) > length:
+            return Lang.get_locale_string("bugs/text_too_long", ctx, max=length)
+        return True
+
+    return real_check
+
+
+def get_defined_fields(fields, ctx):
+    defined = []
+    for item in fields:
+        try:
+            Lang.get_locale_string(item.label_key, ctx)
+            Lang.get_locale_string(item.question_key, ctx)
+        except KeyError:
+            # Expected when a question is not defined
+            continue
+        defined.append(item)
+    return defined
+
+
+class BugFieldsModal(ui.Modal):
+    """A batch of text questions, checked with the same validators the DM dialog uses"""
+
+    def __init__(self, form_view, title, fields):
+        super().__init__(title=Utils.trim_message(title, 45), timeout=form_view.timeout)
+        self.form_view = form_view
+        self.inputs = []
+        for item in fields:
+            text_input = ui.TextInput(
+                label=Utils.trim_message(Lang.get_locale_string(item.label_key, form_view.ctx), 45),
+                style=item.style,
+                max_length=item.max_length,
+                required=item.required,
+                # the form keeps what was typed. escaped text would be escaped again on the next submit
+                default=getattr(form_view.form, item.attr) or None)
+            self.add_item(text_input)
+            self.inputs.append((item, text_input))
+
+    async def on_submit(self, interaction: Interaction):
+        view = self.form_view
+        errors = []
+        for item, text_input in self.inputs:
+            content = Questions.clean_text(text_input.value.strip())
+            if content:
+                # checked as it will be saved
+                escaped = Utils.escape_markdown(content)
+                if item.version:
+                    result = verify_version(view.ctx, escaped)
+                else:
+                    result = max_length(view.ctx, item.max_length)(escaped)
+                if result is not True:
+                    errors.append(f"**{text_input.label}**: {result}")
+                    continue
+            setattr(view.form, item.attr, content)
+        await interaction.response.edit_message(embed=view.get_preview(), view=view)
+        if errors:
+            await interaction.followup.send(
+                Lang.get_locale_string("bugs/form_invalid_fields", view.ctx, errors="\n".join(errors)))
+
+
+class BugFormView(ui.View):
+    """Bug report intake: a select for platform/branch, modals for the text fields, and a live preview"""
+
+    def __init__(self, cog, user, channel, ctx, platform_rows, timeout):
+        super().__init__(timeout=timeout)
+        self.cog = cog
+        self.user = user
+        self.channel = channel
+        self.ctx = ctx
+        # answers as typed. get_escaped_form has them the way they're shown and saved
+        self.form = BugReportForm()
+        self.submitted = False
+        # attachments are being asked for in the DM channel
+        self.collecting = False
+        self.device_fields = get_defined_fields(DEVICE_FIELDS, ctx)
+        self.report_fields = get_defined_fields(REPORT_FIELDS, ctx)
+        self.platforms = [(row.platform, row.branch) for row in platform_rows][:25]
+
+        if len(self.platforms) == 0:
+            self.form.platform = self.form.branch = "NONE"
+        elif len(self.platforms) == 1:
+            self.form.platform, self.form.branch = self.platforms[0]
+        else:
+            select = ui.Select(
+                placeholder=Lang.get_locale_string("bugs/form_platform_placeholder", ctx),
+                options=[
+                    SelectOption(label=f"{platform} / {'Live' if branch.lower() == 'stable' else branch}",
+                                 value=str(i))
+                    for i, (platform, branch) in enumerate(self.platforms)])
+            select.callback = self.make_select_callback(select)
+            self.add_item(select)
+
+        if self.device_fields:
+            self.add_button("bugs/form_device_button", ButtonStyle.primary, self.open_device_modal)
+        self.add_button("bugs/form_report_button", ButtonStyle.primary, self.open_report_modal)
+        # locked while attachments are collected
+        self.locked_buttons = [
+            self.add_button("bugs/form_attachments_button", ButtonStyle.secondary, self.add_attachments),
+            self.add_button("bugs/form_submit", ButtonStyle.success, self.submit),
+            self.add_button("bugs/form_cancel", ButtonStyle.danger, self.cancel),
+        ]
+
+    def add_button(self, key, style, callback):
+        button = ui.Button(label=Lang.get_locale_string(key, self.ctx), style=style, row=1)
+        button.callback = callback
+        self.add_item(button)
+        return button
+
+    def make_select_callback(self, select):
+        async def callback(interaction: Interaction):
+            self.form.platform, self.form.branch = self.platforms[int(select.values[0])]
+            for option in select.options:
+                option.default = option.value == select.values[0]
+            await interaction.response.edit_message(embed=self.get_preview(), view=self)
+        return callback
+
+    def get_escaped_form(self):
+        return replace(self.form, **{item.attr: Utils.escape_markdown(getattr(self.form, item.attr))
+                                     for item in [*self.device_fields, *self.report_fields]
+                                     if getattr(self.form, item.attr)})
+
+    def get_preview(self):
+        return self.cog.build_report_embed(self.user, self.ctx, self.get_escaped_form())
+
+    def set_collecting(self, collecting):
+        self.collecting = collecting
+        for button in self.locked_buttons:
+            button.disabled = collecting
+
+    def get_missing_fields(self):
+        missing = []
+        if not self.form.platform:
+            missing.append(Lang.get_locale_string("bugs/form_platform_placeholder", self.ctx))
+        for item in [*self.device_fields, *self.report_fields]:
+            if item.required and not getattr(self.form, item.attr):
+                missing.append(Lang.get_locale_string(item.label_key, self.ctx))
+        return missing
+
+    async def open_device_modal(self, interaction: Interaction):
+        title = Lang.get_locale_string("bugs/form_device_title", self.ctx)
+        await interaction.response.send_modal(BugFieldsModal(self, title, self.device_fields))
+
+    async def open_report_modal(self, interaction: Interaction):
+        title = Lang.get_locale_string("bugs/form_report_title", self.ctx)
+        await interaction.response.send_modal(BugFieldsModal(self, title, self.report_fields))
+
+    async def add_attachments(self, interaction: Interaction):
+        # modals can't carry files, so attachments still go through the message dialog
+        self.set_collecting(True)
+        await interaction.response.edit_message(view=self)
+        try:
+            links = await Questions.ask_attachements(
+                self.cog.bot, self.channel, self.user, timeout=300, locale=self.ctx)
+            self.form.attachment_links = list(dict.fromkeys(links))
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            self.set_collecting(False)
+        if not self.is_finished():
+            await interaction.edit_original_response(embed=self.get_preview(), view=self)
+
+    async def submit(self, interaction: Interaction):
+        if self.collecting:
+            # clicked before the buttons were locked
+            await interaction.response.defer()
+            return
+        missing = self.get_missing_fields()
+        if missing:
+            await interaction.response.send_message(
+                Lang.get_locale_string("bugs/form_missing_fields", self.ctx, fields=", ".join(missing)))
+            return
+        self.submitted = True
+        await interaction.response.edit_message(view=None)
+        self.stop()
+
+    async def cancel(self, interaction: Interaction):
+        if self.collecting:
+            await interaction.response.defer()
+            return
+        await interaction.response.edit_message(view=None)
+        self.stop()
+
+    async def interaction_check(self, interaction: Interaction):
+        return interaction.user.id == self.user.id
+
+
+class Bugs(BaseCog):
+    state_containers = ("bug_messages", "in_progress", "sweeps", "stats_cache")
+    # the pool keeps its queue and workers. reports already running finish on the unloaded instance, whose
+    # containers are the same objects. queued reports start on the new one
+    reload_state = ("bug_messages", "in_progress", "sweeps", "blocking", "routes", "stats_cache", "bug_pool",
+                    "maintenance_ctx", "maintenance_message", "maint_check_count")
+
+    stats_ttl = 300
+    stats_periods = {
+        # pymysql formatting: literal % is doubled
+        "day": "DATE_FORMAT(FROM_UNIXTIME(reported_at), '%%Y-%%m-%%d')",
+        "week": "DATE_FORMAT(FROM_UNIXTIME(reported_at), '%%x-W%%v')",
+    }
+    report_size_sql = "CHAR_LENGTH(title) + CHAR_LENGTH(actual) + CHAR_LENGTH(steps) + CHAR_LENGTH(expected) + " \
+                      "CHAR_LENGTH(additional)"
 
     def __init__(self, bot):
         super().__init__(bot)
@@ -41,35 +305,64 @@ class Bugs(BaseCog):
         self.sweeps = dict()
         self.blocking = set()
         self.maintenance_message = None
+        # the bug_maintenance invocation verify_empty_bug_queue reports back to
+        self.maintenance_ctx = None
         self.maint_check_count = 0
-        self.bug_tasks = []
-        self.bug_runner_tasks = [
-            asyncio.create_task(
-                queue_worker(f"Bug Queue {i}", self.bug_report_queue, self.run_bug_report))
-            for i in range(200)
-        ]
+        self.bug_pool = WorkerPool("Bug Queue", self.run_bug_report,
+                                   min_workers=Configuration.get_var("bug_workers_min", 2),
+                                   max_workers=Configuration.get_var("bug_workers_max", 200),
+                                   idle_seconds=Configuration.get_var("bug_worker_idle_seconds", 60))
+        self.bug_pool.start()
+        # (platform, branch) -> report channel ids. kept current by refresh_routes so reports don't query for it
+        self.routes = dict()
+        # (period, days, platform, branch) -> (expires at, stats)
+        self.stats_cache = dict()
+        self.index_task = None
+        # set when export_state gave the pool, sweeps and bug info messages to the reloaded cog
+        self.handed_over = False
+
+    def export_state(self):
+        state = super().export_state()
+        self.handed_over = True
+        return state
+
+    async def import_state(self, state):
+        # the pool started in __init__ makes way for the one holding the queue and the reports in progress
+        await self.bug_pool.stop()
+        loops = state["loops"]
+        await super().import_state({**state, "loops": [name for name in loops if name != "verify_empty_bug_queue"]})
+        self.bug_pool.job = self.run_bug_report
+        if "verify_empty_bug_queue" in loops:
+            self.verify_empty_bug_queue.start(self.maintenance_ctx)
 
     async def cog_unload(self):
-        if self.bug_report_queue.qsize() > 0:
-            Logging.info(f"\tthere are {self.bug_report_queue.qsize()} bug reports not yet started...")
+        if self.index_task is not None:
+            self.index_task.cancel()
+        self.verify_empty_bug_queue.cancel()
+        if self.handed_over:
+            Logging.info(f"\t{TCol.cOkGreen}Bugs unloaded, {len(self.in_progress)} reports in progress and "
+                         f"{self.bug_pool.queue.qsize()} queued carry on{TCol.cEnd}")
+            return
+        if self.bug_pool.queue.qsize() > 0:
+            Logging.info(f"\tthere are {self.bug_pool.queue.qsize()} bug reports not yet started...")
             # TODO: warn queued users their reports won't start
             # TODO: cancel report
             # TODO: save bug progress
             # TODO: resume report when restarting? inform user report was interrupted by restart, re-ask last question
-        Logging.info(f"\t{TCol.cWarning}Cancel active bug runners{TCol.cEnd}")
-        for task in [*self.bug_runner_tasks, *self.bug_tasks]:
-            task.cancel()
         try:
-            Logging.info(f"\t{TCol.cWarning}Wait for bug tasks to end{TCol.cEnd}")
-            await asyncio.gather(*self.bug_tasks)
-            Logging.info(f"\t{TCol.cWarning}Wait for bug runners to end{TCol.cEnd}")
-            await asyncio.gather(*self.bug_runner_tasks)
+            Logging.info(f"\t{TCol.cWarning}Cancel active bug runners and wait for them to end{TCol.cEnd}")
+            await self.bug_pool.stop()
         except CancelledError:
             pass
         except Exception as e:
             Logging.info(e)
-        Logging.info(f"\t{TCol.cWarning}Verify empty bug queue{TCol.cEnd}")
-        self.verify_empty_bug_queue.cancel()
+        Logging.info(f"\t{TCol.cWarning}Remember bug info messages{TCol.cEnd}")
+        for channel_ids in self.routes.values():
+            for cid in channel_ids:
+                message_id = StickyMessages.forget(cid)
+                channel = self.bot.get_channel(cid)
+                if message_id is not None and channel is not None:
+                    Configuration.set_persistent_var(f"{channel.guild.id}_{cid}_bug_message", message_id)
         Logging.info(f"\t{TCol.cWarning}Cancel bug cleanup tasks{TCol.cEnd}")
         for task in self.sweeps:
             task.cancel()
@@ -80,14 +373,50 @@ class Bugs(BaseCog):
         Logging.info("starting bugs")
         m = self.bot.metrics
         m.reports_in_progress.set_function(lambda: len(self.in_progress))
-        # this count is only good for reports waiting to start
-        # TODO: how to count number of workers that are working?
-        # m.reports_in_progress.set_function(self.bug_report_queue.qsize)
+        await self.refresh_routes()
+        # reports waiting to start, and workers busy with one, are exported by the bug pool
+        if not DuplicateIndex.loaded:
+            # the cog isn't added until this returns, so nothing queries the index while it loads
+            await asyncio.to_thread(DuplicateIndex.load)
+        self.index_task = asyncio.create_task(self.backfill_duplicate_index())
+
+    async def backfill_duplicate_index(self):
+        # index reports saved while the index wasn't being kept up to date, oldest first
+        last_id = DuplicateIndex.get_cursor()
+        count = 0
+        try:
+            while True:
+                page = await BugReport.filter(id__gt=last_id).order_by("id").limit(500) \
+                    .only("id", "title", "actual", "steps")
+                if not page:
+                    break
+                records = []
+                for report in page:
+                    if report.id in DuplicateIndex.SIGNATURES:
+                        continue
+                    # milliseconds of pure python per report. one at a time in a thread, so the loop keeps going
+                    signature = await asyncio.to_thread(DuplicateIndex.get_signature,
+                                                        DuplicateIndex.get_report_text(report))
+                    if signature is not None:
+                        DuplicateIndex.index(report.id, signature)
+                        records.append((report.id, signature))
+                await asyncio.to_thread(DuplicateIndex.save, records)
+                last_id = page[-1].id
+                DuplicateIndex.set_cursor(last_id)
+                count += len(records)
+        except CancelledError:
+            raise
+        except Exception as e:
+            await Utils.handle_exception("duplicate index backfill failure", self.bot, e)
+        if count:
+            Logging.info(f"duplicate index caught up on {count} reports")
 
     async def on_ready(self):
         Logging.info("readying bugs")
         reporting_channel_ids = []
-        for row in await BugReportingChannel.all().prefetch_related('guild', 'platform'):
+        rows = await BugReportingChannel.all().prefetch_related('guild', 'platform')
+        self.set_routes(rows)
+        for row in rows:
             cid = row.channelid
             name = f"{row.platform.platform}_{row.platform.branch}"
             guild_id = row.guild.serverid
@@ -102,26 +431,57 @@ class Bugs(BaseCog):
                     await message.delete()
                 except (NotFound, HTTPException):
                     pass
+
+            bug_info_id = Configuration.get_persistent_var(f"{guild_id}_{cid}_bug_message")
+            if bug_info_id is not None and StickyMessages.get_message_id(cid) is None:
+                # pick up the bug info message from before the restart. it's only reposted if no longer at the bottom
+                StickyMessages.adopt(cid, bug_info_id)
+                self.bug_messages.add(bug_info_id)
             reporting_channel_ids.append(cid)
         try:
             await self.send_bug_info(*reporting_channel_ids)
         except Exception as e:
             await Utils.handle_exception("bug startup failure", self.bot, e)
 
+    def set_routes(self, rows):
+        routes = dict()
+        for row in rows:
+            routes.setdefault((row.platform.platform, row.platform.branch), []).append(row.channelid)
+        self.routes = routes
+
+    async def refresh_routes(self):
+        """Rebuild the platform/branch -> report channel table. call after changing channels or platforms"""
+        self.set_routes(await BugReportingChannel.all().prefetch_related('platform'))
+
+    def observe_stage(self, stage, started_at):
+        now = time.monotonic()
+        self.bot.metrics.bug_report_stage_seconds.labels(stage=stage).observe(now - started_at)
+        return now
+
     async def can_mod(ctx):
         guild = Utils.get_home_guild()
         member = guild.get_member(ctx.author.id)
         return member.guild_permissions.mute_members or await Utils.BOT.permission_manage_bot(ctx)
 
-    def enqueue_bug_report(self, user, channel):
-        self.bug_report_queue.put_nowait(BugReportingAction(user, channel))
+    async def enqueue_bug_report(self, user, channel):
+        position = self.bug_pool.position(user.id)
+        if position is None:
+            position = self.bug_pool.put(BugReportingAction(user, channel), key=user.id)
+            if not self.bug_pool.is_saturated():
+                return
+        # every worker is busy, or the user is still waiting from before and reacted again.
+        # let them know where they are in line instead of leaving them guessing
+        try:
+            await channel.send(Lang.get_locale_string("bugs/queue_position", Lang.locale_context(channel),
+                                                      user=user.mention, position=position),
+                               delete_after=30)
+        except Exception as e:
+            await Utils.handle_exception("bug queue position notice failure", self.bot, e)
 
     async def run_bug_report(self, work_item: BugReportingAction):
         try:
             Logging.info(f"Beginning bug report for {TCol.cOkCyan}{get_member_log_name(work_item.author)}{TCol.cEnd}")
-            this_task = self.bot.loop.create_task(self.report_bug(work_item.author, work_item.channel))
-            self.bug_tasks.append(this_task)
-            await this_task
+            await self.report_bug(work_item.author, work_item.channel)
         except CancelledError as e:
             # TODO: why is CancelledError not caught here during shutdown?
             Logging.info(f"channel {work_item.channel.id}, user {get_member_log_name(work_item.author)}")
@@ -171,48 +531,36 @@ class Bugs(BaseCog):
                 await Utils.handle_exception(message, self.bot, e)
 
     async def send_bug_info(self, *args):
-        send_tasks = []
+        # reposts are debounced per channel, so a burst of reports moves the bug info message once
         for channel_id in args:
             channel = self.bot.get_channel(channel_id)
             if channel is None:
                 await Logging.bot_log(f"can't send bug info to nonexistent channel {channel_id}")
                 continue
-            send_tasks.append(self.send_bug_info_impl(channel))
-        await asyncio.gather(*send_tasks)
+            StickyMessages.request(channel, self.render_bug_info)
 
-    async def send_bug_info_impl(self, channel):
-        bug_info_id = Configuration.get_persistent_var(f"{channel.guild.id}_{channel.id}_bug_message")
-
-        ctx = None
-        tries = 0
-        while not ctx and tries < 5:
-            tries += 1
-            try:
-                last_message = await channel.send('preparing bug reporting...')
-                ctx = await self.bot.get_context(last_message)
+    async def render_bug_info(self, channel):
+        old_message_id = StickyMessages.get_message_id(channel.id)
+        bugemoji = Emoji.get_emoji('BUG')
+        try:
+            message = await Retry.call(
+                "send", channel.send,
+                Lang.get_locale_string("bugs/bug_info", Lang.locale_context(channel), bug_emoji=bugemoji),
+                scope=channel.id)
+        except Exception as e:
+            await self.bot.guild_log(channel.guild.id, f'Having trouble sending bug message in {channel.mention}')
+            await Utils.handle_exception(
+                f"Bug report message failed to send in channel #{channel.name} ({channel.id})", self.bot, e)
+            return None
 
-                if bug_info_id is not None:
-                    try:
-                        message = await channel.fetch_message(bug_info_id)
-                    except (NotFound, HTTPException):
-                        pass
-                    else:
-                        if message.id in self.bug_messages:
-                            self.bug_messages.remove(message.id)
-                        await message.delete()
-
-                bugemoji = Emoji.get_emoji('BUG')
-                message = await channel.send(Lang.get_locale_string("bugs/bug_info", ctx, bug_emoji=bugemoji))
-                self.bug_messages.add(message.id)
-                await message.add_reaction(bugemoji)
-                Configuration.set_persistent_var(f"{channel.guild.id}_{channel.id}_bug_message", message.id)
-                Logging.info(f"Bug report message sent in channel #{channel.name} ({channel.id})")
-                await last_message.delete()
-            except Exception as e:
-                await self.bot.guild_log(channel.guild.id, f'Having trouble sending bug message in {channel.mention}')
-                await Utils.handle_exception(
-                    f"Bug report message failed to send in channel #{channel.name} ({channel.id})", self.bot, e)
-                await asyncio.sleep(0.5)
+        self.bug_messages.add(message.id)
+        self.bug_messages.discard(old_message_id)
+        try:
+            await Retry.call("add_reaction", message.add_reaction, bugemoji, scope=channel.id)
+        except Exception as e:
+            await Utils.handle_exception(
+                f"Bug report reaction failed in channel #{channel.name} ({channel.id})", self.bot, e)
+        return message
 
     @tasks.loop(seconds=30.0)
     async def verify_empty_bug_queue(self, ctx):
@@ -244,6 +592,7 @@ class Bugs(BaseCog):
     async def on_guild_remove(self, guild):
         guild_row = await self.bot.get_guild_db_config(guild.id)
         await guild_row.bug_channels.filter().delete()
+        await self.refresh_routes()
 
     @commands.command(aliases=["bugmaint", "maintenance", "maintenance_mode", "maint"])
     @commands.guild_only()
@@ -314,6 +663,7 @@ class Bugs(BaseCog):
                     self.maint_check_count = 0
                     if not self.verify_empty_bug_queue.is_running():
                         self.maintenance_message = None
+                        self.maintenance_ctx = ctx
                         self.verify_empty_bug_queue.start(ctx)
                     await ctx.send(Lang.get_locale_string('bugs/maint_on', ctx))
                 else:
@@ -325,7 +675,7 @@ class Bugs(BaseCog):
         # remove command to not flood chat (unless we are in a DM already)
         if ctx.guild is not None:
             await ctx.message.delete()
-        self.enqueue_bug_report(ctx.author, ctx.channel)
+        await self.enqueue_bug_report(ctx.author, ctx.channel)
 
     @bug.command()
     @commands.check(can_mod)
@@ -334,6 +684,109 @@ class Bugs(BaseCog):
         await self.on_ready()
         await ctx.send("Done! ||I think?||")
 
+    @bug.command()
+    @commands.check(can_mod)
+    async def stats(self, ctx, period: typing.Optional[typing.Literal["day", "week"]] = "day",
+                    days: typing.Optional[int] = 30,
+                    platform: typing.Optional[BugReportingField("platform")] = None,
+                    branch: typing.Optional[BugReportingField("branch")] = None,
+                    output: typing.Optional[typing.Literal["embed", "csv"]] = "embed"):
+        """
+        Bug report statistics for the last {days} days. any of the options can be left out
+
+        bug stats                          daily counts for the last 30 days
+        bug stats week 90                  weekly counts for the last 90 days
+        bug stats day 7 android beta       only android/beta reports
+        bug stats beta csv                 daily counts of beta reports as a CSV file
+        """
+        stats = await self.get_report_stats(period, max(1, days), platform, branch)
+
+        if output == "csv":
+            buffer = io.StringIO()
+            Utils.save_to_buffer(buffer, stats['counts'], 'csv',
+                                 ["period", "platform", "branch", "app_version", "reports"])
+            await ctx.send(file=File(io.BytesIO(buffer.getvalue().encode("utf-8")),
+                                     filename=f"bug_stats_{period}_{days}.csv"))
+            return
+
+        embed = Embed(
+            timestamp=ctx.message.created_at,
+            color=0x50f3d7,
+            title=f'Bug reports, last {days} days')
+        lines = [f"`{row['period']}` {row['platform']}/{row['branch']} {row['app_version']}: **{row['reports']}**"
+                 for row in stats['counts']]
+        embed.add_field(name=f"Reports per {period}", value=Utils.trim_message("\n".join(lines) or "none", 1024),
+                        inline=False)
+        reporters = [f"<@{row['reporter']}>: **{row['reports']}**" for row in stats['top_reporters']]
+        embed.add_field(name="Top reporters", value="\n".join(reporters) or "none", inline=True)
+        embed.add_field(name="Median report size", value=f"{stats['median_size']} characters", inline=True)
+        await ctx.send(embed=embed, allowed_mentions=AllowedMentions.none())
+
+    async def get_report_stats(self, period, days, platform=None, branch=None):
+        key = (period, days, platform, branch)
+        cached = self.stats_cache.get(key)
+        if cached is not None and cached[0] > time.monotonic():
+            return cached[1]
+
+        stats = await self.query_report_stats(period, days, platform, branch)
+        now = time.monotonic()
+        self.stats_cache = {k: v for k, v in self.stats_cache.items() if v[0] > now}
+        self.stats_cache[key] = (now + self.stats_ttl, stats)
+        return stats
+
+    @classmethod
+    async def query_report_stats(cls, period, days, platform=None, branch=None):
+        """MySQL only. :return: dict with counts per period, top_reporters and median_size"""
+        conn = Tortoise.get_connection("default")
+        where = ["reported_at >= %s"]
+        values = [int(utcnow().timestamp()) - days * 86400]
+        if platform:
+            where.append("platform = %s")
+            values.append(platform)
+        if branch:
+            where.append("branch = %s")
+            values.append(branch)
+        where = " AND ".join(where)
+
+        counts = await conn.execute_query_dict(
+            f"SELECT {cls.stats_periods[period]} AS period, platform, branch, app_version, COUNT(*) AS reports "
+            f"FROM bugreport WHERE {where} "
+            f"GROUP BY period, platform, branch, app_version "
+            f"ORDER BY period DESC, reports DESC", values)
+        top_reporters = await conn.execute_query_dict(
+            f"SELECT reporter, COUNT(*) AS reports FROM bugreport WHERE {where} "
+            f"GROUP BY reporter ORDER BY reports DESC LIMIT 10", values)
+        total = (await conn.execute_query_dict(
+            f"SELECT COUNT(*) AS total FROM bugreport WHERE {where}", values))[0]['total']
+        median_size = 0
+        if total:
+            # middle row by size. the database sorts, only one row comes back
+            median_size = (await conn.execute_query_dict(
+                f"SELECT {cls.report_size_sql} AS size FROM bugreport WHERE {where} "
+                f"ORDER BY size LIMIT 1 OFFSET %s", [*values, total // 2]))[0]['size']
+
+        return dict(counts=counts, top_reporters=top_reporters, median_size=median_size)
+
+    @bug.command()
+    @commands.check(can_mod)
+    async def similar(self, ctx, report_id: int):
+        """List reports that look like duplicates of report {report_id}"""
+        report = await BugReport.get_or_none(id=report_id)
+        if report is None:
+            await ctx.send(f"I couldn't find bug report #{report_id}")
+            return
+        signature = DuplicateIndex.SIGNATURES.get(report_id) or \
+            await asyncio.to_thread(DuplicateIndex.get_signature, DuplicateIndex.get_report_text(report))
+        matches = DuplicateIndex.query(signature, limit=10, exclude=report_id)
+        if not matches:
+            await ctx.send(f"No reports look similar to #{report_id}")
+            return
+        titles = {row.id: row.title for row in await BugReport.filter(id__in=[i for i, score in matches])
+                  .only("id", "title")}
+        lines = [f"**#{i}** ({score:.0%}) {Utils.trim_message(titles.get(i, '?'), 80)}" for i, score in matches]
+        await ctx.send(f"Reports similar to #{report_id}: {Utils.trim_message(report.title, 80)}\n" + "\n".join(lines),
+                       allowed_mentions=AllowedMentions.none())
+
     @bug.group(name='platforms', aliases=['platform'], invoke_without_command=True)
     @commands.check(sky.can_admin)
     async def platforms(self, ctx):
@@ -365,6 +818,7 @@ class Bugs(BaseCog):
     async def add_platform(self, ctx, platform, branch):
         row, create = await BugReportingPlatform.get_or_create(platform=platform, branch=branch)
         if create:
+            await self.refresh_routes()
             await ctx.send(f"Ok, I added `{platform}/{branch}` to my database")
         else:
             await ctx.send(f"That platform/branch combination is already in my database")
@@ -378,6 +832,7 @@ class Bugs(BaseCog):
         else:
             try:
                 await row.delete()
+                await self.refresh_routes()
                 await ctx.send(f"Ok, I removed `{platform}/{branch}` from my database")
             except OperationalError:
                 await ctx.send(f"I couldn't delete `{platform}/{branch}` from my database. I really tried, I promise!")
@@ -415,6 +870,8 @@ class Bugs(BaseCog):
         for guild_id, channel_list in non_guild_channels.items():
             server_name = self.bot.get_guild(guild_id).name or f"[{guild_id}][MISSING GUILD]"
             embed.add_field(name=f'`{server_name}` server', value="\n".join(channel_list))
+        # stale channel rows may have been deleted above
+        await self.refresh_routes()
         if not guild_channels and not non_guild_channels:
             await ctx.send("There are no configured bug reporting channels")
         else:
@@ -430,6 +887,7 @@ class Bugs(BaseCog):
             platform = row.platform.platform
             branch = row.platform.branch
             await row.delete()
+            await self.refresh_routes()
             await ctx.send(f"Removed `{platform}`/`{branch}`/{channel.mention} from my database")
         except OperationalError:
             await ctx.send(f"Could not find {channel.mention} in my database")
@@ -464,6 +922,7 @@ class Bugs(BaseCog):
             return
 
         if created:
+            await self.refresh_routes()
             await ctx.send(f"{channel.mention} will now be used to record `{platform}/{branch}` bug reports")
         else:
             await ctx.send(f"{channel.mention} was already configured for `{platform}/{branch}` bug reports")
@@ -473,7 +932,7 @@ class Bugs(BaseCog):
     @commands.check(sky.can_admin)
     async def reset_active(self, ctx):
         """Reset active bug reports. Bot will attempt to DM users whose reports are canceled."""
-        to_kill = self.bug_report_queue.qsize()
+        to_kill = self.bug_pool.queue.qsize()
         # to_kill = len(self.in_progress)
         active_keys = [key for key in self.in_progress.keys()]
         for uid in active_keys:
@@ -494,9 +953,7 @@ class Bugs(BaseCog):
     async def report_bug(self, user, trigger_channel):
         # fully ignore muted users
         m = self.bot.metrics
-        last_message = [message async for message in trigger_channel.history(limit=1)]
-        last_message = last_message[0]
-        ctx = await self.bot.get_context(last_message)
+        ctx = Lang.locale_context(trigger_channel, user)
         await asyncio.sleep(1)
 
         # Get member from home guild. failing that, check other bot.guilds for member
@@ -553,7 +1010,8 @@ class Bugs(BaseCog):
                 return
 
         # Start a bug report
-        task = self.bot.loop.create_task(self.actual_bug_reporter(user, trigger_channel))
+        reporter = self.actual_bug_form if Configuration.get_var("bug_report_modals", False) else self.actual_bug_reporter
+        task = self.bot.loop.create_task(reporter(user, trigger_channel))
         sweep = self.bot.loop.create_task(self.sweep_trash(user, ctx))
         self.in_progress[user.id] = task
         self.sweeps[user.id] = sweep
@@ -566,16 +1024,130 @@ class Bugs(BaseCog):
             Logging.info(f"Cancelling in-progress report for {get_member_log_name(user)}")
             raise e
 
+    def build_report_embed(self, user, ctx, form: BugReportForm):
+        report = Embed(timestamp=datetime.utcfromtimestamp(time.time()))
+        avatar = user.avatar.replace(size=32).url if user.avatar else None
+        report.set_author(name=f"{user} ({user.id})", icon_url=avatar)
+        fields = [
+            {'name': "bugs/platform", 'value': f"{form.platform} {form.platform_version}", 'inline': True},
+            {'name': "bugs/app_version", 'value': form.app_version, 'inline': True},
+            {'name': "bugs/app_build", 'value': form.app_build, 'inline': True},
+            {'name': "bugs/device_info", 'value': form.deviceinfo, 'inline': False},
+            {'name': "bugs/title", 'value': form.title, 'inline': False},
+            {'name': "bugs/description", 'value': form.actual, 'inline': False},
+            {'name': "bugs/steps_to_reproduce", 'value': form.steps, 'inline': False},
+            {'name': "bugs/expected", 'value': form.expected, 'inline': True},
+            {'name': "bugs/additional_info", 'value': form.additional_text, 'inline': False},
+        ]
+
+        for item in fields:
+            if not item['value']:
+                # unanswered or skipped question
+                continue
+            try:
+                report.add_field(
+                    name=Lang.get_locale_string(item['name'], ctx),
+                    value=item['value'],
+                    inline=item['inline'])
+            except KeyError:
+                # Expected when a field title is not defined in Lang.yaml
+                pass
+        return report
+
+    async def submit_report(self, user, channel, ctx, form: BugReportForm, report):
+        # save report and attachments in the database in one transaction
+        stage_start = time.monotonic()
+        async with in_transaction() as connection:
+            br = await BugReport.create(reporter=user.id, platform=form.platform, deviceinfo=form.deviceinfo,
+                                        platform_version=form.platform_version, branch=form.branch,
+                                        app_version=form.app_version, app_build=form.app_build, title=form.title,
+                                        steps=form.steps, expected=form.expected, actual=form.actual,
+                                        additional=form.additional_text, reported_at=int(utcnow().timestamp()),
+                                        using_db=connection)
+            if form.attachment_links:
+                await Attachments.bulk_create([Attachments(report=br, url=url) for url in form.attachment_links],
+                                              using_db=connection)
+        stage_start = self.observe_stage("persist", stage_start)
+
+        # send report
+        report_channels = []
+        for channel_id in self.routes.get((form.platform, form.branch), []):
+            report_channel = self.bot.get_channel(channel_id)
+            if report_channel is None:
+                await Logging.bot_log(f"can't send bug report #{br.id} to nonexistent channel {channel_id}")
+                continue
+            report_channels.append(report_channel)
+        stage_start = self.observe_stage("route", stage_start)
+
+        header = Lang.get_locale_string("bugs/report_header", ctx, id=br.id, user=user.mention)
+        try:
+            signature = await asyncio.to_thread(DuplicateIndex.get_signature, DuplicateIndex.get_report_text(form))
+            if signature is not None:
+                DuplicateIndex.index(br.id, signature)
+                await asyncio.to_thread(DuplicateIndex.save, [(br.id, signature)])
+            duplicates = DuplicateIndex.query(signature, exclude=br.id)
+            if duplicates:
+                header += "\n" + Lang.get_locale_string("bugs/possible_duplicates", ctx,
+                                                        ids=", ".join(f"#{i}" for i, score in duplicates))
+        except Exception as e:
+            # the report goes out either way
+            await Utils.handle_exception(f"duplicate index failure for bug report #{br.id}", self.bot, e)
+        stage_start = self.observe_stage("index", stage_start)
+
+        async def post(report_channel):
+            # each post is retried with backoff, and discord.py queues sends per rate limit bucket
+            message = await Retry.call("send", report_channel.send, content=header, embed=report,
+                                      scope=report_channel.id)
+            attachment = None
+            if len(form.attachment_links) != 0:
+                key = "attachment_info" if len(form.attachment_links) == 1 else "attachment_info_plural"
+                attachment = await Retry.call(
+                    "send", report_channel.send,
+                    Lang.get_locale_string(f"bugs/{key}", ctx, id=br.id, links="\n".join(form.attachment_links)),
+                    scope=report_channel.id)
+            return message, attachment
+
+        results = await asyncio.gather(*[post(report_channel) for report_channel in report_channels],
+                                       return_exceptions=True)
+        stage_start = self.observe_stage("post", stage_start)
+
+        all_reported_channels = list()
+        for report_channel, result in zip(report_channels, results):
+            if isinstance(result, Exception):
+                await self.bot.guild_log(report_channel.guild.id,
+                                         f"Failed to post bug report #{br.id} in {report_channel.mention}")
+                await Utils.handle_exception(f"bug report #{br.id} post failure", self.bot, result)
+                continue
+            message, attachment = result
+            if report_channel.guild.id == Configuration.get_var('guild_id') and br.message_id is None:
+                # Only save report and attachment IDs for posts in the official server
+                br.message_id = message.id
+                if attachment is not None:
+                    br.attachment_message_id = attachment.id
+                await br.save(update_fields=['message_id', 'attachment_message_id'])
+            all_reported_channels.append(report_channel)
+
+        channels_mentions = []
+        channels_ids = set()
+        if not all_reported_channels:
+            await Logging.bot_log(f"no report channels for bug report #{br.id}")
+
+        for report_channel in all_reported_channels:
+            channels_mentions.append(report_channel.mention)
+            channels_ids.add(report_channel.id)
+        await channel.send(
+            Lang.get_locale_string("bugs/report_confirmation", ctx, channel_info=', '.join(channels_mentions)))
+        await self.send_bug_info(*channels_ids)
+        self.observe_stage("confirm", stage_start)
+
     async def actual_bug_reporter(self, user, trigger_channel):
         # wrap everything so users can't get stuck in limbo
         m = self.bot.metrics
         active_question = None
         restarting = False
         try:
+            ctx = Lang.locale_context(trigger_channel, user)
             channel = await user.create_dm()
-            last_message = [message async for message in trigger_channel.history(limit=1)]
-            last_message = last_message[0]
-            ctx = await self.bot.get_context(last_message)
 
             # vars to store everything
             asking = True
@@ -621,90 +1193,18 @@ class Bugs(BaseCog):
                 nonlocal attachments
                 attachments = True
 
-            def verify_version(v):
-                if "latest" in v:
-                    return Lang.get_locale_string("bugs/latest_not_allowed", ctx)
-                # TODO: double check if we actually want to enforce this
-                if len(Utils.NUMBER_MATCHER.findall(v)) == 0:
-                    return Lang.get_locale_string("bugs/no_numbers", ctx)
-                if len(v) > BugReportFieldLength.generic_version:
-                    return Lang.get_locale_string("bugs/love_letter", ctx)
-                return True
-
-            def max_length(length):
-                def real_check(text):
-                    if len(text) > length:
-                        return Lang.get_locale_string("bugs/text_too_long", ctx, max=length)
-                    return True
-
-                return real_check
+            def check_version(v):
+                return verify_version(ctx, v)
 
             async def send_report():
-                # save report in the database
-                br = await BugReport.create(reporter=user.id, platform=platform, deviceinfo=deviceinfo,
-                                            platform_version=platform_version, branch=branch, app_version=app_version,
-                                            app_build=app_build, title=title, steps=steps, expected=expected,
-                                            actual=actual, additional=additional_text,
-                                            reported_at=int(utcnow().timestamp()))
-                for url in attachment_links:
-                    await Attachments.create(report=br, url=url)
-
-                # send report
-                channel_name = f"{platform}_{branch}".lower()
-
-                report_id_saved = False
-                attachment_id_saved = False
-                user_reported_channels = list()
-                all_reported_channels = list()
-                selected_platform = await BugReportingPlatform.get(platform=platform, branch=branch)
-
-                for row in await BugReportingChannel.filter(platform=selected_platform):
-                    report_channel = self.bot.get_channel(row.channelid)
-                    message = await report_channel.send(
-                        content=Lang.get_locale_string("bugs/report_header", ctx, id=br.id, user=user.mention),
-                        embed=report)
-                    attachment = None
-                    if len(attachment_links) != 0:
-                        key = "attachment_info" if len(attachment_links) == 1 else "attachment_info_plural"
-                        attachment = await report_channel.send(
-                            Lang.get_locale_string(f"bugs/{key}", ctx, id=br.id, links="\n".join(attachment_links)))
-
-                    if report_channel.guild.id == Configuration.get_var('guild_id'):
-                        # Only save report and attachment IDs for posts in the official server
-                        if not report_id_saved and not attachment_id_saved:
-                            if attachment is not None:
-                                br.attachment_message_id = attachment.id
-                                attachment_id_saved = True
-                            br.message_id = message.id
-                            report_id_saved = True
-                            await br.save()
-                            user_reported_channels.append(report_channel.mention)
-                    else:
-                        # guild is not the official server. if author is member, include user_reported_channels
-                        this_guild = self.bot.get_guild(report_channel.guild.id)
-                        if this_guild.get_member(user.id) is not None:
-                            user_reported_channels.append(report_channel.mention)
-
-                    all_reported_channels.append(report_channel)
-
-                channels_mentions = []
-                channels_ids = set()
-                if not all_reported_channels:
-                    await Logging.bot_log(f"no report channels for bug report #{br.id}")
-
-                for report_channel in all_reported_channels:
-                    channels_mentions.append(report_channel.mention)
-                    channels_ids.add(report_channel.id)
-                await channel.send(
-                    Lang.get_locale_string("bugs/report_confirmation", ctx, channel_info=', '.join(channels_mentions)))
-                await self.send_bug_info(*channels_ids)
+                await self.submit_report(user, channel, ctx, form, report)
 
             async def restart():
                 nonlocal restarting
                 restarting = True
                 m.reports_restarted.inc()
                 await self.delete_progress(user.id)
-                self.enqueue_bug_report(user, trigger_channel)
+                await self.enqueue_bug_report(user, trigger_channel)
 
             # start global report timer and question timer
             report_start_time = question_start_time = time.time()
@@ -762,7 +1262,7 @@ class Bugs(BaseCog):
                         Lang.get_locale_string("bugs/question_platform_version",
                                                ctx,
                                                platform=platform),
-                        validator=verify_version, locale=ctx)
+                        validator=check_version, locale=ctx)
                     update_metrics()
                 except KeyError:
                     # Expected when a question is not defined
@@ -777,7 +1277,7 @@ class Bugs(BaseCog):
                                                ctx, platform=platform,
                                                device_info_help=device_info_platform,
                                                max=BugReportFieldLength.deviceinfo),
-                        validator=max_length(BugReportFieldLength.deviceinfo), locale=ctx)
+                        validator=max_length(ctx, BugReportFieldLength.deviceinfo), locale=ctx)
                     update_metrics()
                 except KeyError:
                     # Expected when a question is not defined
@@ -814,7 +1314,7 @@ class Bugs(BaseCog):
                         Lang.get_locale_string(
                             "bugs/question_app_version", ctx,
                             version_help=Lang.get_locale_string(f"bugs/version_{platform.lower()}", ctx)),
-                        validator=verify_version, locale=ctx)
+                        validator=check_version, locale=ctx)
                     update_metrics()
                 except KeyError:
                     # Expected when a question is not defined
@@ -825,7 +1325,7 @@ class Bugs(BaseCog):
                     app_build = await Questions.ask_text(
                         self.bot, channel, user,
                         Lang.get_locale_string("bugs/question_app_build", ctx),
-                        validator=verify_version, locale=ctx)
+                        validator=check_version, locale=ctx)
                     update_metrics()
                 except KeyError:
                     # Expected when a question is not defined
@@ -836,7 +1336,7 @@ class Bugs(BaseCog):
                     title = await Questions.ask_text(
                         self.bot, channel, user,
                         Lang.get_locale_string("bugs/question_title", ctx, max=BugReportFieldLength.title),
-                        validator=max_length(BugReportFieldLength.title), locale=ctx)
+                        validator=max_length(ctx, BugReportFieldLength.title), locale=ctx)
                     update_metrics()
                 except KeyError:
                     # Expected when a question is not defined
@@ -847,7 +1347,7 @@ class Bugs(BaseCog):
                     actual = await Questions.ask_text(
                         self.bot, channel, user,
                         Lang.get_locale_string("bugs/question_actual", ctx, max=BugReportFieldLength.actual),
-                        validator=max_length(BugReportFieldLength.actual), locale=ctx)
+                        validator=max_length(ctx, BugReportFieldLength.actual), locale=ctx)
                     update_metrics()
                 except KeyError:
                     # Expected when a question is not defined
@@ -861,7 +1361,7 @@ class Bugs(BaseCog):
                         user,
                         Lang.get_locale_string("bugs/question_steps",
                                                ctx, max=BugReportFieldLength.steps),
-                        validator=max_length(BugReportFieldLength.steps),
+                        validator=max_length(ctx, BugReportFieldLength.steps),
                         locale=ctx)
                     update_metrics()
                 except KeyError:
@@ -873,7 +1373,7 @@ class Bugs(BaseCog):
                     expected = await Questions.ask_text(
                         self.bot, channel, user,
                         Lang.get_locale_string("bugs/question_expected", ctx, max=BugReportFieldLength.expected),
-                        validator=max_length(BugReportFieldLength.expected), locale=ctx)
+                        validator=max_length(ctx, BugReportFieldLength.expected), locale=ctx)
                     update_metrics()
                 except KeyError:
                     # Expected when a question is not defined
@@ -929,38 +1429,16 @@ class Bugs(BaseCog):
                     additional_text = await Questions.ask_text(
                         self.bot, channel, user,
                         Lang.get_locale_string("bugs/question_additional_info", ctx),
-                        validator=max_length(BugReportFieldLength.additional), locale=ctx)
+                        validator=max_length(ctx, BugReportFieldLength.additional), locale=ctx)
                 # update metrics outside condition to keep count up-to-date and reflect skipped question as zero time
                 update_metrics()
 
                 # assemble the report and show to user for review
-                report = Embed(timestamp=datetime.utcfromtimestamp(time.time()))
-                avatar = user.avatar.replace(size=32).url if user.avatar else None
-                report.set_author(name=f"{user} ({user.id})", icon_url=avatar)
-                fields = [
-                    {'name': "bugs/platform", 'value': f"{platform} {platform_version}", 'inline': True},
-                    {'name': "bugs/app_version", 'value': app_version, 'inline': True},
-                    {'name': "bugs/app_build", 'value': app_build, 'inline': True},
-                    {'name': "bugs/device_info", 'value': deviceinfo, 'inline': False},
-                    {'name': "bugs/title", 'value': title, 'inline': False},
-                    {'name': "bugs/description", 'value': actual, 'inline': False},
-                    {'name': "bugs/steps_to_reproduce", 'value': steps, 'inline': False},
-                    {'name': "bugs/expected", 'value': expected, 'inline': True},
-                ]
-
-                for item in fields:
-                    try:
-                        report.add_field(
-                            name=Lang.get_locale_string(item['name'], ctx),
-                            value=item['value'],
-                            inline=item['inline'])
-                    except KeyError:
-                        # Expected when a field title is not defined in Lang.yaml
-                        pass
-
-                if additional:
-                    report.add_field(
-                        name=Lang.get_locale_string("bugs/additional_info", ctx), value=additional_text, inline=False)
+                form = BugReportForm(platform=platform, branch=branch, platform_version=platform_version,
+                                     app_version=app_version, app_build=app_build, deviceinfo=deviceinfo,
+                                     title=title, actual=actual, steps=steps, expected=expected,
+                                     additional_text=additional_text, attachment_links=list(attachment_links))
+                report = self.build_report_embed(user, ctx, form)
 
                 await channel.send(
                     content=Lang.get_locale_string("bugs/report_header", ctx, id="##", user=user.mention), embed=report)
@@ -1011,6 +1489,57 @@ class Bugs(BaseCog):
         finally:
             await self.delete_progress(user.id)
 
+    async def actual_bug_form(self, user, trigger_channel):
+        # same guarantees as actual_bug_reporter, but the questions are answered with a select and modals
+        m = self.bot.metrics
+        channel = None
+        ctx = None
+        try:
+            ctx = Lang.locale_context(trigger_channel, user)
+            channel = await user.create_dm()
+
+            report_start_time = time.time()
+            m.reports_started.inc()
+
+            view = BugFormView(self, user, channel, ctx, await BugReportingPlatform.all(),
+                               Configuration.get_var("bug_form_timeout_seconds", 900))
+            message = await channel.send(Lang.get_locale_string("bugs/form_intro", ctx),
+                                         embed=view.get_preview(), view=view)
+            if await view.wait():
+                try:
+                    await message.edit(view=None)
+                except Exception as e:
+                    pass
+                raise asyncio.TimeoutError()
+
+            if not view.submitted:
+                await user.send(Lang.get_locale_string("bugs/abort_report", ctx))
+                m.reports_abort_count.inc()
+                return
+
+            # escaped once, as the DM dialog saves its answers
+            await self.submit_report(user, channel, ctx, view.get_escaped_form(), view.get_preview())
+            m.reports_duration.set(time.time() - report_start_time)
+        except Forbidden as ex:
+            m.bot_cannot_dm_member.inc()
+            await trigger_channel.send(
+                Lang.get_locale_string("bugs/dm_unable", ctx, user=user.mention),
+                delete_after=30)
+        except asyncio.TimeoutError as ex:
+            m.report_incomplete_count.inc()
+            await channel.send(Lang.get_locale_string("bugs/report_timeout", ctx))
+        except CancelledError as ex:
+            Logging.info(f"Cancel bug report form. user {get_member_log_name(user)}")
+            if channel is not None:
+                await channel.send(f"The bot ran into unexpected trouble and your report got broken. Please try again.")
+            m.report_incomplete_count.inc()
+            raise ex
+        except Exception as ex:
+            await Utils.handle_exception("bug reporting", self.bot, ex)
+            raise ex
+        finally:
+            await self.delete_progress(user.id)
+
     @commands.Cog.listener()
     async def on_raw_reaction_add(self, event):
         if event.message_id in self.bug_messages and event.user_id != self.bot.user.id:
@@ -1032,7 +1561,7 @@ class Bugs(BaseCog):
                     )
                 except Exception as e:
                     await Utils.handle_exception("bug invocation failure", self.bot, e)
-            self.enqueue_bug_report(user, channel)
+            await self.enqueue_bug_report(user, channel)
 
 
 async def setup(bot):
@@ -7,6 +7,7 @@ from utils.Database import CustomCommand
 
 
 class CustCommands(BaseCog):
+    reload_state = ("commands",)
 
     def __init__(self, bot):
         super().__init__(bot)
@@ -17,6 +17,8 @@ from utils.Database import DropboxChannel
 
 
 class DropBox(BaseCog):
+    state_containers = ("drop_messages", "delivery_in_progress", "delete_in_progress")
+    reload_state = ("dropboxes", "responses", "drop_messages", "delivery_in_progress", "delete_in_progress")
 
     def __init__(self, bot):
         super().__init__(bot)
@@ -120,7 +122,7 @@ class DropBox(BaseCog):
         embed.set_author(name=f"{source_message.author} ({source_message.author.id})",
                          icon_url=avatar)
         embed.add_field(name="Author link", value=source_message.author.mention)
-        ctx = await self.bot.get_context(source_message)
+        ctx = Lang.locale_context(source_message.channel, source_message.author)
 
         pages = Utils.paginate(source_message.content)
         page_count = len(pages)
@@ -7,24 +7,29 @@ from pytz import UnknownTimeZoneError
 
 from cogs.BaseCog import BaseCog
 from utils import Utils, Lang
+from utils.TTLMap import TTLMap
 
 
 class Eden(BaseCog):
+    state_containers = ("cool_down", "responses", "cooldown_responses")
+    reload_state = ("cool_down", "responses", "cooldown_responses")
 
     def __init__(self, bot):
         super().__init__(bot)
-        self.cool_down = dict()
-        self.responses = dict()
-        self.cooldown_responses = dict()
+        # user id -> time of their last reset command. the longest cooldown is 10 minutes
+        self.cool_down = TTLMap("Eden.cool_down", ttl=600, max_size=10000)
+        # channel id -> last response. only checked against the 10 most recent messages, so old ones can go
+        self.responses = TTLMap("Eden.responses", ttl=86400, max_size=5000)
+        self.cooldown_responses = TTLMap("Eden.cooldown_responses", ttl=86400, max_size=5000)
 
     def check_cool_down(self, user, is_dm):
-        if user.id in self.cool_down:
+        start_time = self.cool_down.get(user.id)
+        if start_time is not None:
             min_time = 10 if is_dm else 600
-            start_time = self.cool_down[user.id]
             elapsed = datetime.now().timestamp() - start_time
             remaining = max(0, min_time - elapsed)
             if remaining <= 0:
-                del self.cool_down[user.id]
+                self.cool_down.pop(user.id, None)
                 return 0
             else:
                 return remaining
@@ -11,6 +11,7 @@ from utils.Database import Guild
 
 
 class GuildConfig(BaseCog):
+    needs_member_list = True
     power_task = dict()
 
     def __init__(self, bot):
@@ -369,6 +370,8 @@ class GuildConfig(BaseCog):
         protected_members = set()
         protected_roles_descriptions = []
         protected_channels_descriptions = []
+        # role and channel member lists are only complete with every member cached
+        all_members = await self.get_members(ctx.guild)
 
         for this_role in protected_roles:
             protected_roles_descriptions.append(f"`{this_role.name} ({this_role.id})`")
@@ -381,7 +384,7 @@ class GuildConfig(BaseCog):
                 protected_members.add(member)
 
         # protect bots, mods, and higher
-        for member in ctx.guild.members:
+        for member in all_members:
             if (member.bot
                     or member.guild_permissions.ban_members
                     or member.guild_permissions.manage_channels
@@ -464,7 +467,7 @@ class GuildConfig(BaseCog):
 
     async def do_power_kick(self, ctx, protected_members):
         the_saved = []
-        for member in ctx.guild.members:
+        for member in await self.get_members(ctx.guild):
             if member not in protected_members and \
                     not member.bot and \
                     not member.guild_permissions.ban_members and \
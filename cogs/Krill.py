@@ -13,10 +13,13 @@ from discord.ext.commands import command, UserConverter, BucketType
 from cogs.BaseCog import BaseCog
 from utils import Configuration, Utils, Lang, Emoji, Logging, Questions
 from utils.Database import KrillChannel, KrillConfig, OreoMap, OreoLetters, Guild, KrillByLines
+from utils.TTLMap import TTLMap
 from utils.Utils import CHANNEL_ID_MATCHER
 
 
 class Krill(BaseCog):
+    state_containers = ("monsters", "krilled", "oreo_filter")
+    reload_state = ("configs", "krilled", "channels", "monsters", "ignored", "oreo_filter", "oreo_map", "loaded")
     byline_types = [
         'normal',
         'return_home',
@@ -28,7 +31,9 @@ class Krill(BaseCog):
         self.configs = dict()
         self.krilled = dict()
         self.channels = dict()
-        self.monsters = dict()
+        # member id -> when they turned into a monster. penalties are checked against the guild's monster_duration,
+        # which can't be longer than the column allows
+        self.monsters = TTLMap("Krill.monsters", ttl=32767, max_size=10000)
         self.ignored = set()
         self.loaded = False
         self.oreo_filter = dict()
@@ -281,7 +286,7 @@ class Krill(BaseCog):
     @commands.bot_has_permissions(embed_links=True)
     async def reset_cooldown(self, ctx: commands.Context):
         """Clear the oreo cooldown list."""
-        self.monsters = dict()
+        self.monsters.clear()
         await ctx.send(Lang.get_locale_string("krill/oreo_cooldown_reset", ctx))
 
     @oreo.command(aliases=["list", "monsters"])
@@ -819,11 +824,12 @@ class Krill(BaseCog):
 
         await ctx.typing()
 
-        if ctx.message.author.id in self.monsters.keys():
+        monster_since = self.monsters.get(ctx.author.id)
+        if monster_since is not None:
             now = datetime.now().timestamp()
             penalty = guild_krill_config.monster_duration
-            if self.monsters[ctx.author.id] + penalty > now:
-                remain = (self.monsters[ctx.author.id] + penalty) - now
+            if monster_since + penalty > now:
+                remain = (monster_since + penalty) - now
                 await ctx.send(Lang.get_locale_string("krill/oreo_cooldown_message",
                                                       ctx,
                                                       name=ctx.author.mention,
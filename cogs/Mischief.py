@@ -1,6 +1,8 @@
 import asyncio
 import re
+from collections import deque
 from datetime import datetime
+from functools import partial
 from random import random, choice
 
 import discord
@@ -13,9 +15,13 @@ import utils.Utils
 from cogs.BaseCog import BaseCog
 from utils import Utils, Configuration, Logging
 from utils.Database import MischiefRole
+from utils.TTLMap import TTLMap
 
 
 class Mischief(BaseCog):
+    state_containers = ("name_cooldown",)
+    reload_state = ("name_cooldown", "name_resets", "mischief_map", "role_counts")
+    needs_member_list = True
     me_again = "me again"
     mischief_names = [
       "Cackling {name}",
@@ -82,7 +88,10 @@ class Mischief(BaseCog):
         self.cooldown_time = 600.0
         self.name_mischief_chance = 0.0
         self.name_cooldown_time = 60.0
+        # str(guild id) -> TTLMap of str(member id) -> mischief name, while the name lasts
         self.name_cooldown = dict()
+        # (guild id, str(member id), mischief name) of names that ran out, for name_task to undo
+        self.name_resets = deque()
         self.mischief_map = dict()
         self.role_counts = dict()
 
@@ -104,8 +113,26 @@ class Mischief(BaseCog):
         self.role_count_task.cancel()
         self.name_task.cancel()
 
+    async def import_state(self, state):
+        await super().import_state(state)
+        # expiry callbacks still point at the unloaded cog
+        for str_gid, names in self.name_cooldown.items():
+            names.on_expire = partial(self.queue_name_reset, int(str_gid))
+
     async def init_guild(self, guild):
-        self.name_cooldown[str(guild.id)] = Configuration.get_persistent_var(f"name_cooldown_{guild.id}", dict())
+        persist_key = f"name_cooldown_{guild.id}"
+        saved_names = Configuration.get_persistent_var(persist_key, dict())
+        converted = None
+        if any(isinstance(name_obj, dict) for name_obj in saved_names.values()):
+            # saved before names expired on their own. convert to expiry times
+            converted = {str_uid: [name_obj, name_obj['timestamp'] + self.name_cooldown_time]
+                         for str_uid, name_obj in saved_names.items()}
+        self.name_cooldown[str(guild.id)] = TTLMap("Mischief.name_cooldown",
+                                                   ttl=self.name_cooldown_time,
+                                                   max_size=10000,
+                                                   on_expire=partial(self.queue_name_reset, guild.id),
+                                                   persist_key=persist_key,
+                                                   initial=converted)
         guild_row = await self.bot.get_guild_db_config(guild.id)
         self.mischief_map[guild.id] = dict()
         self.role_counts[guild.id] = dict()
@@ -118,44 +145,46 @@ class Mischief(BaseCog):
 
     @commands.Cog.listener()
     async def on_guild_remove(self, guild):
+        self.name_cooldown.pop(str(guild.id), None)
         Configuration.del_persistent_var(f"name_cooldown_{guild.id}", True)
 
+    def queue_name_reset(self, guild_id, str_uid, mischief_name_obj):
+        self.name_resets.append((guild_id, str_uid, mischief_name_obj))
+
     @tasks.loop(seconds=1)
     async def name_task(self):
         # periodic task to run while cog is loaded
-        now = datetime.now().timestamp()
         try:
-            for guild in self.bot.guilds:
-                updated_name_cooldown = {}
+            for names in self.name_cooldown.values():
+                # expired names are queued in name_resets
+                names.expire()
+
+            while self.name_resets:
+                guild_id, str_uid, mischief_name_obj = self.name_resets.popleft()
+                guild = self.bot.get_guild(guild_id)
+                if guild is None:
+                    continue
                 haunted_role = discord.utils.get(guild.roles, name="haunted")
                 if haunted_role is None:
                     # server must have a haunted role or this is ignored
                     continue
 
-                for str_uid, mischief_name_obj in dict(self.name_cooldown[str(guild.id)]).items():
-                    if (now - mischief_name_obj['timestamp']) < self.name_cooldown_time:
-                        updated_name_cooldown[str_uid] = mischief_name_obj
+                # reset name to normal
+                my_member = guild.get_member(int(str_uid))
+
+                if not my_member:
+                    continue
+
+                if haunted_role in my_member.roles:
+                    await my_member.remove_roles(haunted_role)
+
+                if mischief_name_obj['mischief_name'] == my_member.display_name:
+                    # mischief name is still in use when mischief expires
+                    # restore display name if member hasn't changed name
+                    if mischief_name_obj['name_is_nick']:
+                        edited_member = await my_member.edit(nick=mischief_name_obj['name_normal'])
                     else:
-                        # reset name to normal
-                        my_member = guild.get_member(int(str_uid))
-
-                        if not my_member:
-                            continue
-
-                        if haunted_role in my_member.roles:
-                            await my_member.remove_roles(haunted_role)
-
-                        if mischief_name_obj['mischief_name'] == my_member.display_name:
-                            # mischief name is still in use when mischief expires
-                            # restore display name if member hasn't changed name
-                            if mischief_name_obj['name_is_nick']:
-                                edited_member = await my_member.edit(nick=mischief_name_obj['name_normal'])
-                            else:
-                                edited_member = await my_member.edit(nick=None)
-
-                if updated_name_cooldown != self.name_cooldown[str(guild.id)]:
-                    self.name_cooldown[str(guild.id)] = updated_name_cooldown
-                    Configuration.set_persistent_var(f"name_cooldown_{guild.id}", updated_name_cooldown)
+                        edited_member = await my_member.edit(nick=None)
         except Exception as e:
             await utils.Utils.handle_exception("mischief name task error", self.bot, e)
 
@@ -179,6 +208,8 @@ class Mischief(BaseCog):
 
         # update role count storage (because it's slow)
         for guild in self.bot.guilds:
+            if self.mischief_map[guild.id]:
+                await self.bot.ensure_chunked(guild)
             for my_role in self.mischief_map[guild.id].values():
                 try:
                     self.role_counts[guild.id][my_role.id] = len(my_role.members)
@@ -208,6 +239,8 @@ name cooldown is {self.name_cooldown_time} seconds
     @commands.check(Utils.can_mod_official)
     async def set_cooldown(self, ctx, seconds: int):
         self.name_cooldown_time = seconds
+        for names in self.name_cooldown.values():
+            names.ttl = seconds
         Configuration.set_persistent_var("name_mischief_cooldown", seconds)
         await ctx.invoke(self.name_mischief)
 
@@ -478,12 +511,9 @@ You can also use the `!team_mischief` command right here to find out more""")
                         "name_is_nick": 1 if is_nick else 0
                     }
 
+                    # saved along with its expiry, so the name is restored after a restart too
                     self.name_cooldown[str(message.guild.id)][str(my_member.id)] = name_obj
                     edited_member = await my_member.edit(nick=mischief_name)
-                    Configuration.set_persistent_var(
-                        f"name_cooldown_{message.guild.id}",
-                        self.name_cooldown[str(message.guild.id)]
-                    )
         except Exception as e:
             Logging.info("mischief namer error")
             Logging.info(e)
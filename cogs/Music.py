@@ -1,10 +1,10 @@
 import asyncio
 import os
-import sys
 import time
-from concurrent.futures import CancelledError
+from asyncio import CancelledError
 from io import BytesIO
-from zipfile import ZipFile, ZIP_DEFLATED
+from tempfile import SpooledTemporaryFile
+from zipfile import ZipFile, ZIP_DEFLATED, ZIP_STORED
 
 import discord
 from discord import Forbidden, File
@@ -12,32 +12,81 @@ from discord.ext import commands
 from discord.ext.commands import Context
 
 from cogs.BaseCog import BaseCog
-from utils import Lang, Questions, Utils, Logging
+from utils import Lang, Questions, Utils, Logging, Configuration, SongCache, LazyImport
+from utils.RenderScheduler import RenderScheduler, RenderTimeout
 from utils.Utils import MENTION_MATCHER, ID_MATCHER, NUMBER_MATCHER
 
-try:
-    pwd = os.path.dirname(os.path.realpath(__file__))
-    music_maker_path = os.path.normpath(os.path.join(pwd, '../sky-python-music-sheet-maker'))
-    if not os.path.isdir(music_maker_path):
-        music_maker_path = os.path.normpath(os.path.join(pwd, '../../sky-python-music-sheet-maker'))
-    if music_maker_path not in sys.path:
-        sys.path.append(music_maker_path)
-    Logging.info(sys.path)
-    from src.skymusic.communicator import Communicator, QueriesExecutionAbort
-    from src.skymusic.music_sheet_maker import MusicSheetMaker
-    from src.skymusic.resources import Resources as skymusic_resources
-except ImportError as e:
-    Logging.info('*** IMPORT ERROR of one or several Music-Maker modules')
-    Logging.info(e)
+pwd = os.path.dirname(os.path.realpath(__file__))
+music_maker_path = os.path.normpath(os.path.join(pwd, '../sky-python-music-sheet-maker'))
+if not os.path.isdir(music_maker_path):
+    music_maker_path = os.path.normpath(os.path.join(pwd, '../../sky-python-music-sheet-maker'))
+# the music sheet maker is heavy, so it is only imported once somebody transcribes a song
+communicator = LazyImport.lazy("src.skymusic.communicator", music_maker_path)
+music_sheet_maker = LazyImport.lazy("src.skymusic.music_sheet_maker", music_maker_path)
+skymusic_resources = LazyImport.lazy("src.skymusic.resources", music_maker_path)
+
+
+def render_song_files(locale, input_mode, notes, song_key, octave_shift, meta, aspect_ratio, song_bpm):
+    """
+    Parse and render a song in a render worker process. Takes and returns plain data so it can cross the process
+    boundary, and rebuilds the maker and player the dialog used
+    :return: list of (file extension, list of file contents as bytes), one entry per render mode
+    """
+    player = MusicCogPlayer(cog=None, locale=locale)
+    maker = music_sheet_maker.MusicSheetMaker(locale=locale)
+    maker.set_song_parser()
+    maker.set_parser_input_mode(recipient=player, input_mode=input_mode)
+    maker.parse_song(recipient=player, notes=notes, song_key=song_key, octave_shift=octave_shift)
+    maker.set_song_metadata(recipient=player, meta=meta, song_key=song_key)
+    song_bundle = maker.render_song(player, None, aspect_ratio, song_bpm)
+
+    renders = []
+    for render_mode, buffers in song_bundle.get_all_renders().items():
+        contents = []
+        for buffer in buffers:
+            data = buffer.getvalue()
+            contents.append(data.encode("utf-8") if isinstance(data, str) else data)
+        renders.append((render_mode.extension, contents))
+    return renders
+
+
+# image formats that are compressed already. deflating them again costs time and saves nothing
+STORED_EXTENSIONS = {".png", ".jpg", ".jpeg", ".gif", ".webp"}
+
+
+def zip_song_files(song_title, extension, contents):
+    """
+    Zip rendered files, in a worker thread. Files are written straight from the render bytes, and archives past
+    `music_zip_spool_mb` spill to a temporary file instead of memory
+    :return: (file object positioned at 0, archive size in bytes). the caller closes it
+    """
+    spool_bytes = Configuration.get_var("music_zip_spool_mb", 8) * 1024 * 1024
+    stream = SpooledTemporaryFile(max_size=spool_bytes)
+    if extension.lower() in STORED_EXTENSIONS:
+        compression, level = ZIP_STORED, None
+    else:
+        # text formats (svg, html, txt) shrink a lot even at a fast level
+        compression, level = ZIP_DEFLATED, 6
+    try:
+        with ZipFile(stream, mode="w") as zip_file:
+            for i, data in enumerate(contents):
+                zip_file.writestr(f"{song_title}_{i:03d}{extension}", memoryview(data),
+                                  compress_type=compression, compresslevel=level)
+        size = stream.tell()
+        stream.seek(0)
+        return stream, size
+    except Exception:
+        stream.close()
+        raise
 
 
 class MusicCogPlayer:
 
     def __init__(self, cog, locale='en_US'):
         self.cog = cog
-        self.name = skymusic_resources.MUSIC_COG_NAME  # Must be defined before instantiating communicator
+        self.name = skymusic_resources.Resources.MUSIC_COG_NAME  # Must be defined before instantiating communicator
         self.locale = locale
-        self.communicator = Communicator(owner=self, locale=locale)
+        self.communicator = communicator.Communicator(owner=self, locale=locale)
 
     def get_name(self):
         return self.name
@@ -125,65 +174,65 @@ class MusicCogPlayer:
                         reply_valid = q.get_reply_validity()
         return True
 
-    async def send_song_to_channel(self, channel, user, song_bundle, song_title='Untitled'):
+    async def send_song_to_channel(self, channel, user, song_renders, song_title='Untitled'):
         """
-        A song bundle is an objcet returning a dictionary of song meta data and a dict of IOString or IOBytes buffers,
-        as lists indexed by their RenderMode
-
         channel:
         user:
-        song_bundle:
+        song_renders: list of (file extension, list of file contents), as returned by render_song_files
         song_title:
         """
         await channel.typing()
         message = "Here are your song files(s)"
-        song_renders = song_bundle.get_all_renders()
-
-        for render_mode, buffers in song_renders.items():
-            my_files = [File(buffer, filename=f"{song_title}_{i:03d}{render_mode.extension}")
-                        for (i, buffer) in enumerate(buffers)]
 
-            if len(my_files) < 1:
-                channel.send("whoops, no files to send...")
+        for extension, contents in song_renders:
+            if len(contents) < 1:
+                await channel.send("whoops, no files to send...")
                 continue
 
-            if len(my_files) < 4:
+            if len(contents) < 4:
                 # send images 3 or fewer images to channel
+                my_files = [File(BytesIO(data), filename=f"{song_title}_{i:03d}{extension}")
+                            for (i, data) in enumerate(contents)]
                 await channel.send(content=message, files=my_files)
                 continue
 
-            # 4+ files get zipped
+            # 4+ files get zipped, off the event loop
             try:
-                stream = BytesIO()
-                zip_file = ZipFile(stream, mode="w", compression=ZIP_DEFLATED)
-
-                with zip_file:
-                    # Add sheets to zip file
-                    for sheet in my_files:
-                        sheet.fp.seek(0)
-                        zip_file.writestr(sheet.filename, sheet.fp.getvalue())
-
-                stream.seek(0)
-                await channel.send(content="Yo, your music files got zipped",
-                                   file=discord.File(stream, f"{song_title}_sheets.zip"))
+                started_at = time.perf_counter()
+                stream, size = await asyncio.to_thread(zip_song_files, song_title, extension, contents)
+                metrics = getattr(Utils.BOT, "metrics", None)
+                if metrics:
+                    metrics.music_zip_seconds.observe(time.perf_counter() - started_at)
+                    metrics.music_zip_bytes.labels(direction="in").inc(sum(len(data) for data in contents))
+                    metrics.music_zip_bytes.labels(direction="out").inc(size)
+                with stream:
+                    await channel.send(content="Yo, your music files got zipped",
+                                       file=discord.File(stream, f"{song_title}_sheets.zip"))
             except Exception as e:
                 await Utils.handle_exception("bad zip!", self.cog.bot, e)
                 await channel.send("oops, zip file borked... contact the authorities!")
 
 
 class Music(BaseCog):
+    state_containers = ("in_progress",)
 
     def __init__(self, bot):
-        bot.music_rendering = False
         super().__init__(bot)
         self.in_progress = dict()  # {user_id: asyncio_task}
-        self.is_rendering = None
+        self.renders = RenderScheduler("music",
+                                       workers=Configuration.get_var("music_render_workers", 2),
+                                       timeout=Configuration.get_var("music_render_timeout_seconds", 120))
         m = self.bot.metrics
         m.songs_in_progress.set_function(lambda: len(self.in_progress))
         # TODO: create methods to update the bot metrics and in_progress, etc
 
+    async def cog_unload(self):
+        await self.renders.shutdown()
+
     async def delete_progress(self, user):
         uid = user.id
+        # drop a queued render, or stop waiting on a running one
+        self.renders.cancel(uid)
         if uid in self.in_progress:
             try:
                 self.in_progress[uid].cancel()
@@ -191,10 +240,38 @@ class Music(BaseCog):
                 # ignore task cancel failures
                 pass
             del self.in_progress[uid]
-            # if deleted task is recorded as active renderer, remove block
-            if self.is_rendering == uid:
-                self.is_rendering = None
-                self.bot.music_rendering = False
+
+    async def wait_for_render(self, job, channel, ctx):
+        """
+        Wait for a render job, keeping the user posted on their place in the queue
+        :return: the rendered files
+        """
+        status = None
+        last_position = None
+        while not job.future.done():
+            position = self.renders.position(job.key)
+            if position is not None and position != last_position:
+                text = Lang.get_locale_string("music/render_queued", ctx, position=position,
+                                              eta=Utils.to_pretty_time(self.renders.estimate_wait(position)))
+                if status is None:
+                    status = await channel.send(text)
+                else:
+                    await status.edit(content=text)
+            elif position is None and last_position is not None:
+                await status.edit(content=Lang.get_locale_string("music/render_started", ctx))
+            last_position = position
+
+            job.moved.clear()
+            moved = asyncio.create_task(job.moved.wait())
+            try:
+                await asyncio.wait([job.future, moved], return_when=asyncio.FIRST_COMPLETED)
+            except CancelledError:
+                # nobody is waiting for this render anymore
+                self.renders.cancel(job.key)
+                raise
+            finally:
+                moved.cancel()
+        return job.future.result()
 
     async def convert_mention(self, ctx, name):
         out_name = ''
@@ -261,7 +338,8 @@ class Music(BaseCog):
             await self.delete_progress(user)
 
         # Start a song creation
-        task = self.bot.loop.create_task(self.actual_transcribe_song(user, ctx))
+        # the song dialog outlives the command. keep only what locale lookups and replies need
+        task = self.bot.loop.create_task(self.actual_transcribe_song(user, Lang.locale_context(ctx.channel, user)))
         self.in_progress[user.id] = task
         try:
             await task
@@ -306,7 +384,7 @@ class Music(BaseCog):
                 active_question = 0
 
                 player = MusicCogPlayer(cog=self, locale=locale)
-                maker = MusicSheetMaker(locale=locale)
+                maker = music_sheet_maker.MusicSheetMaker(locale=locale)
 
                 # 1. Sets Song Parser
                 maker.set_song_parser()
@@ -401,28 +479,18 @@ class Music(BaseCog):
                 #     song_bpm = q_song_bpm.get_reply().get_result()
                 # active_question += 1
 
-                while self.bot.music_rendering:
-                    # Wait for in-progress renders to finish.
-                    await asyncio.sleep(1)
-
-                # Block concurrent renders
-                self.bot.music_rendering = True
-                self.is_rendering = user.id
-
-                # 13. Renders Song
-                song_bundle = await asyncio.get_event_loop().run_in_executor(
-                    None,
-                    maker.render_song,
-                    player,
-                    None,
-                    aspect_ratio,
-                    120)
-
-                # Unblock concurrent renders
-                self.bot.music_rendering = False
-                self.is_rendering = None
-
-                await player.send_song_to_channel(channel, user, song_bundle, title)
+                # 13. Renders Song, in a render worker process. the same song rendered before comes from the cache
+                meta = (title, artist, transcript)
+                cache_key = SongCache.get_key(locale, notes, input_mode, song_key, octave_shift, aspect_ratio, meta,
+                                               120)
+                song_renders = await asyncio.to_thread(SongCache.get, cache_key)
+                if song_renders is None:
+                    job = self.renders.submit(user.id, render_song_files, locale, input_mode, notes, song_key,
+                                              octave_shift, meta, aspect_ratio, 120)
+                    song_renders = await self.wait_for_render(job, channel, ctx)
+                    await asyncio.to_thread(SongCache.put, cache_key, song_renders)
+
+                await player.send_song_to_channel(channel, user, song_renders, title)
                 m.songs_completed.inc()
                 active_question += 1
         except Forbidden as ex:
@@ -431,6 +499,8 @@ class Music(BaseCog):
                 delete_after=30)
         except asyncio.TimeoutError as ex:
             await channel.send(Lang.get_locale_string("music/song_timeout", ctx))
+        except RenderTimeout as ex:
+            await channel.send(Lang.get_locale_string("music/render_timeout", ctx))
         except CancelledError as ex:
             raise ex
         except Exception as ex:
@@ -6,7 +6,7 @@ from discord.ext import commands
 from prometheus_client.exposition import generate_latest
 
 from cogs.BaseCog import BaseCog
-from utils import Configuration, Logging
+from utils import Configuration, Logging, MemoryStats, Utils
 from utils.Logging import TCol
 
 
@@ -26,6 +26,95 @@ class PromMonitoring(BaseCog):
             self.start_metrics.cancel()
         await self.start_metrics
 
+    async def cog_check(self, ctx):
+        return await self.bot.permission_manage_bot(ctx)
+
+    @commands.group(invoke_without_command=True)
+    async def debug(self, ctx):
+        """Runtime internals"""
+        await ctx.send_help(ctx.command)
+
+    @debug.group(invoke_without_command=True)
+    async def memory(self, ctx):
+        """
+        Sizes of cog state containers and discord.py caches, and memory use so far
+        """
+        lines = [f"max rss: {MemoryStats.format_size(MemoryStats.get_max_rss())}"]
+        if MemoryStats.is_tracing():
+            lines.append(f"traced: {MemoryStats.format_size(MemoryStats.get_traced_bytes())}")
+        lines.append("\ndiscord.py caches:")
+        lines += [f"  {cache:<34} {size:>8}" for cache, size in MemoryStats.get_cache_sizes(self.bot).items()]
+        lines.append("\nstate containers, largest first:")
+        sizes = sorted(MemoryStats.get_container_sizes(self.bot).items(), key=lambda item: item[1], reverse=True)
+        lines += [f"  {owner + '.' + container:<34} {size:>8}" for (owner, container), size in sizes]
+        await self.send_pages(ctx, lines)
+
+    @memory.command(name="start")
+    async def memory_start(self, ctx, frames: int = 1):
+        """
+        Start tracing allocations. Everything runs slower until `debug memory stop`
+
+        frames: how many stack frames to keep per allocation
+        """
+        if MemoryStats.start_tracing(max(1, min(frames, 25))):
+            await ctx.send("Tracing allocations. Take snapshots with `debug memory snapshot`")
+        else:
+            await ctx.send("Allocations are traced already")
+
+    @memory.command(name="stop")
+    async def memory_stop(self, ctx):
+        """Stop tracing allocations and drop saved snapshots"""
+        if MemoryStats.stop_tracing():
+            await ctx.send("Stopped tracing allocations")
+        else:
+            await ctx.send("Allocations were not being traced")
+
+    @memory.command(name="top")
+    async def memory_top(self, ctx, limit: int = 10):
+        """
+        Allocation sites holding the most memory since tracing started
+
+        limit: how many sites to list
+        """
+        if not MemoryStats.is_tracing():
+            await ctx.send("Start tracing first, with `debug memory start`")
+            return
+        lines = await asyncio.to_thread(MemoryStats.get_top, max(1, min(limit, 50)))
+        await self.send_pages(ctx, lines)
+
+    @memory.command(name="snapshot")
+    async def memory_snapshot(self, ctx, name: str = "last"):
+        """
+        Save a snapshot of traced allocations, to diff against later
+
+        name: what to call the snapshot
+        """
+        if not MemoryStats.is_tracing():
+            await ctx.send("Start tracing first, with `debug memory start`")
+            return
+        await asyncio.to_thread(MemoryStats.save_snapshot, name)
+        await ctx.send(f"Saved snapshot `{name}`. Compare with `debug memory diff {name}`")
+
+    @memory.command(name="diff")
+    async def memory_diff(self, ctx, name: str = "last", limit: int = 10):
+        """
+        Allocation sites that grew the most since a saved snapshot
+
+        name: the snapshot to compare with
+        limit: how many sites to list
+        """
+        if name not in MemoryStats.SNAPSHOTS:
+            saved = ", ".join(MemoryStats.SNAPSHOTS) or "none"
+            await ctx.send(f"No snapshot called `{name}`. Saved snapshots: {saved}")
+            return
+        lines = await asyncio.to_thread(MemoryStats.get_diff, name, max(1, min(limit, 50)))
+        await self.send_pages(ctx, lines)
+
+    @staticmethod
+    async def send_pages(ctx, lines):
+        for page in Utils.paginate("\n".join(lines) or "nothing to show", prefix="```\n", suffix="\n```"):
+            await ctx.send(page)
+
     @commands.Cog.listener()
     async def on_command_completion(self, ctx):
         guild_id = ctx.guild.id if ctx.guild is not None else 0
@@ -58,6 +147,8 @@ class PromMonitoring(BaseCog):
         self.metric_server = site
 
     async def serve_metrics(self, request):
+        # container sizes are counted on scrape rather than tracked on every change
+        MemoryStats.update_metrics(self.bot)
         metrics_to_server = generate_latest(self.bot.metrics_reg).decode("utf-8")
         return web.Response(text=metrics_to_server, content_type="text/plain")
 
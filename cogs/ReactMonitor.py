@@ -14,6 +14,9 @@ from utils import Utils, Configuration, Lang, Logging
 
 
 class ReactMonitor(BaseCog):
+    state_containers = ("recent_reactions", "react_adds", "react_removers", "mutes")
+    reload_state = ("react_watch_servers", "min_react_lifespan", "recent_reactions", "react_removers", "mute_duration",
+                    "react_adds", "guilds", "emoji", "mutes", "started")
 
     def __init__(self, bot):
         super().__init__(bot)
@@ -1,5 +1,6 @@
 import importlib
 import os
+import time
 
 from discord.ext import commands
 
@@ -37,7 +38,8 @@ class Reload(BaseCog):
         """
         Reload a cog
 
-        Be sure that cog has no unsaved data, in-progress uses, etc. or is just so borked that it needs to be kicked
+        Cogs that list their state in reload_state keep it. For others, be sure that cog has no unsaved data,
+        in-progress uses, etc. or is just so borked that it needs to be kicked
         cog: The name of the cog to reload
         """
         cogs = []
@@ -45,9 +47,8 @@ class Reload(BaseCog):
             cogs.append(c.replace('Cog', ''))
 
         if cog in cogs:
-            await self.bot.unload_extension(f"cogs.{cog}")
-            await self.bot.load_extension(f"cogs.{cog}")
-            await ctx.send(f'**{cog}** has been reloaded.')
+            seconds, kept = await Reloader.reload_cog(self.bot, cog)
+            await ctx.send(f'**{cog}** has been reloaded in {seconds * 1000:.0f}ms{" (state kept)" if kept else ""}.')
             await Logging.bot_log(f'**{cog}** has been reloaded by {ctx.author.name}.')
         else:
             await ctx.send(f"{Emoji.get_chat_emoji('NO')} I can't find that cog.")
@@ -108,22 +109,29 @@ class Reload(BaseCog):
     async def hotreload(self, ctx):
         """
         Reload all cogs
+
+        Cogs that list their state in reload_state keep it, others load it again like at startup
         """
         message = await ctx.send("Hot reloading...")
+        started_at = time.perf_counter()
         importlib.reload(Reloader)
-        for c in Reloader.components:
-            importlib.reload(c)
+        Reloader.reload_components()
         Emoji.initialize(self.bot)
         Logging.info("Reloading all cogs...")
-        temp = []
-        for cog in self.bot.cogs:
-            temp.append(cog)
-        for cog in temp:
-            await self.bot.unload_extension(f"cogs.{cog}")
-            Logging.info(f'{cog} has been unloaded.')
-            await self.bot.load_extension(f"cogs.{cog}")
-            Logging.info(f'{cog} has been loaded.')
-        await message.edit(content="Hot reload complete")
+        # this cog last, the command is still running in it
+        names = [cog for cog in self.bot.cogs if cog != self.qualified_name]
+        results = await Reloader.reload_cogs(self.bot, names)
+        results[self.qualified_name] = await Reloader.reload_cog(self.bot, self.qualified_name)
+
+        lines = []
+        failed = [name for name, result in results.items() if isinstance(result, BaseException)]
+        for name in failed:
+            await Utils.handle_exception(f"hot reload of {name} failed", self.bot, results.pop(name))
+            lines.append(f"{Emoji.get_chat_emoji('NO')} {name} failed")
+        for name, (seconds, kept) in sorted(results.items(), key=lambda item: item[1][0], reverse=True):
+            lines.append(f"{name} {seconds * 1000:.0f}ms{' (state kept)' if kept else ''}")
+        total = time.perf_counter() - started_at
+        await message.edit(content=f"Hot reload complete in {total * 1000:.0f}ms\n" + "\n".join(lines)[:1900])
 
     @commands.command()
     @commands.check(Utils.can_mod_official)
@@ -1,7 +1,8 @@
-import os
+import csv
+import gzip
+import io
 import re
-import sys
-from datetime import datetime
+from datetime import datetime, timedelta
 
 import typing
 from discord import File
@@ -11,13 +12,30 @@ from tortoise.expressions import Q
 
 from cogs.BaseCog import BaseCog
 from utils import Utils
+from utils.Converters import BugReportingField, Date
 from utils.Database import BugReport, BugReportingPlatform
-from utils.Utils import save_to_disk
 
 
 class Reporting(BaseCog):
 
-    fetch_limit = 1000
+    page_size = 200
+    # upload limit when the command is used outside a guild
+    default_size_limit = 8 * 1024 * 1024
+    fields = ["id",
+              "reported_at",
+              "reporter",
+              "platform",
+              "platform_version",
+              "branch",
+              "app_version",
+              "app_build",
+              "title",
+              "deviceinfo",
+              "steps",
+              "expected",
+              "actual",
+              "attachments",
+              "additional"]
 
     async def cog_check(self, ctx):
         return await Utils.can_mod_official(ctx)
@@ -28,47 +46,33 @@ class Reporting(BaseCog):
             ctx: commands.Context,
             start: typing.Optional[int] = -100,
             end: typing.Optional[int] = None,
-            branch: typing.Optional[str] = "",
-            platform: typing.Optional[str] = ""):
+            branch: typing.Optional[BugReportingField("branch")] = None,
+            platform: typing.Optional[BugReportingField("platform")] = None,
+            since: typing.Optional[Date] = None,
+            until: typing.Optional[Date] = None,
+            compress: bool = False):
         """Export bug reports starting from {start} to CSV file
         csv                      exports 100 most recent reports
         csv 15 20                exports reports with ids in the range 15-20
-        csv -200                 exports the last 200 reports matching other criteria (max 1000)
+        csv -200                 exports the last 200 reports matching other criteria
         csv [beta|stable]        exports reports for given branch (all platforms)
         csv {beta|stable} [android|ios|etc]
-                                 exports reports for given branch and platform"""
-        # TODO: start from date?
-        # TODO: migrate to async ORM like tortoise
+                                 exports reports for given branch and platform
+        csv -100 beta android 2023-01-01 2023-01-31
+                                 exports reports for given branch and platform reported in a date range (UTC)
+        csv ... yes              gzip the file. any of the filters before it can be left out
 
-        async def get_branch(a_branch):
-            branches = {p.branch for p in await BugReportingPlatform.all()}
-
-            for this_branch in branches:
-                if a_branch.lower() == this_branch.lower():
-                    return this_branch
-
-            return branches
-
-        async def get_platform(a_platform):
-            platforms = [p.platform for p in await BugReportingPlatform.all()]
-
-            for this_platform in platforms:
-                if a_platform.lower() == this_platform.lower():
-                    return this_platform
-
-            return platforms
+        Exports stop early if the file would be too big to upload here"""
 
         # dashes at the start of text are interpreted as formulas by excel. replace with *
         def filter_hyphens(text):
             return re.sub(r'^\s*[-=+]\s*', '* ', text, flags=re.MULTILINE)
 
-        pl = await get_platform(platform)
-        br = await get_branch(branch)
-
-        if start < -self.fetch_limit:
-            await ctx.send(f"you requested more than {self.fetch_limit} records, "
-                           f"so I'm only giving you {self.fetch_limit} because I'm a lazy bot")
-            start = -self.fetch_limit
+        platform_rows = await BugReportingPlatform.all()
+        pl = [platform] if platform else list({p.platform for p in platform_rows})
+        br = [branch] if branch else list({p.branch for p in platform_rows})
+        # until is inclusive. reports from that whole day count
+        until_date = until + timedelta(days=1) if until else None
 
         try:
             # send feedback on command. Failure to send should end attempt.
@@ -78,73 +82,93 @@ class Reporting(BaseCog):
                 f"end id: {end}\n"
                 f"branch: {br}\n"
                 f"platform: {pl}\n"
+                f"reported: {since.date() if since else 'any time'} to {until.date() if until else 'now'}\n"
             )
         except Exception as e:
             await Utils.handle_exception("failed to send reporting CSV startup message", self.bot, e)
             return
 
-        end_id = sys.maxsize if end is None else end
-        conditions = (Q(branch__in=br) &
-                      Q(platform__in=pl) &
-                      Q(id__range=[start, end_id]))
-
-        if start < 0:
-            # count backward from end of data. no more than global limit
-            limit = min(abs(start), self.fetch_limit)
-            query = await BugReport.filter(conditions).order_by("-id").limit(limit)
-        else:
-            query = await BugReport.filter(conditions).limit(self.fetch_limit)
-
-        data_list = ()
-        fields = ["id",
-                  "reported_at",
-                  "reporter",
-                  "platform",
-                  "platform_version",
-                  "branch",
-                  "app_version",
-                  "app_build",
-                  "title",
-                  "deviceinfo",
-                  "steps",
-                  "expected",
-                  "actual",
-                  "attachments",
-                  "additional"]
-
-        for report in query:
-            reporter_formatted = report.reporter
-            reporter = self.bot.get_user(report.reporter)
-            if reporter is not None:
-                reporter_formatted = f"@{reporter.name}#{reporter.discriminator}({report.reporter})"
-            attachments = []
-            for attachment in await report.attachments:
-                attachments.append(attachment.url)
-
-            attachments = "\n".join(attachments)
-
-            data_list += ({"id": report.id,
-                           "reported_at": report.reported_at,
-                           "reporter": reporter_formatted,
-                           "platform": report.platform,
-                           "platform_version": report.platform_version,
-                           "branch": report.branch,
-                           "app_version": report.app_version,
-                           "app_build": report.app_build,
-                           "title": report.title,
-                           "deviceinfo": report.deviceinfo,
-                           "steps": filter_hyphens(report.steps),
-                           "expected": filter_hyphens(report.expected),
-                           "actual": filter_hyphens(report.actual),
-                           "attachments": attachments,
-                           "additional": filter_hyphens(report.additional)},)
-
-        await ctx.send(f"Fetched {len(data_list)} reports...")
+        conditions = Q(branch__in=br) & Q(platform__in=pl)
+        if end is not None:
+            conditions &= Q(id__lte=end)
+        if start >= 0:
+            conditions &= Q(id__gte=start)
+        if since:
+            conditions &= Q(reported_at__gte=int(since.timestamp()))
+        if until_date:
+            conditions &= Q(reported_at__lt=int(until_date.timestamp()))
+
+        # negative start counts backward from the newest matching report
+        newest_first = start < 0
+        wanted = abs(start) if newest_first else None
+        # leave some room for the multipart envelope
+        size_limit = int(getattr(ctx.guild, "filesize_limit", self.default_size_limit) * 0.95)
+
+        buffer = io.BytesIO()
+        out = gzip.GzipFile(fileobj=buffer, mode="wb") if compress else buffer
+        line = io.StringIO()
+        writer = csv.DictWriter(line, fieldnames=self.fields)
+        writer.writeheader()
+        out.write(line.getvalue().encode("utf-8"))
+
+        count = 0
+        truncated = False
+        last_id = None
+        while not truncated and (wanted is None or count < wanted):
+            # keyset pagination: continue after the last id seen instead of using offsets
+            page_conditions = conditions
+            if last_id is not None:
+                page_conditions &= Q(id__lt=last_id) if newest_first else Q(id__gt=last_id)
+            page_size = self.page_size if wanted is None else min(self.page_size, wanted - count)
+            page = await BugReport.filter(page_conditions) \
+                .order_by("-id" if newest_first else "id") \
+                .limit(page_size) \
+                .prefetch_related('attachments')
+            if not page:
+                break
+
+            for report in page:
+                reporter_formatted = report.reporter
+                reporter = self.bot.get_user(report.reporter)
+                if reporter is not None:
+                    reporter_formatted = f"@{reporter.name}#{reporter.discriminator}({report.reporter})"
+
+                line.seek(0)
+                line.truncate(0)
+                writer.writerow({"id": report.id,
+                                 "reported_at": report.reported_at,
+                                 "reporter": reporter_formatted,
+                                 "platform": report.platform,
+                                 "platform_version": report.platform_version,
+                                 "branch": report.branch,
+                                 "app_version": report.app_version,
+                                 "app_build": report.app_build,
+                                 "title": report.title,
+                                 "deviceinfo": report.deviceinfo,
+                                 "steps": filter_hyphens(report.steps),
+                                 "expected": filter_hyphens(report.expected),
+                                 "actual": filter_hyphens(report.actual),
+                                 "attachments": "\n".join(a.url for a in report.attachments),
+                                 "additional": filter_hyphens(report.additional)})
+                row = line.getvalue().encode("utf-8")
+                # compressed size is only known as gzip flushes, so it's checked against what's been written so far
+                if buffer.tell() + (0 if compress else len(row)) > size_limit:
+                    truncated = True
+                    break
+                out.write(row)
+                count += 1
+            last_id = page[-1].id
+
+        if compress:
+            out.close()
+
+        message = f"Fetched {count} reports..."
+        if truncated:
+            message += " That's as many as will fit in one upload. Narrow the range to get the rest."
+        await ctx.send(message)
+        buffer.seek(0)
         now = datetime.today().timestamp()
-        save_to_disk(f"report_{now}", data_list, 'csv', fields)
-        send_file = File(f"report_{now}.csv")
-        await ctx.send(file=send_file)
-        os.remove(f"report_{now}.csv")
+        await ctx.send(file=File(buffer, filename=f"report_{now}.csv{'.gz' if compress else ''}"))
 
 
 async def setup(bot):
@@ -5,15 +5,17 @@ from datetime import datetime
 import discord
 from discord.ext import commands, tasks
 import io
-import requests
 from discord.ext.commands import MemberConverter
 
 import sky
 from cogs.BaseCog import BaseCog
-from utils import Configuration, Logging, Utils, Lang
+from utils import Configuration, Logging, Utils, Lang, LazyImport
+
+requests = LazyImport.lazy("requests")
 
 
 class Welcomer(BaseCog):
+    needs_member_list = True
 
     def __init__(self, bot):
         super().__init__(bot)
@@ -78,7 +80,7 @@ class Welcomer(BaseCog):
                     pass
 
             sus = []
-            for member in ctx.guild.members:
+            for member in await self.get_members(ctx.guild):
                 if member not in members:
                     sus.append(member)
 
@@ -141,7 +143,7 @@ class Welcomer(BaseCog):
         guild_row = await self.bot.get_guild_db_config(ctx.guild.id)
         muted_role = ctx.guild.get_role(guild_row.mutedrole)
         untracked_mute = []
-        for member in ctx.guild.members:
+        for member in await self.get_members(ctx.guild):
             if muted_role in member.roles:
                 untracked_mute.append(Utils.get_member_log_name(member))
         if untracked_mute:
@@ -9,6 +9,7 @@ from utils.Database import CountWord
 
 
 class WordCounter(BaseCog):
+    reload_state = ("words",)
 
     def __init__(self, bot):
         super().__init__(bot)
@@ -0,0 +1,11 @@
+from tortoise import BaseDBAsyncClient
+
+
+async def upgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        ALTER TABLE `bugreport` ADD INDEX `idx_bugreport_platfor_51bdaa` (`platform`, `branch`, `reported_at`);"""
+
+
+async def downgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        ALTER TABLE `bugreport` DROP INDEX `idx_bugreport_platfor_51bdaa`;"""
@@ -0,0 +1,27 @@
+from tortoise import BaseDBAsyncClient
+
+
+async def upgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        ALTER TABLE `artchannel` ADD INDEX `idx_artchannel_serveri_f76adb` (`serverid`);
+        ALTER TABLE `autoresponder` ADD INDEX `idx_autorespond_serveri_47eac9` (`serverid`);
+        ALTER TABLE `bugreport` ADD INDEX `idx_bugreport_reporte_4aab0c` (`reported_at`);
+        ALTER TABLE `bugreport` ADD INDEX `idx_bugreport_reporte_f3eb44` (`reporter`);
+        ALTER TABLE `configchannel` ADD INDEX `idx_configchann_serveri_021c64` (`serverid`);
+        ALTER TABLE `countword` ADD INDEX `idx_countword_serveri_0a0549` (`serverid`);
+        ALTER TABLE `customcommand` ADD INDEX `idx_customcomma_serveri_3c2b23` (`serverid`);
+        ALTER TABLE `dropboxchannel` ADD INDEX `idx_dropboxchan_serveri_372b94` (`serverid`);
+        ALTER TABLE `krillchannel` ADD INDEX `idx_krillchanne_serveri_db0e5b` (`serverid`);"""
+
+
+async def downgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        ALTER TABLE `krillchannel` DROP INDEX `idx_krillchanne_serveri_db0e5b`;
+        ALTER TABLE `dropboxchannel` DROP INDEX `idx_dropboxchan_serveri_372b94`;
+        ALTER TABLE `customcommand` DROP INDEX `idx_customcomma_serveri_3c2b23`;
+        ALTER TABLE `countword` DROP INDEX `idx_countword_serveri_0a0549`;
+        ALTER TABLE `configchannel` DROP INDEX `idx_configchann_serveri_021c64`;
+        ALTER TABLE `bugreport` DROP INDEX `idx_bugreport_reporte_f3eb44`;
+        ALTER TABLE `bugreport` DROP INDEX `idx_bugreport_reporte_4aab0c`;
+        ALTER TABLE `autoresponder` DROP INDEX `idx_autorespond_serveri_47eac9`;
+        ALTER TABLE `artchannel` DROP INDEX `idx_artchannel_serveri_f76adb`;"""
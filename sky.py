@@ -1,21 +1,23 @@
 import asyncio
-import os
 import signal
-import sys
+import time
 from asyncio import shield
+from collections import deque
+from dataclasses import dataclass
 
 import sentry_sdk
 from discord.ext import commands
 from discord.ext.commands import Bot
 from aiohttp import ClientOSError, ServerDisconnectedError
-from discord import ConnectionClosed, Intents, AllowedMentions
+from discord import ConnectionClosed, Intents, AllowedMentions, MemberCacheFlags
 from prometheus_client import CollectorRegistry
 from sentry_sdk.integrations.aiohttp import AioHttpIntegration
 from tortoise import Tortoise
 from aerich import Command
 
 import utils.tortoise_settings
-from utils import Logging, Configuration, Utils, Emoji, Database, Lang
+from utils import Logging, Configuration, Utils, Emoji, Database, Lang, Questions, GatewayRecorder, LazyImport, \
+    ErrorDigest
 from utils.Logging import TCol
 from utils.Database import BotAdmin, Guild
 from utils.PrometheusMon import PrometheusMon
@@ -34,12 +36,12 @@ class Skybot(Bot):
         self.metrics = PrometheusMon(self)
         self.config_channels = dict()
         self.db_keepalive = None
+        self.error_digest = None
+        self.gateway_recorder = None
+        # guild id -> running member chunk request
+        self.chunk_tasks = dict()
         self.my_name = type(self).__name__
         self.loaded = False
-        sys.path.append(
-            os.path.join(os.path.dirname(os.path.abspath(__file__)),
-                         "sky-python-music-sheet-maker",
-                         "python"))
 
     async def setup_hook(self):
         Logging.info(f'{TCol.cUnderline}{TCol.cWarning}setup_hook start{TCol.cEnd}{TCol.cEnd}')
@@ -53,15 +55,30 @@ class Skybot(Bot):
         for cog in Configuration.get_var("cogs"):
             try:
                 Logging.info(f"load cog {TCol.cOkCyan}{cog}{TCol.cEnd}")
-                await self.load_extension("cogs." + cog)
-                Logging.info(f"\t{TCol.cOkGreen}loaded{TCol.cEnd}")
+                with LazyImport.ImportTimer() as timer:
+                    await self.load_extension("cogs." + cog)
+                self.metrics.cog_load_seconds.labels(cog=cog).set(timer.elapsed)
+                Logging.info(f"\t{TCol.cOkGreen}loaded{TCol.cEnd} in {timer.elapsed * 1000:.1f}ms, "
+                             f"{timer.import_seconds * 1000:.1f}ms of it importing {len(timer.times)} modules")
+                if timer.times:
+                    Logging.info(f"\tslowest imports: {timer.format(5)}")
             except Exception as e:
                 await Utils.handle_exception(
                     f"{TCol.cFail}Failed to load cog{TCol.cEnd} {TCol.cWarning}{cog}{TCol.cEnd}",
                     self,
                     e)
         Logging.info(f"{TCol.cBold}{TCol.cOkGreen}Cog loading complete{TCol.cEnd}{TCol.cEnd}")
-        self.db_keepalive = self.loop.create_task(self.keepDBalive())
+        needy_cogs = [name for name, cog in self.cogs.items() if getattr(cog, "needs_member_list", False)]
+        if needy_cogs and not self.intents.members:
+            Logging.warn(f"{', '.join(needy_cogs)} need member lists, but the members intent is off")
+        self.db_keepalive = self.loop.create_task(self.check_db_health())
+        self.error_digest = self.loop.create_task(self.send_error_digests())
+
+        # opt-in capture of anonymized gateway traffic for replay benchmarks
+        record_file = Configuration.get_var("gateway_record_file", "")
+        if record_file:
+            self.gateway_recorder = GatewayRecorder.Recorder(self, record_file)
+            self.gateway_recorder.start()
         self.loaded = True
         Logging.info(f'{TCol.cUnderline}{TCol.cWarning}setup_hook end{TCol.cEnd}{TCol.cEnd}')
 
@@ -80,6 +97,11 @@ class Skybot(Bot):
         Logging.info(f"{TCol.cUnderline}{TCol.cWarning}{self.my_name} startup complete{TCol.cEnd}{TCol.cEnd}")
         await Logging.bot_log(f"{Configuration.get_var('bot_name', 'this bot')} startup complete")
 
+    async def on_message(self, message):
+        # feed open question dialogs by (channel, author) instead of running a wait_for predicate per dialog
+        Questions.route_message(message)
+        await self.process_commands(message)
+
     async def get_guild_log_channel(self, guild_id):
         # TODO: cog override for logging channel
         return await self.get_guild_config_channel(guild_id, 'log')
@@ -144,6 +166,35 @@ class Skybot(Bot):
         # Logging.info(f"in_admins: {'yes' if in_admins else 'no'}")
         return is_db_admin or is_owner or in_admins
 
+    async def ensure_chunked(self, guild):
+        """
+        Fetch the full member list of a guild, once. For cogs that need every member when guilds are not chunked
+        at startup
+        :return: True if guild.members is complete
+        """
+        if guild.chunked:
+            return True
+        if not self.intents.members:
+            Logging.warn(f"member list of {guild} requested, but the members intent is off")
+            return False
+        task = self.chunk_tasks.get(guild.id)
+        if task is None:
+            task = self.chunk_tasks[guild.id] = asyncio.create_task(self.chunk_guild(guild))
+        # one caller giving up must not cancel the request for the others
+        return await shield(task)
+
+    async def chunk_guild(self, guild):
+        started_at = time.monotonic()
+        try:
+            await guild.chunk(cache=True)
+            Logging.info(f"chunked {len(guild.members)} members of {guild} in {time.monotonic() - started_at:.1f}s")
+            return True
+        except Exception as e:
+            Utils.get_embed_and_log_exception(f"Failed to chunk members of {guild}", self, e)
+            return False
+        finally:
+            self.chunk_tasks.pop(guild.id, None)
+
     async def guild_log(self, guild_id: int, message=None, embed=None):
         channel = await self.get_guild_log_channel(guild_id)
         if channel and (message or embed):
@@ -156,7 +207,10 @@ class Skybot(Bot):
             self.shutting_down = True
             if self.db_keepalive:
                 self.db_keepalive.cancel()
-            await Tortoise.close_connections()
+            if self.error_digest:
+                self.error_digest.cancel()
+            if self.gateway_recorder:
+                await self.gateway_recorder.stop()
             for cog in list(self.cogs):
                 Logging.info(f"{TCol.cWarning}unloading{TCol.cEnd} cog {TCol.cOkCyan}{cog}{TCol.cEnd}")
                 c = self.get_cog(cog)
@@ -165,6 +219,8 @@ class Skybot(Bot):
                 await self.unload_extension(f"cogs.{cog}")
                 Logging.info(f"\t{TCol.cWarning}unloaded{TCol.cEnd}")
             Logging.info(f"{TCol.cWarning}cog unloading complete{TCol.cEnd}")
+            # after the cogs, their shutdown may still save to the database
+            await Tortoise.close_connections()
         return await super().close()
 
     async def on_command_error(bot, ctx: commands.Context, error):
@@ -210,13 +266,25 @@ class Skybot(Bot):
             if ctx.channel.permissions_for(ctx.me).send_messages:
                 await ctx.send(f"{e} Something went wrong while executing that command {e}")
 
-    async def keepDBalive(self):
+    async def check_db_health(self):
         while not self.is_closed():
-            # simple query to ping the db
-            query = "select 1"
-            conn = Tortoise.get_connection("default")
-            await conn.execute_query(query)
-            await asyncio.sleep(3600)
+            await Database.check_health()
+            await asyncio.sleep(Configuration.get_var("db_health_check_seconds", 60))
+
+    async def send_error_digests(self):
+        # exceptions that keep repeating are only reported in full once, then summed up here
+        while not self.is_closed():
+            await asyncio.sleep(60)
+            lines = ErrorDigest.get_due()
+            if not lines:
+                continue
+            text = "\n".join(lines)
+            Logging.error(f"Repeated exceptions:\n{text}")
+            try:
+                for page in Utils.paginate(text, prefix="**Repeated exceptions**\n"):
+                    await Logging.bot_log(page)
+            except Exception as ex:
+                Logging.error(f"Failed to send exception digest to botlog: {ex}")
 
 
 async def run_db_migrations():
@@ -239,6 +307,38 @@ async def run_db_migrations():
     Logging.info(f'{TCol.cOkGreen}###### end dg migrations ######{TCol.cEnd}')
 
 
+def get_gateway_options():
+    """
+    Intents, member cache and message cache settings from config. Without config every member and presence is
+    cached and guilds are chunked at startup. See docs/memory.md for what each costs
+    """
+    intents = Intents(
+        members=True,
+        messages=True,
+        guild_messages=True,
+        dm_messages=True,
+        dm_typing=False,
+        guild_typing=False,
+        message_content=True,
+        guilds=True,
+        bans=True,
+        emojis_and_stickers=True,
+        presences=True,
+        reactions=True)
+    for name, value in Configuration.get_var("intents", dict()).items():
+        setattr(intents, name, value)
+
+    member_cache_flags = MemberCacheFlags.from_intents(intents)
+    for name, value in Configuration.get_var("member_cache_flags", dict()).items():
+        setattr(member_cache_flags, name, value)
+
+    return dict(
+        intents=intents,
+        member_cache_flags=member_cache_flags,
+        chunk_guilds_at_startup=Configuration.get_var("chunk_guilds_at_startup", intents.members),
+        max_messages=Configuration.get_var("max_messages", 1000))
+
+
 def before_send(event, hint):
     if 'exc_info' in hint:
         exc_type, exc_value, tb = hint['exc_info']
@@ -267,13 +367,15 @@ async def persistent_data_job(work_item: Configuration.PersistentAction):
     Configuration.do_persistent_action(work_item)
 
 
-async def queue_worker(name, queue, job, shielded=False):
+async def queue_worker(name, queue, job, shielded=False, idle_timeout=None, retire=None):
     """
     Generic queue worker
     :param name:
     :param queue: the queue to pull work items from
     :param job: the job that will be done on work items
     :param shielded: boolean indicating whether the job will be shielded from cancellation
+    :param idle_timeout: seconds to wait for a work item before asking retire whether to stop. None waits forever
+    :param retire: callable returning True when an idle worker should stop
     :return:
     """
     global running
@@ -281,7 +383,15 @@ async def queue_worker(name, queue, job, shielded=False):
         Logging.info(f"\t{TCol.cOkGreen}start{TCol.cEnd} {TCol.cOkCyan}`{name}`{TCol.cEnd} worker")
         while True:
             # Get a work_item from the queue
-            work_item = await queue.get()
+            if idle_timeout is None:
+                work_item = await queue.get()
+            else:
+                try:
+                    work_item = await asyncio.wait_for(queue.get(), idle_timeout)
+                except asyncio.TimeoutError:
+                    if retire is not None and retire():
+                        return
+                    continue
             try:
                 if shielded:
                     await shield(job(work_item))
@@ -289,7 +399,7 @@ async def queue_worker(name, queue, job, shielded=False):
                     await asyncio.create_task(job(work_item))
             except asyncio.CancelledError:
                 Logging.info(f"job cancelled for worker {name}")
-                if not Utils.BOT.loaded:
+                if not Utils.BOT.loaded or (retire is not None and retire()):
                     Logging.info(f"stopping worker {name}")
                     raise
                 Logging.info(f"worker {name} continues")
@@ -301,6 +411,126 @@ async def queue_worker(name, queue, job, shielded=False):
         return
 
 
+@dataclass()
+class PoolEntry:
+    key: object
+    item: object
+    enqueued_at: float
+
+
+class WorkerPool:
+    """
+    queue_workers on a shared queue that scale with load.
+    A worker is added whenever work is waiting and every worker is busy, up to max_workers.
+    Workers idle for idle_seconds retire, down to min_workers.
+    """
+
+    def __init__(self, name, job, min_workers=1, max_workers=10, idle_seconds=60.0, shielded=False):
+        self.name = name
+        self.job = job
+        self.min_workers = min_workers
+        self.max_workers = max(min_workers, max_workers)
+        self.idle_seconds = idle_seconds
+        self.shielded = shielded
+        self.queue = asyncio.Queue()
+        # entries not yet picked up, in queue order. used for queue positions
+        self.pending = deque()
+        # worker name -> worker task. workers drop out of here when they retire or die
+        self.workers = dict()
+        # jobs currently running. finished jobs discard themselves so nothing accumulates
+        self.jobs = set()
+        self.serial = 0
+        self.stopping = False
+
+    def start(self):
+        while len(self.workers) < self.min_workers:
+            self.add_worker()
+
+    def add_worker(self):
+        self.serial += 1
+        name = f"{self.name} {self.serial}"
+        task = asyncio.create_task(
+            queue_worker(name, self.queue, self.run_job, self.shielded, self.idle_seconds,
+                         lambda: self.retire(name)))
+        task.add_done_callback(lambda t: self.workers.pop(name, None))
+        self.workers[name] = task
+        self.update_metrics()
+
+    def retire(self, name):
+        if not self.stopping and len(self.workers) <= self.min_workers:
+            return False
+        self.workers.pop(name, None)
+        self.update_metrics()
+        return True
+
+    def put(self, item, key=None):
+        """
+        Queue a work item, adding a worker if every current worker is busy
+        :param item: work item passed to job
+        :param key: identifies who the item belongs to, for position lookups
+        :return: 1-based position of the item among items waiting for a worker
+        """
+        entry = PoolEntry(key, item, time.monotonic())
+        self.pending.append(entry)
+        self.queue.put_nowait(entry)
+        metrics = getattr(Utils.BOT, "metrics", None)
+        if metrics:
+            metrics.worker_pool_queue_depth.labels(pool=self.name).observe(self.queue.qsize())
+        if len(self.pending) > self.idle_count() and len(self.workers) < self.max_workers:
+            self.add_worker()
+        return len(self.pending)
+
+    def idle_count(self):
+        return len(self.workers) - len(self.jobs)
+
+    def is_saturated(self):
+        """True when queued work has to wait for a running job to finish"""
+        return len(self.workers) >= self.max_workers and len(self.pending) > self.idle_count()
+
+    def position(self, key):
+        """1-based position of the first waiting item for key, or None if key has nothing waiting"""
+        for i, entry in enumerate(self.pending, 1):
+            if entry.key == key:
+                return i
+        return None
+
+    async def run_job(self, entry):
+        if entry in self.pending:
+            self.pending.remove(entry)
+        task = asyncio.current_task()
+        self.jobs.add(task)
+        metrics = getattr(Utils.BOT, "metrics", None)
+        started_at = time.monotonic()
+        if metrics:
+            metrics.worker_pool_wait_seconds.labels(pool=self.name).observe(started_at - entry.enqueued_at)
+        self.update_metrics()
+        try:
+            await self.job(entry.item)
+        finally:
+            self.jobs.discard(task)
+            if metrics:
+                metrics.worker_pool_service_seconds.labels(pool=self.name).observe(time.monotonic() - started_at)
+            self.update_metrics()
+
+    def update_metrics(self):
+        metrics = getattr(Utils.BOT, "metrics", None)
+        if metrics:
+            metrics.worker_pool_workers.labels(pool=self.name).set(len(self.workers))
+            metrics.worker_pool_busy.labels(pool=self.name).set(len(self.jobs))
+
+    async def stop(self):
+        """Cancel running jobs and workers, and wait for them to end. Queued items are dropped"""
+        self.stopping = True
+        workers = list(self.workers.values())
+        jobs = list(self.jobs)
+        for task in [*jobs, *workers]:
+            task.cancel()
+        await asyncio.gather(*jobs, *workers, return_exceptions=True)
+        self.pending.clear()
+        self.workers.clear()
+        self.update_metrics()
+
+
 async def main():
     global running
     running = True
@@ -326,25 +556,12 @@ async def main():
 
     # start the client
     prefix = Configuration.get_var("bot_prefix")
-    intents = Intents(
-        members=True,
-        messages=True,
-        guild_messages=True,
-        dm_messages=True,
-        dm_typing=False,
-        guild_typing=False,
-        message_content=True,
-        guilds=True,
-        bans=True,
-        emojis_and_stickers=True,
-        presences=True,
-        reactions=True)
     skybot = Skybot(
         loop=loop,
         command_prefix=commands.when_mentioned_or(prefix),
         case_insensitive=True,
         allowed_mentions=AllowedMentions(everyone=False, users=True, roles=False, replied_user=True),
-        intents=intents)
+        **get_gateway_options())
     skybot.help_command = commands.DefaultHelpCommand(command_attrs=dict(name='snelp', checks=[can_help]))
     Utils.BOT = skybot
 
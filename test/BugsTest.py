@@ -0,0 +1,176 @@
+import asyncio
+import unittest
+from unittest import IsolatedAsyncioTestCase
+
+from harness import Harness
+
+from cogs.Bugs import BugFieldsModal, BugFormView
+from utils import Lang, Reloader
+from utils.Database import BugReportingChannel, BugReportingPlatform
+
+
+class FakeResponse:
+
+    def __init__(self, interaction):
+        self.interaction = interaction
+
+    async def edit_message(self, **kwargs):
+        self.interaction.calls.append(("edit_message", kwargs))
+
+    async def defer(self):
+        self.interaction.calls.append(("defer", {}))
+
+    async def send_message(self, content):
+        self.interaction.calls.append(("send_message", {"content": content}))
+
+
+class FakeFollowup:
+
+    def __init__(self, interaction):
+        self.interaction = interaction
+
+    async def send(self, content):
+        self.interaction.calls.append(("followup", {"content": content}))
+
+
+class FakeInteraction:
+    """What the form's callbacks use of an Interaction. Records the calls"""
+
+    def __init__(self, user):
+        self.user = user
+        self.calls = []
+        self.response = FakeResponse(self)
+        self.followup = FakeFollowup(self)
+
+    async def edit_original_response(self, **kwargs):
+        self.calls.append(("edit_original_response", kwargs))
+
+
+class BugsTest(IsolatedAsyncioTestCase):
+    """Run from the repo root: PYTHONPATH=. python test/BugsTest.py"""
+
+    async def asyncSetUp(self):
+        self.harness = Harness(cogs=["Bugs"], config={"bug_workers_min": 1, "bug_workers_max": 1})
+        await self.harness.boot()
+        self.addAsyncCleanup(self.harness.stop)
+        guild = await self.harness.bot.get_guild_db_config(int(self.harness.guild["id"]))
+        platform = await BugReportingPlatform.create(guild=guild, branch="Beta", platform="Android")
+        await BugReportingChannel.create(guild=guild, channelid=int(self.harness.general["id"]), platform=platform)
+        await self.harness.gateway.connect()
+        # the bug info message goes up once at startup
+        await self.harness.outbox.wait_for(
+            lambda e: e.method == "POST" and e.params.get("channel_id") == self.harness.general["id"], timeout=10)
+        self.cog = self.harness.bot.get_cog("Bugs")
+        await self.cog.index_task
+
+    async def hold_worker(self):
+        """Keep the pool's only worker busy. :return: event that lets it go"""
+        pool = self.cog.bug_pool
+        started = asyncio.Event()
+        release = asyncio.Event()
+
+        async def hold(item):
+            started.set()
+            await release.wait()
+
+        pool.job = hold
+        pool.put("running report")
+        await started.wait()
+        self.addCleanup(release.set)
+        return release
+
+    async def test_queue_position(self):
+        await self.hold_worker()
+        channel_id = int(self.harness.general["id"])
+        Lang.CHANNEL_LOCALES[channel_id] = "ja_JP"
+        self.addCleanup(Lang.CHANNEL_LOCALES.pop, channel_id)
+        user = self.harness.bot.get_user(int(self.harness.member["id"]))
+        channel = self.harness.bot.get_channel(channel_id)
+        self.harness.outbox.clear()
+
+        await self.cog.enqueue_bug_report(user, channel)
+        # reacting again while waiting doesn't queue a second report
+        await self.cog.enqueue_bug_report(user, channel)
+        self.assertEqual([user.id], [entry.key for entry in self.cog.bug_pool.pending])
+        notices = [entry.content for entry in self.harness.outbox.messages(self.harness.general["id"])]
+        self.assertEqual(2, len(notices))
+        for notice in notices:
+            self.assertTrue(notice.startswith("--jp--"), notice)
+            self.assertIn("number 1 in line", notice)
+
+    async def test_reload_keeps_reports(self):
+        pool = self.cog.bug_pool
+        release = await self.hold_worker()
+        running = next(iter(pool.jobs))
+        self.cog.in_progress[1] = running
+        self.harness.outbox.clear()
+
+        seconds, state_kept = await Reloader.reload_cog(self.harness.bot, "Bugs")
+        await self.harness.gateway.settle()
+
+        self.assertTrue(state_kept)
+        cog = self.harness.bot.get_cog("Bugs")
+        self.assertIsNot(self.cog, cog)
+        self.assertIs(pool, cog.bug_pool)
+        self.assertIs(self.cog.in_progress, cog.in_progress)
+        # queued reports start on the new instance, the running one carries on
+        self.assertEqual(cog.run_bug_report, pool.job)
+        self.assertFalse(running.done())
+        self.assertEqual(cog.routes, self.cog.routes)
+        # no on_ready: the bug info message stays where it is
+        self.assertEqual([], self.harness.outbox.messages(self.harness.general["id"]))
+        self.assertEqual([], self.harness.outbox.find(lambda e: e.method == "DELETE"))
+
+        release.set()
+        await running
+        self.assertEqual(set(), pool.jobs)
+
+
+class BugFormTest(IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.harness = Harness(cogs=["Bugs"])
+        await self.harness.start()
+        self.addAsyncCleanup(self.harness.stop)
+        self.cog = self.harness.bot.get_cog("Bugs")
+        self.user = self.harness.bot.get_user(int(self.harness.member["id"]))
+        channel = self.harness.bot.get_channel(int(self.harness.general["id"]))
+        self.view = BugFormView(self.cog, self.user, channel, Lang.locale_context(channel, self.user), [], 60)
+
+    async def fill_in(self, **answers):
+        modal = BugFieldsModal(self.view, "report", self.view.report_fields)
+        for item, text_input in modal.inputs:
+            if item.attr in answers:
+                text_input._value = answers[item.attr]
+        await modal.on_submit(FakeInteraction(self.user))
+        return modal
+
+    async def test_modal_keeps_typed_text(self):
+        await self.fill_in(title="my_title *bold*")
+        # reopened and sent again unchanged
+        modal = await self.fill_in()
+        title = next(text_input for item, text_input in modal.inputs if item.attr == "title")
+        self.assertEqual("my_title *bold*", title.default)
+        self.assertEqual("my_title *bold*", self.view.form.title)
+        self.assertEqual(r"my\_title \*bold\*", self.view.get_escaped_form().title)
+
+    async def test_no_submit_while_collecting_attachments(self):
+        self.view.form.title = "title"
+        collecting = asyncio.create_task(self.view.add_attachments(FakeInteraction(self.user)))
+        await self.harness.outbox.wait_for(lambda e: e.method == "POST")
+        self.assertTrue(all(button.disabled for button in self.view.locked_buttons))
+
+        interaction = FakeInteraction(self.user)
+        await self.view.submit(interaction)
+        await self.view.cancel(interaction)
+        self.assertEqual([("defer", {}), ("defer", {})], interaction.calls)
+        self.assertFalse(self.view.submitted)
+        self.assertFalse(self.view.is_finished())
+
+        collecting.cancel()
+        await asyncio.gather(collecting, return_exceptions=True)
+        self.assertFalse(any(button.disabled for button in self.view.locked_buttons))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,91 @@
+import os
+import tempfile
+import unittest
+from unittest import IsolatedAsyncioTestCase
+
+from harness import Harness
+
+from utils import Configuration, DuplicateIndex
+from utils.Database import BugReport
+
+CRASH = "App crashes when opening the map in the valley of triumph after the update"
+CRASH_AGAIN = "After the update the app crashes when I open the map in the valley of triumph"
+SOUND = "No sound in the concert hall when playing the harp with friends"
+
+
+class DuplicateIndexTest(unittest.TestCase):
+    """Run from the repo root: PYTHONPATH=. python test/DuplicateIndexTest.py"""
+
+    def setUp(self):
+        self.data_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.data_dir.cleanup)
+        Configuration.MASTER_CONFIG["duplicate_index_file"] = os.path.join(self.data_dir.name, "index.bin")
+        DuplicateIndex.SIGNATURES.clear()
+        DuplicateIndex.BUCKETS.clear()
+
+    def test_signature(self):
+        self.assertEqual(DuplicateIndex.get_signature(CRASH), DuplicateIndex.get_signature(CRASH.upper()))
+        self.assertEqual(DuplicateIndex.NUM_PERM, len(DuplicateIndex.get_signature(CRASH)))
+        self.assertIsNone(DuplicateIndex.get_signature(" ... "))
+        crash = DuplicateIndex.get_signature(CRASH)
+        self.assertGreater(DuplicateIndex.similarity(crash, DuplicateIndex.get_signature(CRASH_AGAIN)), 0.35)
+        self.assertLess(DuplicateIndex.similarity(crash, DuplicateIndex.get_signature(SOUND)), 0.1)
+
+    def test_query(self):
+        for report_id, text in enumerate([CRASH, SOUND, CRASH_AGAIN], 1):
+            DuplicateIndex.add(report_id, DuplicateIndex.get_signature(text))
+        signature = DuplicateIndex.SIGNATURES[3]
+        self.assertEqual([1], [report_id for report_id, score in DuplicateIndex.query(signature, exclude=3)])
+        self.assertEqual([3, 1], [report_id for report_id, score in DuplicateIndex.query(signature)])
+        self.assertEqual([3], [report_id for report_id, score in DuplicateIndex.query(signature, limit=1)])
+        self.assertEqual([], DuplicateIndex.query(None))
+
+    def test_persistence(self):
+        DuplicateIndex.add(1, DuplicateIndex.get_signature(CRASH))
+        DuplicateIndex.save([(2, DuplicateIndex.get_signature(SOUND)), (1, DuplicateIndex.get_signature(CRASH_AGAIN))])
+        with open(DuplicateIndex.get_path(), "ab") as file:
+            # interrupted write
+            file.write(b"\0" * 10)
+        DuplicateIndex.load()
+        self.assertEqual({1, 2}, set(DuplicateIndex.SIGNATURES))
+        # the later record for a report wins
+        self.assertEqual(DuplicateIndex.get_signature(CRASH_AGAIN), DuplicateIndex.SIGNATURES[1])
+        self.assertEqual([1], [report_id for report_id, score in
+                               DuplicateIndex.query(DuplicateIndex.get_signature(CRASH), exclude=2)])
+
+
+class BackfillTest(IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.harness = Harness(cogs=["Bugs"])
+        await self.harness.start()
+        self.addAsyncCleanup(self.harness.stop)
+        self.cog = self.harness.bot.get_cog("Bugs")
+        await self.cog.index_task
+
+    async def create_reports(self, *texts):
+        reports = []
+        for text in texts:
+            reports.append(await BugReport.create(
+                reporter=1, platform="Android", platform_version="1", branch="Beta", app_version="1", title=text,
+                deviceinfo="device", steps="steps", expected="expected", actual="actual", additional="",
+                reported_at=0))
+        return reports
+
+    async def test_backfill_resumes_from_cursor(self):
+        old, = await self.create_reports(CRASH)
+        # a report indexed as it came in, while the backfill hadn't reached the older one yet
+        new, = await self.create_reports(SOUND)
+        DuplicateIndex.add(new.id, DuplicateIndex.get_signature(DuplicateIndex.get_report_text(new)))
+
+        await self.cog.backfill_duplicate_index()
+        await Configuration.PERSISTENT_AIO_QUEUE.join()
+        self.assertEqual({old.id, new.id}, set(DuplicateIndex.SIGNATURES))
+        self.assertEqual(new.id, DuplicateIndex.get_cursor())
+
+        DuplicateIndex.load()
+        self.assertEqual({old.id, new.id}, set(DuplicateIndex.SIGNATURES))
+
+
+if __name__ == "__main__":
+    unittest.main()
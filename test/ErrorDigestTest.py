@@ -0,0 +1,71 @@
+import unittest
+
+from discord import Colour
+
+from utils import Configuration, ErrorDigest
+
+
+def catch(func):
+    try:
+        func()
+    except Exception as e:
+        return e
+
+
+def parse_colour():
+    # raised inside discord.py, like the http errors
+    return Colour.from_str("not a colour")
+
+
+def parse_other_colour():
+    return Colour.from_str("not a colour")
+
+
+class ErrorDigestTest(unittest.TestCase):
+    """Run from the repo root: PYTHONPATH=. python test/ErrorDigestTest.py"""
+
+    def setUp(self):
+        Configuration.MASTER_LOADED = True
+        Configuration.MASTER_CONFIG["exception_digest_seconds"] = 300
+        ErrorDigest.OCCURRENCES.clear()
+
+    def test_repeats_suppressed(self):
+        self.assertTrue(ErrorDigest.record("parsing", catch(parse_colour)))
+        self.assertFalse(ErrorDigest.record("parsing", catch(parse_colour)))
+
+    def test_library_errors_told_apart(self):
+        first, second = catch(parse_colour), catch(parse_other_colour)
+        self.assertEqual(ErrorDigest.get_frames(first)[-1], ErrorDigest.get_frames(second)[-1])
+        self.assertTrue(ErrorDigest.record("parsing", first))
+        self.assertTrue(ErrorDigest.record("parsing", second))
+        self.assertEqual("parse_colour", ErrorDigest.get_location(ErrorDigest.get_frames(first))[1])
+
+    def test_labels_told_apart(self):
+        self.assertTrue(ErrorDigest.record("parsing", catch(parse_colour)))
+        self.assertTrue(ErrorDigest.record("something else", catch(parse_colour)))
+
+    def test_get_due(self):
+        ErrorDigest.record("once", catch(parse_other_colour))
+        ErrorDigest.record("parsing", catch(parse_colour))
+        ErrorDigest.record("parsing", catch(parse_colour))
+        ErrorDigest.record("parsing", catch(parse_colour))
+        occurrence = ErrorDigest.OCCURRENCES[ErrorDigest.fingerprint("parsing", catch(parse_colour))]
+        start = occurrence.window_start
+
+        self.assertEqual([], ErrorDigest.get_due(start + 299))
+        lines = ErrorDigest.get_due(start + 300)
+        self.assertEqual(1, len(lines))
+        self.assertIn("parsing: `ValueError", lines[0])
+        self.assertIn("in parse_colour (ErrorDigestTest.py:", lines[0])
+        self.assertIn("x2 in last 5 min, 3 since", lines[0])
+        # the one that didn't repeat is forgotten, and reported in full next time
+        self.assertTrue(ErrorDigest.record("once", catch(parse_other_colour)))
+
+        # a new window starts after each digest. a window without repeats forgets the exception
+        self.assertEqual([], ErrorDigest.get_due(start + 400))
+        self.assertEqual([], ErrorDigest.get_due(start + 600))
+        self.assertTrue(ErrorDigest.record("parsing", catch(parse_colour)))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,75 @@
+import copy
+import unittest
+from unittest import IsolatedAsyncioTestCase
+
+from tortoise import Tortoise
+from tortoise.expressions import Q
+
+from utils import tortoise_settings
+from utils.Database import ArtChannel, AutoResponder, BugReport, ConfigChannel, CountWord, CustomCommand, \
+    DropboxChannel, KrillChannel
+
+
+def get_hot_queries():
+    """
+    The queries the bot runs at startup, in commands and for every bug report, as the ORM builds them.
+    Raw SQL in the cogs is matched with a queryset using the same WHERE
+    """
+    since = 490
+    querysets = {
+        # init_guild of each cog, and the per guild lookups of its commands
+        "ArtCollector.init_guild": ArtChannel.filter(serverid=123456789),
+        "AutoResponders.reload_triggers": AutoResponder.filter(serverid=123456789).order_by("id"),
+        "AutoResponders.get_db_trigger": AutoResponder.filter(serverid=123456789, trigger="trigger"),
+        "ChannelConfig.init_guild": ConfigChannel.filter(serverid=123456789),
+        "WordCounter.init_guild": CountWord.filter(serverid=123456789),
+        "CustCommands.init_guild": CustomCommand.filter(serverid=123456789),
+        "DropBox.on_ready": DropboxChannel.filter(serverid=123456789),
+        "Krill.init_guild": KrillChannel.filter(serverid=123456789),
+        # a member's reports
+        "BugReport by reporter": BugReport.filter(reporter=42),
+        # Reporting.csv keyset pages
+        "Reporting.csv page": BugReport.filter(
+            Q(branch__in=["Beta"]) & Q(platform__in=["Android"]) & Q(reported_at__gte=since) & Q(id__gt=since))
+        .order_by("id").limit(200),
+        # Bugs.get_report_stats, without and with a platform filter
+        "Bugs.get_report_stats": BugReport.filter(reported_at__gte=since).count(),
+        "Bugs.get_report_stats by platform": BugReport.filter(
+            reported_at__gte=since, platform="Android", branch="Beta").count(),
+    }
+    return {name: queryset.sql() for name, queryset in querysets.items()}
+
+
+@unittest.skipUnless(tortoise_settings.db_engine == "mysql", "EXPLAIN plans are only checked on MySQL")
+class ExplainTest(IsolatedAsyncioTestCase):
+    """Fails if a hot query reads every row instead of looking up an index. Needs a MySQL server; creates and drops its own database"""
+
+    async def asyncSetUp(self):
+        settings = copy.deepcopy(tortoise_settings.TORTOISE_ORM)
+        settings['connections']['default']['credentials']['database'] = "test_explain"
+        await Tortoise.init(settings, _create_db=True)
+        await Tortoise.generate_schemas()
+        self.conn = Tortoise.get_connection("default")
+
+        # enough rows that a selective range is cheaper through the index than a scan
+        await BugReport.bulk_create([
+            BugReport(reporter=i, platform="Android" if i % 2 else "iOS", platform_version="1", branch="Beta",
+                      app_version="1", title="title", deviceinfo="device", steps="steps", expected="expected",
+                      actual="actual", additional="", reported_at=i)
+            for i in range(500)])
+        await self.conn.execute_query("ANALYZE TABLE `bugreport`")
+
+    async def asyncTearDown(self):
+        await Tortoise._drop_databases()
+
+    async def test_hot_queries_use_indexes(self):
+        for name, query in get_hot_queries().items():
+            with self.subTest(query=name):
+                plan = await self.conn.execute_query_dict(f"EXPLAIN {query}")
+                for row in plan:
+                    # ALL scans the table, index scans all of an index. both read every row
+                    self.assertNotIn(row['type'], ('ALL', 'index'), f"{row['type']} scan: {query}")
+
+
+if __name__ == "__main__":
+    unittest.main()
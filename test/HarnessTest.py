@@ -0,0 +1,38 @@
+import unittest
+from unittest import IsolatedAsyncioTestCase
+
+from harness import Harness
+
+from utils.Database import Guild
+
+
+class HarnessTest(IsolatedAsyncioTestCase):
+    """Boots the bot on SQLite and the fake gateway. Run from the repo root: PYTHONPATH=. python test/HarnessTest.py"""
+
+    async def asyncSetUp(self):
+        self.harness = Harness(cogs=["Basic"])
+        await self.harness.start()
+        self.addAsyncCleanup(self.harness.stop)
+
+    async def test_startup_logged(self):
+        entry = await self.harness.outbox.wait_for(
+            lambda e: e.params.get("channel_id") == self.harness.bot_log["id"])
+        self.assertIn("startup complete", entry.content)
+
+    async def test_ping_command(self):
+        await self.harness.gateway.message(self.harness.general, self.harness.owner, "!ping")
+        await self.harness.outbox.wait_for(lambda e: e.method == "PATCH" and "REST API ping" in e.content)
+        self.assertEqual(":ping_pong:", self.harness.outbox.messages(self.harness.general["id"])[0].content)
+
+    async def test_ping_needs_permission(self):
+        await self.harness.gateway.message(self.harness.general, self.harness.member, "!ping")
+        self.assertEqual([], self.harness.outbox.messages(self.harness.general["id"]))
+
+    async def test_guild_config_in_sqlite(self):
+        guild_id = int(self.harness.guild["id"])
+        await self.harness.bot.get_guild_db_config(guild_id)
+        self.assertTrue(await Guild.exists(serverid=guild_id))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,52 @@
+import asyncio
+import time
+import unittest
+from unittest import IsolatedAsyncioTestCase
+
+from utils.RenderScheduler import RenderScheduler, RenderTimeout
+
+
+def render(seconds):
+    time.sleep(seconds)
+    return seconds
+
+
+class RenderSchedulerTest(IsolatedAsyncioTestCase):
+    """Run from the repo root: PYTHONPATH=. python test/RenderSchedulerTest.py"""
+
+    async def asyncSetUp(self):
+        self.scheduler = RenderScheduler("test", workers=2, timeout=1.5)
+        self.addAsyncCleanup(self.scheduler.shutdown)
+
+    async def test_result(self):
+        job = self.scheduler.submit(1, render, 0.1)
+        self.assertEqual(0.1, await job.future)
+        self.assertEqual(dict(), self.scheduler.running)
+
+    async def test_one_job_per_key(self):
+        self.scheduler.submit(1, render, 0.1)
+        with self.assertRaises(ValueError):
+            self.scheduler.submit(1, render, 0.1)
+
+    async def test_hung_job_leaves_others_their_time(self):
+        hung = self.scheduler.submit(1, render, 100)
+        await asyncio.sleep(0.4)
+        # killed along with the hung job's pool 1.1s in, with 0.4s of its first budget left
+        other = self.scheduler.submit(2, render, 1.2)
+        with self.assertRaises(RenderTimeout):
+            await hung.future
+        self.assertEqual(1.2, await other.future)
+
+    async def test_cancel_running(self):
+        job = self.scheduler.submit(1, render, 100)
+        await asyncio.sleep(0.2)
+        processes = list(self.scheduler.executor._processes.values())
+        self.assertTrue(self.scheduler.cancel(1))
+        with self.assertRaises(asyncio.CancelledError):
+            await job.future
+        await asyncio.sleep(0.2)
+        self.assertFalse(any(process.is_alive() for process in processes))
+
+
+if __name__ == "__main__":
+    unittest.main()
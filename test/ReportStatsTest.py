@@ -0,0 +1,73 @@
+import copy
+import unittest
+from unittest import IsolatedAsyncioTestCase
+
+from discord.utils import utcnow
+from tortoise import Tortoise
+
+from cogs.Bugs import Bugs
+from utils import tortoise_settings
+from utils.Database import BugReport
+
+DAY = 86400
+
+
+@unittest.skipUnless(tortoise_settings.db_engine == "mysql", "the stats queries are written for MySQL")
+class ReportStatsTest(IsolatedAsyncioTestCase):
+    """
+    Run from the repo root: BOT_DB_ENGINE=mysql PYTHONPATH=. python test/ReportStatsTest.py
+    Needs a MySQL server; creates and drops its own database
+    """
+
+    async def asyncSetUp(self):
+        settings = copy.deepcopy(tortoise_settings.TORTOISE_ORM)
+        settings['connections']['default']['credentials']['database'] = "test_report_stats"
+        await Tortoise.init(settings, _create_db=True)
+        await Tortoise.generate_schemas()
+
+        now = int(utcnow().timestamp())
+        reports = [
+            # reporter, platform, branch, age in days, title
+            (1, "Android", "Beta", 0, "a"),
+            (1, "Android", "Beta", 0, "abc"),
+            (2, "iOS", "Stable", 2, "abcde"),
+            # too old for the last 30 days
+            (3, "Android", "Beta", 40, "abcdefg"),
+        ]
+        await BugReport.bulk_create([
+            BugReport(reporter=reporter, platform=platform, platform_version="1", branch=branch, app_version="1",
+                      title=title, deviceinfo="device", steps="", expected="", actual="", additional="",
+                      reported_at=now - age * DAY - 60)
+            for reporter, platform, branch, age, title in reports])
+
+    async def asyncTearDown(self):
+        await Tortoise._drop_databases()
+
+    async def test_daily(self):
+        stats = await Bugs.query_report_stats("day", 30)
+        self.assertEqual(3, sum(row['reports'] for row in stats['counts']))
+        for row in stats['counts']:
+            self.assertRegex(row['period'], r"^\d{4}-\d{2}-\d{2}$")
+        # newest day first, a day for each platform and branch
+        self.assertEqual([("Android", "Beta", 2), ("iOS", "Stable", 1)],
+                         [(row['platform'], row['branch'], row['reports']) for row in stats['counts']])
+        self.assertEqual([(1, 2), (2, 1)], [(row['reporter'], row['reports']) for row in stats['top_reporters']])
+        self.assertEqual(3, stats['median_size'])
+
+    async def test_weekly(self):
+        stats = await Bugs.query_report_stats("week", 90)
+        self.assertEqual(4, sum(row['reports'] for row in stats['counts']))
+        for row in stats['counts']:
+            self.assertRegex(row['period'], r"^\d{4}-W\d{2}$")
+
+    async def test_filters(self):
+        stats = await Bugs.query_report_stats("day", 30, branch="Stable")
+        self.assertEqual([("iOS", "Stable", 1)],
+                         [(row['platform'], row['branch'], row['reports']) for row in stats['counts']])
+        stats = await Bugs.query_report_stats("day", 30, platform="Android", branch="Stable")
+        self.assertEqual([], stats['counts'])
+        self.assertEqual(0, stats['median_size'])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,64 @@
+import unittest
+from unittest import IsolatedAsyncioTestCase
+
+from harness import Harness
+
+from utils.Database import BugReport, BugReportingPlatform
+
+
+class ReportingTest(IsolatedAsyncioTestCase):
+    """Run from the repo root: PYTHONPATH=. python test/ReportingTest.py"""
+
+    async def asyncSetUp(self):
+        self.harness = Harness(cogs=["Reporting"])
+        await self.harness.start()
+        self.addAsyncCleanup(self.harness.stop)
+        guild = await self.harness.bot.get_guild_db_config(int(self.harness.guild["id"]))
+        for branch in ("Beta", "Stable"):
+            for platform in ("Android", "iOS"):
+                await BugReportingPlatform.create(guild=guild, branch=branch, platform=platform)
+        await BugReport.create(
+            reporter=1, platform="Android", platform_version="1", branch="Beta", app_version="1", title="title",
+            deviceinfo="device", steps="steps", expected="expected", actual="actual", additional="",
+            reported_at=1672531200)
+
+    async def csv(self, arguments):
+        """Run the command, :return: (the fetching message, the uploaded file name or None)"""
+        self.harness.outbox.clear()
+        await self.harness.gateway.message(self.harness.general, self.harness.owner, f"!csv {arguments}")
+        first = await self.harness.outbox.wait_for(lambda e: e.method == "POST")
+        if not first.content.startswith("Fetching"):
+            return first.content, None
+        upload = await self.harness.outbox.wait_for(lambda e: e.files)
+        return first.content, upload.files[0]
+
+    async def test_compress_without_filters(self):
+        message, file_name = await self.csv("yes")
+        self.assertTrue(file_name.endswith(".csv.gz"))
+        self.assertIn("'Stable'", message)
+
+    async def test_compress_after_some_filters(self):
+        message, file_name = await self.csv("-100 beta yes")
+        self.assertTrue(file_name.endswith(".csv.gz"))
+        self.assertIn("branch: ['Beta']", message)
+
+        message, file_name = await self.csv("-100 beta ios 2023-01-01 yes")
+        self.assertTrue(file_name.endswith(".csv.gz"))
+        self.assertIn("platform: ['iOS']", message)
+        self.assertIn("reported: 2023-01-01 to now", message)
+
+    async def test_all_filters(self):
+        message, file_name = await self.csv("-100 beta android 2023-01-01 2023-01-01")
+        self.assertTrue(file_name.endswith(".csv"))
+        self.assertIn("reported: 2023-01-01 to 2023-01-01", message)
+        self.assertTrue(await self.harness.outbox.wait_for(lambda e: e.content == "Fetched 1 reports..."))
+
+    async def test_bad_date(self):
+        message, file_name = await self.csv("-100 beta android 2023-13-01")
+        # the word that isn't a date is left for compress, which doesn't take it either
+        self.assertIsNone(file_name)
+        self.assertIn("2023-13-01", message)
+
+
+if __name__ == "__main__":
+    unittest.main()
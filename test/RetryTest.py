@@ -0,0 +1,160 @@
+import asyncio
+import time
+import unittest
+from types import SimpleNamespace
+from unittest import IsolatedAsyncioTestCase
+
+import prometheus_client as prom
+from prometheus_client import CollectorRegistry
+
+from utils import Retry, Utils
+from utils.PrometheusMon import PrometheusMon
+
+
+class FlakyCall:
+    """Fails with a transient error the first `failures` times it is called"""
+
+    def __init__(self, failures=0, error=asyncio.TimeoutError):
+        self.failures = failures
+        self.error = error
+        self.calls = 0
+
+    async def __call__(self):
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise self.error()
+        return "sent"
+
+
+class RetryTest(IsolatedAsyncioTestCase):
+    """Run from the repo root: PYTHONPATH=. python test/RetryTest.py"""
+
+    async def asyncSetUp(self):
+        Retry.BREAKERS.clear()
+        self.base_delay = Retry.BASE_DELAY
+        Retry.BASE_DELAY = 0
+        self.addCleanup(setattr, Retry, "BASE_DELAY", self.base_delay)
+
+    async def give_up(self, scope, count=1):
+        for _ in range(count):
+            with self.assertRaises(asyncio.TimeoutError):
+                await Retry.call("send", FlakyCall(failures=Retry.ATTEMPTS), scope=scope)
+
+    def cool_down(self, breaker):
+        breaker.opened_at -= Retry.RESET_SECONDS
+
+    async def test_retries_count_once(self):
+        call = FlakyCall(failures=Retry.ATTEMPTS - 1)
+        self.assertEqual("sent", await Retry.call("send", call, scope=1))
+        self.assertEqual(Retry.ATTEMPTS, call.calls)
+        await self.give_up(1)
+        breaker = Retry.get_breaker("send", 1)
+        self.assertEqual(1, breaker.failures)
+        self.assertEqual(Retry.CLOSED, breaker.state)
+
+    async def test_opens_per_scope(self):
+        await self.give_up(1, Retry.FAILURE_THRESHOLD)
+        self.assertEqual(Retry.OPEN, Retry.get_breaker("send", 1).state)
+        call = FlakyCall()
+        with self.assertRaises(Retry.CircuitOpenError):
+            await Retry.call("send", call, scope=1)
+        self.assertEqual(0, call.calls)
+        # other channels and other kinds of calls in the same channel are not affected
+        self.assertEqual("sent", await Retry.call("send", FlakyCall(), scope=2))
+        self.assertEqual("sent", await Retry.call("add_reaction", FlakyCall(), scope=1))
+
+    async def test_permanent_errors_dont_count(self):
+        call = FlakyCall(failures=1, error=ValueError)
+        with self.assertRaises(ValueError):
+            await Retry.call("send", call, scope=1)
+        self.assertEqual(1, call.calls)
+        self.assertEqual(0, Retry.get_breaker("send", 1).failures)
+
+    async def test_half_open_single_probe(self):
+        await self.give_up(1, Retry.FAILURE_THRESHOLD)
+        breaker = Retry.get_breaker("send", 1)
+        self.cool_down(breaker)
+
+        started = asyncio.Event()
+        finish = asyncio.Event()
+
+        async def slow():
+            started.set()
+            await finish.wait()
+            return "probed"
+
+        probe = asyncio.create_task(Retry.call("send", slow, scope=1))
+        await started.wait()
+        self.assertEqual(Retry.HALF_OPEN, breaker.state)
+        with self.assertRaises(Retry.CircuitOpenError):
+            await Retry.call("send", FlakyCall(), scope=1)
+        finish.set()
+        self.assertEqual("probed", await probe)
+        self.assertEqual(Retry.CLOSED, breaker.state)
+        self.assertEqual("sent", await Retry.call("send", FlakyCall(), scope=1))
+
+    async def test_failed_probe_reopens(self):
+        await self.give_up(1, Retry.FAILURE_THRESHOLD)
+        breaker = Retry.get_breaker("send", 1)
+        self.cool_down(breaker)
+        call = FlakyCall(failures=1)
+        with self.assertRaises(asyncio.TimeoutError):
+            await Retry.call("send", call, scope=1)
+        # the probe is not retried
+        self.assertEqual(1, call.calls)
+        self.assertEqual(Retry.OPEN, breaker.state)
+        self.assertGreater(breaker.retry_in(), 0)
+
+    async def test_inconclusive_probe_lets_another(self):
+        await self.give_up(1, Retry.FAILURE_THRESHOLD)
+        breaker = Retry.get_breaker("send", 1)
+        self.cool_down(breaker)
+        with self.assertRaises(ValueError):
+            await Retry.call("send", FlakyCall(failures=1, error=ValueError), scope=1)
+        self.assertEqual(Retry.HALF_OPEN, breaker.state)
+        self.assertEqual("sent", await Retry.call("send", FlakyCall(), scope=1))
+        self.assertEqual(Retry.CLOSED, breaker.state)
+
+    @staticmethod
+    def unregister(metrics):
+        # metrics also land in the default registry, the next bot registers its own
+        for metric in vars(metrics).values():
+            if isinstance(metric, prom.metrics.MetricWrapperBase):
+                prom.REGISTRY.unregister(metric)
+
+    async def test_metrics_per_route(self):
+        bot = SimpleNamespace(metrics_reg=CollectorRegistry())
+        bot.metrics = PrometheusMon(bot)
+        self.addCleanup(self.unregister, bot.metrics)
+        self.addCleanup(setattr, Utils, "BOT", Utils.BOT)
+        Utils.BOT = bot
+        await self.give_up(1, Retry.FAILURE_THRESHOLD)
+        await self.give_up(2, Retry.FAILURE_THRESHOLD)
+
+        def sample(state):
+            return gauge.labels(route="send", state=state)._value.get()
+
+        gauge = bot.metrics.discord_circuit_state
+
+        self.assertEqual(2, sample("open"))
+        self.assertEqual(0, sample("half_open"))
+        self.cool_down(Retry.get_breaker("send", 1))
+        await Retry.call("send", FlakyCall(), scope=1)
+        self.assertEqual(1, sample("open"))
+        # no series per channel
+        labels = {(sample.labels["route"], sample.labels["state"]) for sample in gauge.collect()[0].samples}
+        self.assertEqual({("send", "open"), ("send", "half_open")}, labels)
+
+    async def test_idle_breakers_dropped(self):
+        await Retry.call("send", FlakyCall(), scope=1)
+        await self.give_up(2, Retry.FAILURE_THRESHOLD)
+        await Retry.call("send", FlakyCall(), scope=3)
+        later = time.monotonic() + Retry.IDLE_SECONDS + 1
+        Retry.BREAKERS["send:3"].used_at = later
+        Retry.prune(later)
+        # the open one is kept, so is the one used since
+        self.assertEqual({"send:2", "send:3"}, set(Retry.BREAKERS))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,112 @@
+import asyncio
+import time
+import unittest
+from unittest import IsolatedAsyncioTestCase
+
+from harness import Harness
+
+from utils import Configuration
+from utils.TTLMap import TTLMap
+
+
+class TTLMapTest(IsolatedAsyncioTestCase):
+    """Run from the repo root: PYTHONPATH=. python test/TTLMapTest.py"""
+
+    async def asyncSetUp(self):
+        Configuration.PERSISTENT = dict()
+        Configuration.PERSISTENT_LOADED = True
+        Configuration.PERSISTENT_AIO_QUEUE = asyncio.Queue()
+
+    def saved(self, key):
+        """Apply the queued persistent writes, like the persistent queue worker does"""
+        while not Configuration.PERSISTENT_AIO_QUEUE.empty():
+            action = Configuration.PERSISTENT_AIO_QUEUE.get_nowait()
+            Configuration.PERSISTENT[action.key] = action.value
+        return Configuration.PERSISTENT.get(key)
+
+    async def test_expiry(self):
+        expired = []
+        ttl_map = TTLMap("test", ttl=60, on_expire=lambda key, value: expired.append(key))
+        ttl_map["old"] = 1
+        ttl_map.set("gone", 2, expires_at=time.time() - 1)
+        self.assertEqual({"old": 1}, dict(ttl_map))
+        self.assertEqual(["gone"], expired)
+
+    async def test_size_limit(self):
+        ttl_map = TTLMap("test", max_size=2)
+        for key in range(3):
+            ttl_map[key] = key
+        self.assertEqual([1, 2], list(ttl_map))
+        self.assertEqual(1, ttl_map.evictions)
+
+    async def test_persistence(self):
+        ttl_map = TTLMap("test", ttl=60, persist_key="test_map", key_type=int)
+        ttl_map[5] = "five"
+        self.saved("test_map")
+        self.assertEqual({5: "five"}, dict(TTLMap("test", persist_key="test_map", key_type=int)))
+
+    async def test_initial_is_saved(self):
+        # the old format is still what get_persistent_var returns, the converted entries must win
+        Configuration.PERSISTENT["test_map"] = {"5": {"old": "format"}}
+        expired = []
+        initial = {"5": ["five", time.time() + 60], "6": ["six", time.time() - 1]}
+        ttl_map = TTLMap("test", persist_key="test_map", key_type=int, initial=initial,
+                         on_expire=lambda key, value: expired.append(key))
+        self.assertEqual({5: "five"}, dict(ttl_map))
+        self.assertEqual([6], expired)
+        self.assertEqual(["5"], list(self.saved("test_map")))
+
+
+class UpgradeTest(IsolatedAsyncioTestCase):
+    """Cogs converting state saved before it moved onto TTLMaps"""
+
+    async def start(self, cog, persistent):
+        """Boot with the old format saved, then let the cog load it"""
+        await self.harness.boot()
+        self.addAsyncCleanup(self.harness.stop)
+        Configuration.PERSISTENT.update(persistent)
+        await self.harness.gateway.connect()
+        await Configuration.PERSISTENT_AIO_QUEUE.join()
+        return self.harness.bot.get_cog(cog)
+
+    async def test_mischief_names(self):
+        self.harness = Harness(cogs=["Mischief"])
+        guild_id = int(self.harness.guild["id"])
+        member_id = self.harness.member["id"]
+        now = int(time.time())
+        name = {"mischief_name": "spooky member", "name_normal": "member", "name_is_nick": 0}
+        cog = await self.start("Mischief", {f"name_cooldown_{guild_id}": {
+            member_id: {**name, "timestamp": now},
+            self.harness.owner["id"]: {**name, "timestamp": now - 3600},
+        }})
+
+        names = cog.name_cooldown[str(guild_id)]
+        self.assertEqual([member_id], list(names))
+        # the name that ran out while the bot was down is reset by name_task
+        self.assertEqual(1, names.expirations)
+        saved = Configuration.PERSISTENT[f"name_cooldown_{guild_id}"]
+        self.assertEqual([member_id], list(saved))
+        self.assertEqual(now + cog.name_cooldown_time, saved[member_id][1])
+
+    async def test_mod_actions(self):
+        self.harness = Harness(cogs=["AutoResponders"])
+        guild_id = int(self.harness.guild["id"])
+        channel_id = self.harness.general["id"]
+        now = time.time()
+        record = {"channel_id": 1, "message_id": 2, "formatted_response": "response"}
+        cog = await self.start("AutoResponders", {f"mod_messages_{guild_id}": {channel_id: {
+            "100": {**record, "event_datetime": now},
+            # older than the default expiry of a day
+            "101": {**record, "event_datetime": now - 2 * 86400},
+        }}})
+
+        actions = cog.mod_messages[guild_id]
+        self.assertEqual([100], list(actions))
+        self.assertEqual(int(channel_id), actions[100]["response_channel_id"])
+        # the action that ran out while the bot was down is marked expired by the clean task
+        self.assertEqual(1, actions.expirations)
+        self.assertEqual(["100"], list(Configuration.PERSISTENT[f"mod_messages_{guild_id}"]))
+
+
+if __name__ == "__main__":
+    unittest.main()
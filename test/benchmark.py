@@ -0,0 +1,408 @@
+"""
+Synthetic gateway load against the real cog listeners, on the hermetic harness (SQLite, fake gateway, outbox).
+Reports throughput, per-listener processing time percentiles, outbound API calls and allocations by module.
+
+A listener's processing time is the time its own code runs, between awaits. Time suspended, waiting on the database,
+the outbox or listeners of other events, isn't counted, so it doesn't depend on how many events are in flight.
+End-to-end latency under load (wall clock from dispatch to return) is reported next to it, but not compared.
+
+Run from the repo root:
+    PYTHONPATH=. python test/benchmark.py --duration 10 --messages-per-second 300 --json bench.json
+    PYTHONPATH=. python test/benchmark.py --baseline bench.json
+
+With --baseline the run fails (exit 1) when throughput drops or a listener's p50 processing time grows by more than
+--tolerance, or its p99 for listeners with at least P99_MIN_CALLS calls.
+Events are dispatched as fast as the loop allows unless --speed is given. Timings taken with allocation tracking
+on are slower across the board, so only compare runs made with the same flags.
+"""
+import argparse
+import asyncio
+import functools
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+from collections import Counter
+from dataclasses import dataclass, field, asdict
+
+from harness import Harness
+
+from utils.Database import AutoResponder
+
+DEFAULT_COGS = ["AutoResponders", "CustCommands", "DropBox", "Mischief", "ReactMonitor", "Welcomer", "WordCounter"]
+WORDS = ("the a sky light candle spirit wing cape friend home forest prairie valley wasteland vault eden krill "
+         "quest event season emote shard relive gate moth elder dance sing music sheet bug crash lag server").split()
+EMOJI = ["👍", "❤️", "😂", "🕯️", "✨", "🦀"]
+# processing times below this are noise: a GC pause or a busy machine adds a millisecond or two to a call
+NOISE_FLOOR_MS = 2.0
+# with fewer calls p99 is one of the few slowest calls, mostly a GC pause or the machine. only p50 is compared
+P99_MIN_CALLS = 1000
+
+
+@dataclass()
+class LoadProfile:
+    duration: float = 10.0
+    messages_per_second: float = 200.0
+    reactions_per_second: float = 50.0
+    # share of reaction events that remove an earlier reaction
+    reaction_remove_ratio: float = 0.3
+    member_updates_per_second: float = 5.0
+    guilds: int = 1
+    channels_per_guild: int = 3
+    members_per_guild: int = 50
+    length_mean: int = 60
+    length_stdev: int = 40
+    # chance a message mentions another member
+    mention_density: float = 0.1
+    # chance a message contains one of the triggers
+    trigger_rate: float = 0.05
+    triggers: list = field(default_factory=lambda: ["hello bot", "when is the event", "is the server down"])
+    seed: int = 1
+
+
+class ListenerStats:
+    def __init__(self):
+        # listener name -> list of seconds of processing
+        self.timings = dict()
+        # listener name -> list of seconds from call to return
+        self.latencies = dict()
+
+    def observe(self, name, busy, latency):
+        self.timings.setdefault(name, []).append(busy)
+        self.latencies.setdefault(name, []).append(latency)
+
+    def summary(self):
+        result = dict()
+        for name, values in sorted(self.timings.items()):
+            values = sorted(values)
+            latencies = sorted(self.latencies[name])
+            result[name] = {
+                "calls": len(values),
+                "p50_ms": round(percentile(values, 0.5) * 1000, 3),
+                "p99_ms": round(percentile(values, 0.99) * 1000, 3),
+                "max_ms": round(values[-1] * 1000, 3),
+                "total_ms": round(sum(values) * 1000, 3),
+                "latency_p50_ms": round(percentile(latencies, 0.5) * 1000, 3),
+                "latency_p99_ms": round(percentile(latencies, 0.99) * 1000, 3),
+            }
+        return result
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+
+class BusyTimer:
+    """Awaits a coroutine, adding up the time its code runs between suspensions in `busy`"""
+
+    def __init__(self, coro):
+        self.coro = coro
+        self.busy = 0.0
+
+    def __await__(self):
+        steps = self.coro.__await__()
+        value, error = None, None
+        while True:
+            started_at = time.perf_counter()
+            try:
+                yielded = steps.send(value) if error is None else steps.throw(error)
+            except StopIteration as done:
+                return done.value
+            finally:
+                self.busy += time.perf_counter() - started_at
+            try:
+                value, error = (yield yielded), None
+            except BaseException as e:
+                # cancellation, passed on to the listener
+                value, error = None, e
+
+
+def timed(name, listener, stats):
+    @functools.wraps(listener)
+    async def wrapper(*args, **kwargs):
+        started_at = time.perf_counter()
+        timer = BusyTimer(listener(*args, **kwargs))
+        try:
+            return await timer
+        finally:
+            stats.observe(name, timer.busy, time.perf_counter() - started_at)
+    return wrapper
+
+
+def instrument_listeners(bot, stats):
+    """Time every cog listener, and the bot's own on_message (which runs commands)"""
+    for event, listeners in bot.extra_events.items():
+        bot.extra_events[event] = [
+            timed(f"{type(listener.__self__).__name__}.{event}", listener, stats) for listener in listeners]
+    bot.on_message = timed(f"{bot.my_name}.on_message", bot.on_message, stats)
+
+
+def build_guilds(harness, profile):
+    """Add guilds, channels and members for the profile. Must run before the harness boots"""
+    gateway = harness.gateway
+    guilds = [harness.guild] + [gateway.guild(f"Guild {i}") for i in range(1, profile.guilds)]
+    layout = []
+    for index, guild in enumerate(guilds):
+        channels = [channel for channel in guild["channels"] if channel["name"] != "bot-log"]
+        channels += [gateway.channel(guild, f"chat-{i}") for i in range(len(channels), profile.channels_per_guild)]
+        members = [gateway.user(f"member {index}-{i}") for i in range(profile.members_per_guild)]
+        for user in members:
+            gateway.member(guild, user)
+        layout.append((guild, channels, members))
+    return layout
+
+
+async def seed_triggers(layout, triggers):
+    for guild, channels, members in layout:
+        await AutoResponder.bulk_create([
+            AutoResponder(serverid=int(guild["id"]), trigger=trigger, response=f"auto response to {trigger}", flags=1)
+            for trigger in triggers])
+
+
+def get_arrivals(rng, rate, duration):
+    arrivals = []
+    t = 0.0
+    while rate > 0:
+        t += rng.expovariate(rate)
+        if t >= duration:
+            break
+        arrivals.append(t)
+    return arrivals
+
+
+def get_content(rng, profile, mention=None):
+    length = max(1, min(2000, int(rng.gauss(profile.length_mean, profile.length_stdev))))
+    words = []
+    if rng.random() < profile.trigger_rate:
+        words.append(rng.choice(profile.triggers))
+    if mention is not None:
+        words.append(f"<@{mention['id']}>")
+    while sum(len(word) + 1 for word in words) < length:
+        words.append(rng.choice(WORDS))
+    rng.shuffle(words)
+    return " ".join(words)[:2000]
+
+
+def generate_events(harness, layout, profile):
+    """
+    Synthetic traffic as gateway events in time order
+    :return: list of {"t": seconds from start, "event": gateway event name, "data": payload}
+    """
+    rng = random.Random(profile.seed)
+    gateway = harness.gateway
+    streams = [(t, "message") for t in get_arrivals(rng, profile.messages_per_second, profile.duration)]
+    streams += [(t, "reaction") for t in get_arrivals(rng, profile.reactions_per_second, profile.duration)]
+    streams += [(t, "member") for t in get_arrivals(rng, profile.member_updates_per_second, profile.duration)]
+    streams.sort()
+
+    events = []
+    recent_messages = []
+    reactions = []
+    for t, kind in streams:
+        guild, channels, members = rng.choice(layout)
+        user = rng.choice(members)
+        if kind == "message":
+            mention = rng.choice(members) if rng.random() < profile.mention_density else None
+            data = gateway.message_payload(rng.choice(channels)["id"], user, get_content(rng, profile, mention),
+                                           mentions=[mention] if mention else [])
+            recent_messages = recent_messages[-49:] + [data]
+            events.append({"t": t, "event": "MESSAGE_CREATE", "data": data})
+        elif kind == "reaction" and recent_messages:
+            if reactions and rng.random() < profile.reaction_remove_ratio:
+                message, user, emoji = reactions.pop(rng.randrange(len(reactions)))
+                data = gateway.reaction_payload(message, user, emoji)
+                data.pop("member", None)
+                events.append({"t": t, "event": "MESSAGE_REACTION_REMOVE", "data": data})
+            else:
+                message = rng.choice(recent_messages)
+                emoji = rng.choice(EMOJI)
+                reactions.append((message, user, emoji))
+                events.append({"t": t, "event": "MESSAGE_REACTION_ADD",
+                               "data": gateway.reaction_payload(message, user, emoji)})
+        elif kind == "member":
+            data = gateway.member_update_payload(guild, user, nick=f"{user['username']} {rng.randrange(1000)}")
+            # later updates change the same dict. the event keeps the state at this point
+            events.append({"t": t, "event": "GUILD_MEMBER_UPDATE", "data": dict(data)})
+    return events
+
+
+async def run_events(gateway, events, speed=None):
+    """
+    Feed events to the bot and wait for the handlers to finish
+    :param speed: 1.0 keeps the original timing, 2.0 runs twice as fast. None sends as fast as possible
+    :return: seconds from the first event until every handler was done
+    """
+    loop = asyncio.get_running_loop()
+    started_at = loop.time()
+    for event in events:
+        if speed:
+            delay = event["t"] / speed - (loop.time() - started_at)
+            if delay > 0:
+                await asyncio.sleep(delay)
+        else:
+            # a websocket yields between frames too
+            await asyncio.sleep(0)
+        gateway.send(event["event"], event["data"])
+    await gateway.settle(timeout=300)
+    return loop.time() - started_at
+
+
+def get_module(filename):
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    if filename.startswith(root):
+        return os.path.relpath(filename, root)
+    return "other"
+
+
+async def measure(harness, events, speed=None, allocations=True):
+    """
+    Run events through a connected harness
+    :return: report dict
+    """
+    stats = ListenerStats()
+    instrument_listeners(harness.bot, stats)
+    harness.outbox.clear()
+
+    if allocations:
+        tracemalloc.start()
+        before = tracemalloc.take_snapshot()
+    elapsed = await run_events(harness.gateway, events, speed)
+
+    report = {
+        "events": len(events),
+        "event_types": dict(Counter(event["event"] for event in events)),
+        "elapsed_seconds": round(elapsed, 3),
+        "throughput": round(len(events) / elapsed, 1) if elapsed else 0.0,
+        "speed": speed,
+        # what the listener figures measure. reports from before had end-to-end latency here
+        "timing": "processing",
+        "listeners": stats.summary(),
+        "outbound": dict(sorted(Counter(f"{e.method} {e.path}" for e in harness.outbox.entries).items())),
+        "allocations": None,
+    }
+    if allocations:
+        after = tracemalloc.take_snapshot()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        by_module = Counter()
+        for stat in after.compare_to(before, "filename"):
+            by_module[get_module(stat.traceback[0].filename)] += stat.size_diff
+        report["allocations"] = {
+            "peak_bytes": peak,
+            "net_bytes_by_module": dict(by_module.most_common(15)),
+        }
+    return report
+
+
+def compare(report, baseline, tolerance):
+    """:return: list of regressions, empty if none"""
+    regressions = []
+    if bool(report["allocations"]) != bool(baseline["allocations"]):
+        regressions.append("allocation tracking differs from the baseline run. timings are not comparable")
+        return regressions
+    if report.get("timing") != baseline.get("timing"):
+        regressions.append("the baseline has end-to-end latencies, not processing times. record a new one")
+        return regressions
+    if report["throughput"] < baseline["throughput"] * (1 - tolerance):
+        regressions.append(f"throughput {baseline['throughput']} -> {report['throughput']} events/s")
+    for name, stats in report["listeners"].items():
+        old = baseline["listeners"].get(name)
+        if old is None:
+            continue
+        keys = ["p50_ms", "p99_ms"] if min(stats["calls"], old["calls"]) >= P99_MIN_CALLS else ["p50_ms"]
+        for key in keys:
+            if stats[key] > max(old[key], NOISE_FLOOR_MS) * (1 + tolerance):
+                regressions.append(f"{name} {key[:3]} {old[key]}ms -> {stats[key]}ms")
+    return regressions
+
+
+def format_report(report):
+    lines = [f"{report['events']} events in {report['elapsed_seconds']}s: {report['throughput']} events/s",
+             "", f"{'':<40} {'':>7} {'processing':^29} {'end-to-end':^19}",
+             f"{'listener':<40} {'calls':>7} {'p50 ms':>9} {'p99 ms':>9} {'max ms':>9} {'p50 ms':>9} {'p99 ms':>9}"]
+    for name, stats in report["listeners"].items():
+        lines.append(f"{name:<40} {stats['calls']:>7} {stats['p50_ms']:>9} {stats['p99_ms']:>9} {stats['max_ms']:>9} "
+                     f"{stats['latency_p50_ms']:>9} {stats['latency_p99_ms']:>9}")
+    lines += ["", "outbound API calls:"]
+    lines += [f"  {count:>7} {route}" for route, count in report["outbound"].items()]
+    if report["allocations"]:
+        lines += ["", f"peak traced memory {report['allocations']['peak_bytes'] / 1024:.0f} KiB",
+                  "net allocations by module:"]
+        lines += [f"  {size / 1024:>9.1f} KiB {module}"
+                  for module, size in report["allocations"]["net_bytes_by_module"].items()]
+    return "\n".join(lines)
+
+
+async def run(args):
+    profile = LoadProfile(
+        duration=args.duration,
+        messages_per_second=args.messages_per_second,
+        reactions_per_second=args.reactions_per_second,
+        member_updates_per_second=args.member_updates_per_second,
+        guilds=args.guilds,
+        members_per_guild=args.members,
+        length_mean=args.length_mean,
+        length_stdev=args.length_stdev,
+        mention_density=args.mention_density,
+        trigger_rate=args.trigger_rate,
+        seed=args.seed)
+    if args.triggers:
+        profile.triggers = args.triggers
+
+    harness = Harness(cogs=args.cogs)
+    layout = build_guilds(harness, profile)
+    await harness.boot()
+    await seed_triggers(layout, profile.triggers)
+    await harness.gateway.connect()
+    try:
+        events = generate_events(harness, layout, profile)
+        report = await measure(harness, events, args.speed, not args.no_allocations)
+        report["profile"] = asdict(profile)
+        report["cogs"] = args.cogs
+    finally:
+        await harness.stop()
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Synthetic gateway load benchmark")
+    parser.add_argument("--cogs", nargs="+", default=DEFAULT_COGS)
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds of generated traffic")
+    parser.add_argument("--messages-per-second", type=float, default=200.0)
+    parser.add_argument("--reactions-per-second", type=float, default=50.0)
+    parser.add_argument("--member-updates-per-second", type=float, default=5.0)
+    parser.add_argument("--guilds", type=int, default=1)
+    parser.add_argument("--members", type=int, default=50, help="members per guild")
+    parser.add_argument("--length-mean", type=int, default=60, help="mean message length in characters")
+    parser.add_argument("--length-stdev", type=int, default=40)
+    parser.add_argument("--mention-density", type=float, default=0.1)
+    parser.add_argument("--trigger-rate", type=float, default=0.05)
+    parser.add_argument("--triggers", nargs="*", help="autoresponder triggers seeded in every guild")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--speed", type=float, help="replay at this multiple of real time instead of flooding")
+    parser.add_argument("--no-allocations", action="store_true", help="skip tracemalloc for cleaner timings")
+    parser.add_argument("--json", help="write the report here")
+    parser.add_argument("--baseline", help="report from an earlier run to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    print(format_report(report))
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump(report, file, indent=2, sort_keys=True)
+    if args.baseline:
+        with open(args.baseline) as file:
+            regressions = compare(report, json.load(file), args.tolerance)
+        if regressions:
+            print("\nREGRESSIONS:\n" + "\n".join(f"  {line}" for line in regressions))
+            sys.exit(1)
+        print("\nno regressions against baseline")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,534 @@
+"""
+Hermetic test harness. Boots Skybot against in-memory SQLite and a scripted Discord gateway, and records every
+HTTP request the bot makes instead of sending it. Nothing leaves the process, so tests run without MySQL,
+a bot token or network access.
+
+Run from the repo root with the repo on the path, e.g. `PYTHONPATH=. python test/HarnessTest.py`
+
+    harness = Harness(cogs=["Basic"])
+    await harness.start()
+    await harness.gateway.message(harness.general, harness.owner, "!ping")
+    entry = await harness.outbox.wait_for(lambda e: e.content == ":ping_pong:")
+    await harness.stop()
+
+Raw SQL written for MySQL (DATE_FORMAT etc.) will not run on SQLite.
+"""
+import asyncio
+import itertools
+import json
+import os
+import re
+import tempfile
+import typing
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+
+# must be set before utils.tortoise_settings is imported
+os.environ.setdefault("BOT_DB_ENGINE", "sqlite")
+os.environ.setdefault("BOT_DB", ":memory:")
+
+from utils import Configuration
+
+BASE_CONFIG = {
+    "bot_prefix": "!",
+    "bot_name": "testbot",
+    "token": "",
+    "DATABASE_ENGINE": "sqlite",
+    "DATABASE_NAME": ":memory:",
+    "ADMINS": [],
+    "EMOJI": {},
+    "cogs": [],
+    "admin_roles": [],
+    "max_attachments": 3,
+    "question_timeout_seconds": 5,
+    "bug_workers_min": 1,
+    "bug_workers_max": 10,
+}
+
+# get_var writes missing keys back to config.json. tests must not touch the real file
+Configuration.MASTER_CONFIG = dict(BASE_CONFIG)
+Configuration.MASTER_LOADED = True
+Configuration.save = lambda: None
+
+import prometheus_client as prom
+from discord import AllowedMentions, ClientUser, NotFound
+from discord.ext import commands
+from discord.http import Route
+from discord.utils import time_snowflake
+from prometheus_client import CollectorRegistry
+
+import sky
+from utils import Utils, Questions, StickyMessages, DuplicateIndex
+
+ADMINISTRATOR = 1 << 3
+# add reactions, view channel, send messages, embed links, attach files, read message history
+DEFAULT_PERMISSIONS = 0x1cc40
+ROUTE_PARAM = re.compile(r"\\{(\w+)\\}")
+
+
+def now_iso():
+    return datetime.now(timezone.utc).isoformat()
+
+
+@dataclass()
+class FakeResponse:
+    """Enough of an aiohttp response for discord.HTTPException"""
+    status: int
+    reason: str
+
+
+@dataclass()
+class OutboxEntry:
+    method: str
+    # route template, e.g. /channels/{channel_id}/messages
+    path: str
+    params: dict
+    json: typing.Any = None
+    files: list = field(default_factory=list)
+    reason: str = None
+    response: typing.Any = None
+
+    @property
+    def content(self):
+        return self.json.get("content") if isinstance(self.json, dict) else None
+
+    @property
+    def embeds(self):
+        return self.json.get("embeds", []) if isinstance(self.json, dict) else []
+
+
+class Outbox:
+    """
+    Stands in for HTTPClient.request. Every request is recorded, and answered by a responder for its route if there
+    is one. Unanswered requests return None, like an empty 204 response
+    """
+
+    def __init__(self, gateway):
+        self.gateway = gateway
+        self.entries = []
+        self.condition = asyncio.Condition()
+        # (method, route template) -> function taking the OutboxEntry and returning the response payload
+        self.responders = dict()
+        self.respond("POST", "/channels/{channel_id}/messages", self.create_message)
+        self.respond("PATCH", "/channels/{channel_id}/messages/{message_id}", self.edit_message)
+        self.respond("GET", "/channels/{channel_id}/messages/{message_id}", self.get_message)
+        self.respond("DELETE", "/channels/{channel_id}/messages/{message_id}", self.delete_message)
+        self.respond("POST", "/users/@me/channels", self.create_dm)
+        self.respond("GET", "/users/{user_id}", self.get_user)
+        self.respond("GET", "/guilds/{guild_id}/members/{user_id}", self.get_member)
+
+    def respond(self, method, path, responder):
+        self.responders[(method, path)] = responder
+
+    async def request(self, route, *, files=None, form=None, **kwargs):
+        payload = kwargs.get("json")
+        if form:
+            # multipart requests carry the message as a payload_json part next to the files
+            for part in form:
+                if part["name"] == "payload_json":
+                    payload = json.loads(part["value"])
+        entry = OutboxEntry(
+            method=route.method,
+            path=route.path,
+            params=get_route_params(route),
+            json=payload,
+            files=[file.filename for file in files or []],
+            reason=kwargs.get("reason"))
+        responder = self.responders.get((route.method, route.path))
+        async with self.condition:
+            self.entries.append(entry)
+            self.condition.notify_all()
+        if responder is not None:
+            entry.response = responder(entry)
+        return entry.response
+
+    def find(self, predicate=None):
+        return [entry for entry in self.entries if predicate is None or predicate(entry)]
+
+    def messages(self, channel_id=None):
+        """Messages the bot sent, optionally only those to one channel"""
+        return self.find(lambda e: e.method == "POST" and e.path == "/channels/{channel_id}/messages"
+                         and (channel_id is None or e.params["channel_id"] == str(channel_id)))
+
+    async def wait_for(self, predicate=None, timeout=5.0):
+        """
+        Wait for a request matching predicate. Requests recorded before the call count too
+        :return: the first matching entry
+        """
+        async with self.condition:
+            await asyncio.wait_for(self.condition.wait_for(lambda: self.find(predicate)), timeout)
+        return self.find(predicate)[0]
+
+    def clear(self):
+        self.entries.clear()
+
+    def create_message(self, entry):
+        channel_id = int(entry.params["channel_id"])
+        payload = entry.json or {}
+        data = self.gateway.message_payload(
+            channel_id,
+            self.gateway.bot_user,
+            payload.get("content") or "",
+            embeds=payload.get("embeds", []),
+            attachments=[self.gateway.attachment_payload(name) for name in entry.files],
+            components=payload.get("components", []))
+        # discord echoes the bot's own messages back over the gateway
+        asyncio.get_running_loop().call_soon(self.gateway.send, "MESSAGE_CREATE", data)
+        return data
+
+    def edit_message(self, entry):
+        data = self.get_message(entry)
+        payload = entry.json or {}
+        for key in ("content", "embeds", "components"):
+            if key in payload:
+                data[key] = payload[key] if payload[key] is not None else ([] if key != "content" else "")
+        data["edited_timestamp"] = now_iso()
+        return data
+
+    def get_message(self, entry):
+        data = self.gateway.messages.get(int(entry.params["message_id"]))
+        if data is None:
+            raise NotFound(FakeResponse(404, "Not Found"), {"code": 10008, "message": "Unknown Message"})
+        return data
+
+    def delete_message(self, entry):
+        data = self.get_message(entry)
+        self.gateway.messages.pop(int(data["id"]), None)
+        event = {"id": data["id"], "channel_id": data["channel_id"]}
+        if "guild_id" in data:
+            event["guild_id"] = data["guild_id"]
+        asyncio.get_running_loop().call_soon(self.gateway.send, "MESSAGE_DELETE", event)
+        return None
+
+    def create_dm(self, entry):
+        user = self.gateway.users[int(entry.json["recipient_id"])]
+        return {"id": str(self.gateway.dm_channel_id(user)), "type": 1, "last_message_id": None,
+                "recipients": [user]}
+
+    def get_user(self, entry):
+        user = self.gateway.users.get(int(entry.params["user_id"])) if entry.params["user_id"].isdigit() else None
+        if user is None:
+            raise NotFound(FakeResponse(404, "Not Found"), {"code": 10013, "message": "Unknown User"})
+        return user
+
+    def get_member(self, entry):
+        member = self.gateway.members.get((int(entry.params["guild_id"]), int(entry.params["user_id"])))
+        if member is None:
+            raise NotFound(FakeResponse(404, "Not Found"), {"code": 10007, "message": "Unknown Member"})
+        return member
+
+
+def get_route_params(route):
+    """Recover the parameters a Route was built with by matching its url against its template"""
+    pattern = ROUTE_PARAM.sub(r"(?P<\1>[^/?]+)", re.escape(route.path))
+    match = re.match(pattern, route.url[len(Route.BASE):])
+    return match.groupdict() if match else dict()
+
+
+class FakeGateway:
+    """
+    Scripted gateway. Builds guild, channel, member and message payloads and feeds them through discord.py's own
+    gateway parsers, so cogs see the same objects and events they get in production
+    """
+
+    def __init__(self):
+        self.ids = itertools.count(1)
+        self.bot = None
+        # id -> payload
+        self.guilds = dict()
+        self.users = dict()
+        self.messages = dict()
+        # (guild id, user id) -> member payload
+        self.members = dict()
+        # channel id -> guild id
+        self.channel_guilds = dict()
+        # user id -> dm channel id
+        self.dm_channels = dict()
+        self.bot_user = self.user("testbot", bot=True)
+
+    def next_id(self):
+        # snowflakes in time order, so last_message_id comparisons behave
+        return time_snowflake(datetime.now(timezone.utc)) + next(self.ids)
+
+    def user(self, name, bot=False, user_id=None):
+        data = {"id": str(user_id or self.next_id()), "username": name, "global_name": name, "discriminator": "0",
+                "avatar": None, "bot": bot, "public_flags": 0}
+        self.users[int(data["id"])] = data
+        return data
+
+    def guild(self, name="Test Guild", owner=None, guild_id=None):
+        guild_id = int(guild_id or self.next_id())
+        owner = owner or self.user(f"{name} owner")
+        data = {
+            "id": str(guild_id), "name": name, "owner_id": owner["id"], "unavailable": False, "large": False,
+            "features": [], "emojis": [], "stickers": [], "channels": [], "threads": [], "members": [],
+            "presences": [], "voice_states": [], "joined_at": now_iso(), "preferred_locale": "en-US",
+            "premium_tier": 0, "mfa_level": 0, "nsfw_level": 0, "verification_level": 0, "afk_timeout": 300,
+            "explicit_content_filter": 0, "default_message_notifications": 0, "system_channel_flags": 0,
+            "roles": [self.role_payload(guild_id, "@everyone", DEFAULT_PERMISSIONS, position=0, role_id=guild_id)],
+        }
+        self.guilds[guild_id] = data
+        self.member(data, owner)
+        bot_role = self.role(data, "testbot", ADMINISTRATOR)
+        self.member(data, self.bot_user, roles=[bot_role])
+        return data
+
+    @staticmethod
+    def role_payload(guild_id, name, permissions, position=1, role_id=None):
+        return {"id": str(role_id or guild_id), "name": name, "permissions": str(permissions), "position": position,
+                "color": 0, "hoist": False, "managed": False, "mentionable": False, "flags": 0}
+
+    def role(self, guild, name, permissions=0, role_id=None):
+        data = self.role_payload(guild["id"], name, permissions, len(guild["roles"]), role_id or self.next_id())
+        guild["roles"].append(data)
+        return data
+
+    def channel(self, guild, name, channel_id=None):
+        data = {"id": str(channel_id or self.next_id()), "type": 0, "guild_id": guild["id"], "name": name,
+                "position": len(guild["channels"]), "permission_overwrites": [], "nsfw": False, "parent_id": None,
+                "topic": None, "last_message_id": None, "rate_limit_per_user": 0}
+        guild["channels"].append(data)
+        self.channel_guilds[int(data["id"])] = int(guild["id"])
+        return data
+
+    def member(self, guild, user, roles=()):
+        data = {"user": user, "roles": [role["id"] for role in roles], "joined_at": now_iso(), "deaf": False,
+                "mute": False, "flags": 0, "pending": False}
+        guild["members"].append(data)
+        guild["member_count"] = len(guild["members"])
+        self.members[(int(guild["id"]), int(user["id"]))] = data
+        return data
+
+    def dm_channel_id(self, user):
+        if int(user["id"]) not in self.dm_channels:
+            self.dm_channels[int(user["id"])] = self.next_id()
+        return self.dm_channels[int(user["id"])]
+
+    def attachment_payload(self, filename, size=1024, content_type=None):
+        attachment_id = self.next_id()
+        url = f"https://cdn.discordapp.com/attachments/0/{attachment_id}/{filename}"
+        return {"id": str(attachment_id), "filename": filename, "size": size, "url": url, "proxy_url": url,
+                "content_type": content_type}
+
+    def message_payload(self, channel_id, author, content="", embeds=(), attachments=(), components=(),
+                        mentions=()):
+        data = {
+            "id": str(self.next_id()), "channel_id": str(channel_id), "author": author, "content": content,
+            "timestamp": now_iso(), "edited_timestamp": None, "tts": False, "mention_everyone": False,
+            "mentions": list(mentions), "mention_roles": [], "attachments": list(attachments), "embeds": list(embeds),
+            "components": list(components), "pinned": False, "type": 0, "flags": 0,
+        }
+        guild_id = self.channel_guilds.get(int(channel_id))
+        if guild_id is not None:
+            data["guild_id"] = str(guild_id)
+            member = self.members.get((guild_id, int(author["id"])))
+            if member is not None:
+                data["member"] = {key: value for key, value in member.items() if key != "user"}
+        self.messages[int(data["id"])] = data
+        return data
+
+    def send(self, event, data):
+        """Feed a raw gateway event to the bot, the way the websocket does"""
+        self.bot.dispatch("socket_event_type", event)
+        self.bot._connection.parsers[event](data)
+
+    async def connect(self):
+        """READY followed by GUILD_CREATE for every guild built so far. Returns once on_ready handlers are done"""
+        self.send("READY", {
+            "v": 10, "user": self.bot_user, "session_id": "harness", "resume_gateway_url": "wss://localhost",
+            "guilds": [{"id": guild["id"], "unavailable": True} for guild in self.guilds.values()],
+            "application": {"id": self.bot_user["id"], "flags": 0}, "private_channels": [], "relationships": [],
+        })
+        for guild in self.guilds.values():
+            self.send("GUILD_CREATE", guild)
+        await self.bot.wait_until_ready()
+        await self.settle()
+
+    async def settle(self, timeout=2.0):
+        """
+        Wait for the event handlers discord.py has scheduled to finish. Handlers still waiting after the timeout
+        (e.g. on a question dialog) are left running. Use Outbox.wait_for for work handed off to other tasks
+        """
+        deadline = asyncio.get_running_loop().time() + timeout
+        # let call_soon echoes and freshly scheduled handlers start
+        await asyncio.sleep(0)
+        while True:
+            pending = [task for task in asyncio.all_tasks()
+                       if task.get_name().startswith("discord.py: ") and not task.done()]
+            remaining = deadline - asyncio.get_running_loop().time()
+            if not pending or remaining <= 0:
+                return
+            await asyncio.wait(pending, timeout=remaining)
+            await asyncio.sleep(0)
+
+    async def message(self, channel, author, content, attachments=()):
+        """
+        A user posts in a guild channel
+        :return: the message object the bot received
+        """
+        data = self.message_payload(channel["id"], author, content, attachments=attachments)
+        self.send("MESSAGE_CREATE", data)
+        await self.settle()
+        return self.bot._connection._get_message(int(data["id"]))
+
+    async def dm(self, author, content, attachments=()):
+        """A user DMs the bot"""
+        data = self.message_payload(self.dm_channel_id(author), author, content, attachments=attachments)
+        self.send("MESSAGE_CREATE", data)
+        await self.settle()
+        return self.bot._connection._get_message(int(data["id"]))
+
+    def reaction_payload(self, message, user, emoji):
+        """
+        :param message: message payload or object with id and channel
+        :param emoji: unicode emoji, or a custom emoji payload dict with id and name
+        """
+        message_id = int(message["id"] if isinstance(message, dict) else message.id)
+        channel_id = int(message["channel_id"] if isinstance(message, dict) else message.channel.id)
+        data = {"user_id": user["id"], "channel_id": str(channel_id), "message_id": str(message_id),
+                "emoji": emoji if isinstance(emoji, dict) else {"id": None, "name": emoji}, "type": 0}
+        guild_id = self.channel_guilds.get(channel_id)
+        if guild_id is not None:
+            data["guild_id"] = str(guild_id)
+            if (guild_id, int(user["id"])) in self.members:
+                data["member"] = self.members[(guild_id, int(user["id"]))]
+        return data
+
+    def member_update_payload(self, guild, user, **changes):
+        """Apply changes (nick, roles, pending...) to a member and build the GUILD_MEMBER_UPDATE for it"""
+        member = self.members[(int(guild["id"]), int(user["id"]))]
+        member.update(changes)
+        return {**member, "guild_id": guild["id"]}
+
+    async def reaction(self, message, user, emoji):
+        """A user reacts to a message"""
+        self.send("MESSAGE_REACTION_ADD", self.reaction_payload(message, user, emoji))
+        await self.settle()
+
+    async def reaction_remove(self, message, user, emoji):
+        data = self.reaction_payload(message, user, emoji)
+        data.pop("member", None)
+        self.send("MESSAGE_REACTION_REMOVE", data)
+        await self.settle()
+
+    async def member_update(self, guild, user, **changes):
+        self.send("GUILD_MEMBER_UPDATE", self.member_update_payload(guild, user, **changes))
+        await self.settle()
+
+    async def member_join(self, guild, user, roles=()):
+        data = self.member(guild, user, roles)
+        self.send("GUILD_MEMBER_ADD", {**data, "guild_id": guild["id"]})
+        await self.settle()
+
+    async def member_remove(self, guild, user):
+        self.members.pop((int(guild["id"]), int(user["id"])), None)
+        guild["members"] = [member for member in guild["members"] if member["user"]["id"] != user["id"]]
+        guild["member_count"] = len(guild["members"])
+        self.send("GUILD_MEMBER_REMOVE", {"guild_id": guild["id"], "user": user})
+        await self.settle()
+
+
+class HarnessBot(sky.Skybot):
+
+    def __init__(self, *args, **kwargs):
+        # metrics are registered per bot. a registry per instance lets each test boot its own bot
+        self.metrics_reg = CollectorRegistry()
+        super().__init__(*args, **kwargs)
+
+
+async def persistent_data_job(action: Configuration.PersistentAction):
+    # keep persistent vars in memory only
+    if action.delete:
+        Configuration.PERSISTENT.pop(action.key, None)
+    else:
+        Configuration.PERSISTENT[action.key] = action.value
+
+
+class Harness:
+    """
+    A booted bot with one guild (channels general and bot-log, an owner and one member), a fake gateway and an outbox
+    :param cogs: cogs to load, by name
+    :param config: config vars to set on top of BASE_CONFIG
+    """
+
+    def __init__(self, cogs=(), config=None):
+        self.cogs = list(cogs)
+        self.config = config or dict()
+        self.gateway = FakeGateway()
+        self.outbox = Outbox(self.gateway)
+        self.owner = self.gateway.user("owner")
+        self.member = self.gateway.user("member")
+        self.guild = self.gateway.guild(owner=self.owner)
+        self.gateway.member(self.guild, self.member)
+        self.general = self.gateway.channel(self.guild, "general")
+        self.bot_log = self.gateway.channel(self.guild, "bot-log")
+        self.data_dir = tempfile.TemporaryDirectory()
+        self.bot = None
+        self.persistent_task = None
+
+    def configure(self):
+        Configuration.MASTER_CONFIG = {
+            **BASE_CONFIG,
+            "cogs": self.cogs,
+            "guild_id": int(self.guild["id"]),
+            "log_channel": int(self.bot_log["id"]),
+            "duplicate_index_file": os.path.join(self.data_dir.name, "duplicate_index.bin"),
+            **self.config,
+        }
+        Configuration.PERSISTENT = dict()
+        Configuration.PERSISTENT_LOADED = True
+        # module level state left over from an earlier harness
+        Utils.GUILD_CONFIGS.clear()
+        Questions.DIALOGS.clear()
+        StickyMessages.STICKIES.clear()
+        DuplicateIndex.loaded = False
+
+    async def start(self):
+        await self.boot()
+        await self.gateway.connect()
+
+    async def boot(self):
+        """Everything up to the gateway connection: cogs are loaded and the database is up, but not ready yet"""
+        self.configure()
+        Configuration.PERSISTENT_AIO_QUEUE = asyncio.Queue()
+        self.persistent_task = asyncio.create_task(
+            sky.queue_worker("Persistent Queue", Configuration.PERSISTENT_AIO_QUEUE, persistent_data_job))
+
+        # same intents and caches as production, from config
+        options = sky.get_gateway_options()
+        # chunking needs a websocket. the fake gateway sends every member in GUILD_CREATE instead
+        options["chunk_guilds_at_startup"] = False
+        self.bot = HarnessBot(
+            loop=asyncio.get_running_loop(),
+            command_prefix=commands.when_mentioned_or(Configuration.get_var("bot_prefix")),
+            case_insensitive=True,
+            allowed_mentions=AllowedMentions(everyone=False, users=True, roles=False, replied_user=True),
+            guild_ready_timeout=0.05,
+            **options)
+        self.bot.help_command = commands.DefaultHelpCommand(command_attrs=dict(name='snelp', checks=[sky.can_help]))
+        self.bot.owner_id = int(self.owner["id"])
+        Utils.BOT = self.bot
+        self.gateway.bot = self.bot
+        self.bot.http.request = self.outbox.request
+
+        # what Client.login does, minus the token check and application info fetch
+        await self.bot._async_setup_hook()
+        state = self.bot._connection
+        state.user = ClientUser(state=state, data=self.gateway.bot_user)
+        state.application_id = int(self.gateway.bot_user["id"])
+        await self.bot.setup_hook()
+
+    async def stop(self):
+        self.bot.loaded = False
+        await self.bot.close()
+        self.persistent_task.cancel()
+        await asyncio.gather(self.persistent_task, return_exceptions=True)
+        # metrics also land in the default registry. drop them so the next bot can register its own
+        for metric in vars(self.bot.metrics).values():
+            if isinstance(metric, prom.metrics.MetricWrapperBase):
+                try:
+                    prom.REGISTRY.unregister(metric)
+                except KeyError:
+                    pass
+        Utils.BOT = None
+        self.data_dir.cleanup()
@@ -0,0 +1,86 @@
+"""
+Memory the member cache costs per 10k members, in each gateway mode (see docs/memory.md), on the hermetic harness.
+
+Run from the repo root:
+    PYTHONPATH=. python test/member_memory.py --members 20000
+
+A guild with --members members (a third of them online, with an activity) is delivered in GUILD_CREATE, the way a
+startup chunk would deliver it, and the allocations that stay behind are counted with tracemalloc. Modes that don't
+chunk at startup only pay this for guilds a cog asks for, with BaseCog.get_members.
+"""
+import argparse
+import asyncio
+import gc
+import json
+import tracemalloc
+
+from harness import Harness
+
+MODES = {
+    # what sky.get_gateway_options does without config
+    "full": {},
+    # no presences, members only cached once a cog asks for them
+    "lean": {"intents": {"presences": False}, "member_cache_flags": {"joined": False},
+             "chunk_guilds_at_startup": False},
+    # what a guild costs in lean mode once a cog fetched its member list: members without presences. the harness
+    # can't chunk, so the members are cached from GUILD_CREATE, which needs the joined flag
+    "lean_fetched": {"intents": {"presences": False}},
+    # members intent off. no member lists at all, cogs that need them warn
+    "minimal": {"intents": {"members": False, "presences": False}},
+}
+
+
+def add_members(harness, count, presences=True):
+    gateway = harness.gateway
+    guild = harness.guild
+    for i in range(count):
+        user = gateway.user(f"member {i}")
+        gateway.member(guild, user)
+        if presences and i % 3 == 0:
+            guild["presences"].append({
+                "user": {"id": user["id"]}, "status": "online", "client_status": {"desktop": "online"},
+                "activities": [{"name": "Sky: Children of the Light", "type": 0, "created_at": 0}]})
+
+
+async def measure(mode, count):
+    harness = Harness(config=MODES[mode])
+    # the fake gateway sends whatever it is given. discord only sends presences with the presences intent
+    add_members(harness, count, MODES[mode].get("intents", dict()).get("presences", True))
+    await harness.boot()
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    try:
+        await harness.gateway.connect()
+        gc.collect()
+        after = tracemalloc.get_traced_memory()[0]
+        cached = len(harness.bot.get_guild(int(harness.guild["id"])).members)
+    finally:
+        tracemalloc.stop()
+        await harness.stop()
+    return {"mode": mode, "members": count, "cached_members": cached, "bytes": after - before,
+            "mb_per_10k_members": round((after - before) / count * 10000 / 1024 / 1024, 2)}
+
+
+async def run(args):
+    return [await measure(mode, args.members) for mode in args.modes]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Member cache memory per gateway mode")
+    parser.add_argument("--members", type=int, default=20000)
+    parser.add_argument("--modes", nargs="+", default=list(MODES), choices=list(MODES))
+    parser.add_argument("--json", help="write the results here")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+    print(f"{'mode':<10} {'cached':>8} {'MB per 10k members':>20}")
+    for result in results:
+        print(f"{result['mode']:<10} {result['cached_members']:>8} {result['mb_per_10k_members']:>20}")
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump(results, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,192 @@
+"""
+Replay gateway traffic captured by utils/GatewayRecorder.py (config `gateway_record_file`) into the cogs on the
+hermetic harness, and report per-cog processing time and outbound API calls.
+
+Processing time is the time the cogs' own listener code runs, between awaits (see benchmark.BusyTimer). Waiting on the
+database or behind other events isn't counted, so a flooded replay and a paced one give comparable figures.
+
+Run from the repo root:
+    PYTHONPATH=. python test/replay.py gateway.jsonl.gz --json before.json
+    PYTHONPATH=. python test/replay.py gateway.jsonl.gz --speed 10 --compare before.json
+
+Guilds, channels, members and roles are rebuilt from the ids seen in the recording. The busiest guild becomes the
+home guild. Without --speed events are sent as fast as possible, which gives the same result as any speed for
+handlers that don't depend on time. --speed only changes the end-to-end latencies, which are reported but not
+compared. Reports are JSON with sorted keys, so they diff cleanly.
+"""
+import argparse
+import asyncio
+import gzip
+import json
+import sys
+from collections import Counter
+
+from harness import Harness
+
+import benchmark
+
+DEFAULT_COGS = benchmark.DEFAULT_COGS + ["Krill"]
+
+
+def load_events(path, limit=None):
+    """
+    Read a recording. Sessions appended to the same file are laid end to end, and a tail cut off mid-write is dropped
+    :return: list of {"t", "event", "data"}
+    """
+    events = []
+    offset = 0.0
+    last = 0.0
+    try:
+        with gzip.open(path, "rt", encoding="utf-8") as file:
+            for line in file:
+                try:
+                    event = json.loads(line)
+                except json.JSONDecodeError:
+                    break
+                t = event["t"] + offset
+                if t < last:
+                    # a new recording session starts over at 0
+                    offset += last - t
+                    t = last
+                event["t"] = last = t
+                events.append(event)
+                if limit and len(events) >= limit:
+                    break
+    except EOFError:
+        pass
+    return events
+
+
+def get_event_user(data):
+    return data.get("author") or data.get("user") or (data.get("member") or {}).get("user")
+
+
+def build_world(harness, events):
+    """
+    Create the guilds, channels, members and roles the events refer to, before the harness boots
+    :return: id of the guild with the most events
+    """
+    gateway = harness.gateway
+    activity = Counter()
+    for event in events:
+        data = event["data"]
+        if event["event"] == "MESSAGE_CREATE":
+            # lets fetches of recorded messages succeed
+            gateway.messages[int(data["id"])] = data
+
+        user = get_event_user(data)
+        if user is not None and int(user["id"]) not in gateway.users:
+            gateway.users[int(user["id"])] = user
+        elif user is None and "user_id" in data and int(data["user_id"]) not in gateway.users:
+            user = gateway.user(f"user {data['user_id']}", user_id=data["user_id"])
+
+        if "guild_id" not in data:
+            continue
+        guild_id = int(data["guild_id"])
+        activity[guild_id] += 1
+        guild = gateway.guilds.get(guild_id) or gateway.guild(f"Guild {len(gateway.guilds)}", guild_id=guild_id)
+
+        channel_id = data.get("channel_id")
+        if channel_id is not None and int(channel_id) not in gateway.channel_guilds:
+            gateway.channel(guild, f"channel-{len(guild['channels'])}", channel_id=channel_id)
+
+        if user is None or (guild_id, int(user["id"])) in gateway.members or event["event"] == "GUILD_MEMBER_ADD":
+            # members first seen joining are added by the replayed join
+            continue
+        member_data = data if event["event"].startswith("GUILD_MEMBER") else data.get("member") or {}
+        role_ids = {role["id"] for role in guild["roles"]}
+        for role_id in member_data.get("roles", []):
+            if role_id not in role_ids:
+                gateway.role(guild, f"role-{len(guild['roles'])}", role_id=role_id)
+                role_ids.add(role_id)
+        member = gateway.member(guild, gateway.users[int(user["id"])])
+        member.update({key: value for key, value in member_data.items() if key not in ("user", "guild_id")})
+    return activity.most_common(1)[0][0] if activity else None
+
+
+def get_cog_times(report):
+    cogs = dict()
+    for name, stats in report["listeners"].items():
+        cog = name.split(".")[0]
+        totals = cogs.setdefault(cog, {"calls": 0, "total_ms": 0.0})
+        totals["calls"] += stats["calls"]
+        # processing time, see benchmark.BusyTimer
+        totals["total_ms"] = round(totals["total_ms"] + stats["total_ms"], 3)
+    return dict(sorted(cogs.items()))
+
+
+def format_change(old, new):
+    if not old:
+        return "new"
+    return f"{(new - old) / old * 100:+.1f}%"
+
+
+def format_diff(report, old):
+    lines = [f"{'cog processing':<24} {'old ms':>11} {'new ms':>11} {'change':>9}"]
+    for cog in sorted(set(report["cogs"]) | set(old["cogs"])):
+        before = old["cogs"].get(cog, {}).get("total_ms", 0.0)
+        after = report["cogs"].get(cog, {}).get("total_ms", 0.0)
+        lines.append(f"{cog:<24} {before:>11} {after:>11} {format_change(before, after):>9}")
+    lines += ["", f"{'outbound route':<60} {'old':>7} {'new':>7}"]
+    for route in sorted(set(report["outbound"]) | set(old["outbound"])):
+        before = old["outbound"].get(route, 0)
+        after = report["outbound"].get(route, 0)
+        lines.append(f"{route:<60} {before:>7} {after:>7}{'' if before == after else '  *'}")
+    return "\n".join(lines)
+
+
+async def run(args):
+    events = load_events(args.recording, args.limit)
+    if not events:
+        raise SystemExit(f"no events in {args.recording}")
+    harness = Harness(cogs=args.cogs)
+    home_guild = build_world(harness, events)
+    if home_guild is not None:
+        harness.config["guild_id"] = home_guild
+
+    await harness.boot()
+    if args.triggers:
+        layout = [(guild, [], []) for guild in harness.gateway.guilds.values()]
+        await benchmark.seed_triggers(layout, args.triggers)
+    await harness.gateway.connect()
+    parsers = harness.bot._connection.parsers
+    try:
+        report = await benchmark.measure(harness, [event for event in events if event["event"] in parsers],
+                                         args.speed, not args.no_allocations)
+    finally:
+        await harness.stop()
+    report["recording"] = args.recording
+    report["cogs"] = get_cog_times(report)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay recorded gateway traffic into the cogs")
+    parser.add_argument("recording", help="gzipped JSONL written by the gateway recorder")
+    parser.add_argument("--cogs", nargs="+", default=DEFAULT_COGS)
+    parser.add_argument("--speed", type=float, help="1 replays in real time, 10 ten times faster. default floods")
+    parser.add_argument("--limit", type=int, help="replay only the first N events")
+    parser.add_argument("--triggers", nargs="*", help="autoresponder triggers seeded in every guild")
+    parser.add_argument("--no-allocations", action="store_true", help="skip tracemalloc for cleaner timings")
+    parser.add_argument("--json", help="write the report here")
+    parser.add_argument("--compare", help="report from an earlier replay of the same recording")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    print(benchmark.format_report(report))
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump(report, file, indent=2, sort_keys=True)
+    if args.compare:
+        with open(args.compare) as file:
+            old = json.load(file)
+        print("\n" + format_diff(report, old))
+        regressions = benchmark.compare(report, old, args.tolerance)
+        if regressions:
+            print("\nREGRESSIONS:\n" + "\n".join(f"  {line}" for line in regressions))
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,12 @@
+from datetime import datetime, timezone
+
 import pytz
 from discord import HTTPException
 from discord.ext.commands import Converter, BadArgument, UserConverter
 from pytz import UnknownTimeZoneError
 
 from utils import Utils
+from utils.Database import BugReportingPlatform
 from utils.Utils import ID_MATCHER
 
 
@@ -58,3 +61,26 @@ class RangedInt(Converter):
                 raise BadArgument(f'number is above maximum: {max}')
             else:
                 return argument
+
+
+class Date(Converter):
+    """YYYY-MM-DD, as the start of that day in UTC"""
+
+    async def convert(self, ctx, argument):
+        try:
+            return datetime.strptime(argument, "%Y-%m-%d").replace(tzinfo=timezone.utc)
+        except ValueError:
+            raise BadArgument("Dates need to look like YYYY-MM-DD")
+
+
+class BugReportingField(Converter):
+    """A platform or branch name bugs can be reported for, in its stored spelling"""
+
+    def __init__(self, field) -> None:
+        self.field = field
+
+    async def convert(self, ctx, argument):
+        for name in await BugReportingPlatform.all().distinct().values_list(self.field, flat=True):
+            if argument.lower() == name.lower():
+                return name
+        raise BadArgument(f"Unknown {self.field}")
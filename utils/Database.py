@@ -1,3 +1,9 @@
+import asyncio
+import functools
+import importlib
+import re
+import sys
+import time
 from dataclasses import dataclass
 
 from tortoise import Tortoise
@@ -5,10 +11,18 @@ from tortoise.models import Model
 from tortoise.fields import \
     BooleanField, BigIntField, IntField, SmallIntField, CharField, ForeignKeyField, OneToOneField, ReverseRelation
 
-from utils import tortoise_settings, Logging
+from utils import tortoise_settings, Logging, Configuration, Utils
 from utils.tortoise_settings import app_name as app
 import os
 
+SQL_OPERATION = re.compile(r"^\s*(\w+)")
+SQL_TABLE = re.compile(r"\b(?:FROM|INTO|UPDATE|JOIN)\s+`?(\w+)`?", re.I)
+SQL_LITERALS = re.compile(r"'(?:[^'\\]|\\.)*'|\b\d+\b")
+SQL_LISTS = re.compile(r"\((?:\s*\?\s*,)+\s*\?\s*\)")
+SQL_SPACE = re.compile(r"\s+")
+# engines whose client class has been instrumented
+instrumented = set()
+
 
 async def init(db_name=''):
     #  specify the app name of 'models'
@@ -21,10 +35,113 @@ async def init(db_name=''):
 
     settings = tortoise_settings.TORTOISE_ORM
     if db_name:
-        settings['connections']['default']['credentials']['database'] = db_name
+        settings['connections']['default'] = tortoise_settings.get_connection(db_name)
 
-    Logging.info(f"Database init - \"{settings['connections']['default']['credentials']['database']}\"")
+    credentials = settings['connections']['default']['credentials']
+    Logging.info(f"Database init - \"{credentials.get('database', credentials.get('file_path'))}\"")
+    instrument(settings['connections']['default']['engine'])
     await Tortoise.init(settings)
+    if tortoise_settings.db_engine == "sqlite":
+        # sqlite is only used for tests. migrations are written for mysql, so build the schema from the models
+        await Tortoise.generate_schemas(safe=True)
+
+
+def get_fingerprint(query):
+    """Query text with literals and placeholders replaced by ? so the same query groups together in logs"""
+    fingerprint = SQL_LITERALS.sub("?", query).replace("%s", "?")
+    fingerprint = SQL_LISTS.sub("(?+)", fingerprint)
+    return SQL_SPACE.sub(" ", fingerprint).strip()
+
+
+def get_calling_cog():
+    # awaiting coroutines are on the stack while the query runs, so the nearest cog frame is the caller
+    frame = sys._getframe(2)
+    while frame is not None:
+        module = frame.f_globals.get("__name__", "")
+        if module.startswith("cogs."):
+            return module[5:]
+        frame = frame.f_back
+    return "none"
+
+
+def observe_query(query, started_at, cog):
+    elapsed = time.perf_counter() - started_at
+    operation = SQL_OPERATION.match(query)
+    operation = operation[1].lower() if operation else "unknown"
+    model = SQL_TABLE.search(query)
+    model = model[1].lower() if model else "none"
+    slow = elapsed * 1000 >= Configuration.get_var("db_slow_query_ms", 250)
+
+    metrics = getattr(Utils.BOT, "metrics", None)
+    if metrics:
+        metrics.db_query_seconds.labels(model=model, operation=operation, cog=cog).observe(elapsed)
+        if slow:
+            metrics.db_slow_queries.labels(model=model, operation=operation, cog=cog).inc()
+    if slow:
+        Logging.warn(f"slow query {elapsed * 1000:.0f}ms from {cog}: {get_fingerprint(query)}")
+
+
+def instrument_method(method):
+    @functools.wraps(method)
+    async def wrapper(self, query, *args, **kwargs):
+        cog = get_calling_cog()
+        started_at = time.perf_counter()
+        try:
+            return await method(self, query, *args, **kwargs)
+        finally:
+            observe_query(query, started_at, cog)
+    return wrapper
+
+
+def instrument(engine):
+    """
+    Time every query sent through the engine's client. Patched on the class so transaction connections,
+    which subclass it, are covered too. execute_query_dict goes through execute_query
+    """
+    if engine in instrumented:
+        return
+    client_class = importlib.import_module(engine).client_class
+    for name in ("execute_query", "execute_insert", "execute_many", "execute_script"):
+        setattr(client_class, name, instrument_method(getattr(client_class, name)))
+    instrumented.add(engine)
+
+
+def get_pool():
+    try:
+        return getattr(Tortoise.get_connection("default"), "_pool", None)
+    except Exception:
+        return None
+
+
+def get_pool_size():
+    pool = get_pool()
+    return pool.size if pool else 0
+
+
+def get_pool_free():
+    pool = get_pool()
+    return pool.freesize if pool else 0
+
+
+async def check_health(timeout=5):
+    """
+    Run a trivial query through a pooled connection. Stale connections are replaced by the pool (pool_recycle)
+    :return: True if the database answered in time
+    """
+    started_at = time.perf_counter()
+    healthy = True
+    try:
+        conn = Tortoise.get_connection("default")
+        await asyncio.wait_for(conn.execute_query("SELECT 1"), timeout)
+    except Exception as e:
+        Logging.warn(f"database health check failed: {type(e).__name__} {e}")
+        healthy = False
+
+    metrics = getattr(Utils.BOT, "metrics", None)
+    if metrics:
+        metrics.db_healthy.set(1 if healthy else 0)
+        metrics.db_health_check_seconds.set(time.perf_counter() - started_at)
+    return healthy
 
 
 class AbstractBaseModel(Model):
@@ -35,7 +152,7 @@ class AbstractBaseModel(Model):
 
 
 class DeprecatedServerIdMixIn:
-    serverid = BigIntField()
+    serverid = BigIntField(index=True)
 
 
 class GuildMixin:
@@ -124,7 +241,7 @@ class BugReportFieldLength:
 
 
 class BugReport(AbstractBaseModel):
-    reporter = BigIntField()
+    reporter = BigIntField(index=True)
     message_id = BigIntField(unique=True, null=True)
     attachment_message_id = BigIntField(unique=True, null=True)
     platform = CharField(BugReportFieldLength.platform)
@@ -138,7 +255,7 @@ class BugReport(AbstractBaseModel):
     expected = CharField(BugReportFieldLength.expected)
     actual = CharField(BugReportFieldLength.actual)
     additional = CharField(BugReportFieldLength.additional)
-    reported_at = BigIntField()
+    reported_at = BigIntField(index=True)
 
     attachments: ReverseRelation["Attachments"]
     repros: ReverseRelation["Repros"]
@@ -148,6 +265,8 @@ class BugReport(AbstractBaseModel):
 
     class Meta:
         table = 'bugreport'
+        # bug stats filtered by platform/branch over reported_at ranges. unfiltered stats use the reported_at index
+        indexes = (("platform", "branch", "reported_at"),)
 
 
 class BugReportingChannel(AbstractBaseModel):
@@ -0,0 +1,145 @@
+import os
+import random
+import re
+import struct
+import threading
+import zlib
+from array import array
+
+from utils import Configuration, Logging
+
+# MinHash signatures with LSH banding. two reports land in the same bucket for a band when all ROWS hashes
+# of that band match. with 32 bands of 2 that happens ~95% of the time once their shingle sets overlap by 30%
+NUM_PERM = 64
+BANDS = 32
+ROWS = NUM_PERM // BANDS
+MIN_SIMILARITY = 0.35
+
+PRIME = (1 << 61) - 1
+MAX_HASH = 0xFFFFFFFF
+# fixed seed. signatures are persisted, so the permutations must be the same every run
+_rng = random.Random(20221218)
+PERMUTATIONS = [(_rng.randrange(1, PRIME), _rng.randrange(0, PRIME)) for _ in range(NUM_PERM)]
+
+# report id followed by the signature
+RECORD = struct.Struct(f"<Q{NUM_PERM}I")
+WORD_MATCHER = re.compile(r"\w+")
+
+# report id -> signature
+SIGNATURES = dict()
+# (band, band hashes) -> report ids
+BUCKETS = dict()
+loaded = False
+# new reports and the backfill append from their own threads
+SAVE_LOCK = threading.Lock()
+
+
+def get_path():
+    return Configuration.get_var("duplicate_index_file", "duplicate_index.bin")
+
+
+def get_report_text(report):
+    return f"{report.title} {report.actual} {report.steps}"
+
+
+def get_shingles(text):
+    # words and word pairs. pairs keep some word order, single words help short reports that are phrased differently
+    words = WORD_MATCHER.findall(text.lower())
+    return set(words) | {f"{a} {b}" for a, b in zip(words, words[1:])}
+
+
+def get_signature(text):
+    # crc32 rather than hash() because str hashes are salted per process
+    hashes = [zlib.crc32(shingle.encode("utf-8")) for shingle in get_shingles(text)]
+    if not hashes:
+        return None
+    return array('I', (min((a * h + b) % PRIME & MAX_HASH for h in hashes) for a, b in PERMUTATIONS))
+
+
+def get_band_keys(signature):
+    return [(band, tuple(signature[band * ROWS:(band + 1) * ROWS])) for band in range(BANDS)]
+
+
+def similarity(first, second):
+    """Estimated Jaccard similarity of the shingle sets behind two signatures"""
+    return sum(1 for x, y in zip(first, second) if x == y) / NUM_PERM
+
+
+def index(report_id, signature):
+    old_signature = SIGNATURES.get(report_id)
+    if old_signature is not None:
+        for key in get_band_keys(old_signature):
+            BUCKETS.get(key, set()).discard(report_id)
+    SIGNATURES[report_id] = signature
+    for key in get_band_keys(signature):
+        BUCKETS.setdefault(key, set()).add(report_id)
+
+
+def load():
+    """
+    Blocking. Read persisted signatures, later records for a report replace earlier ones. Nothing may use the index
+    while it loads
+    """
+    global loaded
+    SIGNATURES.clear()
+    BUCKETS.clear()
+    path = get_path()
+    if os.path.exists(path):
+        with open(path, "rb") as file:
+            data = file.read()
+        # a partial record from an interrupted write is ignored
+        usable = len(data) - len(data) % RECORD.size
+        for values in RECORD.iter_unpack(data[:usable]):
+            index(values[0], array('I', values[1:]))
+    loaded = True
+    Logging.info(f"duplicate index loaded with {len(SIGNATURES)} reports")
+
+
+def get_cursor():
+    """
+    Highest report id the backfill went through. Kept apart from the indexed ids: new reports are indexed as they
+    come in, ahead of the backfill
+    """
+    return Configuration.get_persistent_var("duplicate_index_backfill_id", 0)
+
+
+def set_cursor(report_id):
+    Configuration.set_persistent_var("duplicate_index_backfill_id", report_id)
+
+
+def save(records):
+    """Blocking. Append (report id, signature) records to the index file in one write"""
+    if records:
+        with SAVE_LOCK, open(get_path(), "ab") as file:
+            file.write(b"".join(RECORD.pack(report_id, *signature) for report_id, signature in records))
+
+
+def add(report_id, signature):
+    """
+    Blocking. Index a report and append its signature to the index file. On the event loop, index() there and
+    save() in a thread instead: the buckets are not safe to change from a thread while queries run
+    """
+    if signature is None:
+        return
+    index(report_id, signature)
+    save([(report_id, signature)])
+
+
+def query(signature, limit=5, exclude=None):
+    """
+    Find indexed reports similar to a signature
+    :param signature: signature to compare against
+    :param limit: max results
+    :param exclude: report id to leave out (usually the report being compared)
+    :return: list of (report id, similarity), most similar first
+    """
+    if signature is None:
+        return []
+    candidates = set()
+    for key in get_band_keys(signature):
+        candidates.update(BUCKETS.get(key, ()))
+    candidates.discard(exclude)
+    scored = [(report_id, similarity(signature, SIGNATURES[report_id])) for report_id in candidates]
+    scored = [item for item in scored if item[1] >= MIN_SIMILARITY]
+    scored.sort(key=lambda item: (-item[1], -item[0]))
+    return scored[:limit]
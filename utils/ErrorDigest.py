@@ -0,0 +1,104 @@
+import os
+import sysconfig
+import time
+import traceback
+
+from utils import Configuration, Utils
+
+# innermost frames that, with the exception type, tell apart where an error comes from
+FRAMES = 3
+# where python and installed packages live. errors raised in there (discord.py http errors) are told apart by our frames
+LIBRARY_PATHS = tuple({sysconfig.get_path(name) for name in ("stdlib", "purelib", "platlib")})
+# fingerprint -> Occurrence, while it keeps happening
+OCCURRENCES = dict()
+
+
+class Occurrence:
+
+    def __init__(self, label, exception, location, now):
+        self.label = label
+        # (file name, function, line) the digest points at
+        self.location = location
+        self.summary = Utils.trim_message(f"{type(exception).__name__}: {exception}", 200)
+        self.first_seen = now
+        self.window_start = now
+        # repeats since the last report
+        self.count = 0
+        self.total = 1
+
+
+def get_window():
+    return Configuration.get_var("exception_digest_seconds", 300)
+
+
+def get_frames(exception):
+    """(path, function, line) for each frame the exception was raised through, outermost first"""
+    return [(frame.f_code.co_filename, frame.f_code.co_name, lineno)
+            for frame, lineno in traceback.walk_tb(exception.__traceback__)]
+
+
+def get_location(frames):
+    """The innermost frame in our own code, or the innermost frame when there's none"""
+    for path, function, lineno in reversed(frames):
+        if not path.startswith(LIBRARY_PATHS):
+            return os.path.basename(path), function, lineno
+    if frames:
+        path, function, lineno = frames[-1]
+        return os.path.basename(path), function, lineno
+    return "?", "?", 0
+
+
+def fingerprint(label, exception, frames=None):
+    """
+    Where the exception was handled, its type, the innermost frame in our code and the innermost frames it was raised
+    through. Cheap: no source lines are read
+    """
+    frames = get_frames(exception) if frames is None else frames
+    innermost = [(os.path.basename(path), function, lineno) for path, function, lineno in frames[-FRAMES:]]
+    return (label, type(exception).__module__, type(exception).__qualname__, get_location(frames), *innermost)
+
+
+def record(label, exception):
+    """
+    Count an exception
+    :param label: what was being done, as given to the handler
+    :return: True when it should be reported in full, the first time it happens. Repeats go in the digest
+    """
+    frames = get_frames(exception)
+    key = fingerprint(label, exception, frames)
+    occurrence = OCCURRENCES.get(key)
+    if occurrence is None:
+        OCCURRENCES[key] = Occurrence(label, exception, get_location(frames), time.time())
+        result = "reported"
+    else:
+        occurrence.count += 1
+        occurrence.total += 1
+        result = "suppressed"
+    metrics = getattr(Utils.BOT, "metrics", None)
+    if metrics:
+        metrics.exceptions.labels(result=result).inc()
+    return result == "reported"
+
+
+def get_due(now=None):
+    """
+    Digest lines for exceptions that repeated during a window that has now ended. Exceptions that didn't repeat are
+    forgotten, and will be reported in full again next time
+    """
+    now = time.time() if now is None else now
+    window = get_window()
+    lines = []
+    for key, occurrence in list(OCCURRENCES.items()):
+        elapsed = now - occurrence.window_start
+        if elapsed < window:
+            continue
+        if occurrence.count == 0:
+            del OCCURRENCES[key]
+            continue
+        file_name, function, lineno = occurrence.location
+        lines.append(f"{occurrence.label}: `{occurrence.summary}` in {function} ({file_name}:{lineno}) "
+                     f"x{occurrence.count} in last {elapsed / 60:.0f} min, {occurrence.total} since "
+                     f"<t:{int(occurrence.first_seen)}:R>")
+        occurrence.count = 0
+        occurrence.window_start = now
+    return lines
@@ -0,0 +1,168 @@
+import asyncio
+import gzip
+import hashlib
+import hmac
+import json
+import os
+import re
+import secrets
+import time
+
+from utils import Configuration, Logging, Utils
+
+DEFAULT_EVENTS = [
+    "MESSAGE_CREATE",
+    "MESSAGE_REACTION_ADD",
+    "MESSAGE_REACTION_REMOVE",
+    "GUILD_MEMBER_ADD",
+    "GUILD_MEMBER_UPDATE",
+    "GUILD_MEMBER_REMOVE",
+]
+FLUSH_SECONDS = 5
+SNOWFLAKE = re.compile(r"^\d{15,21}$")
+# mentions and custom emoji keep their shape with the id swapped. urls, letters and long numbers are replaced
+TEXT_TOKEN = re.compile(r"(?P<mention><(?:@[!&]?|#)\d+>)|(?P<emoji><a?:[^: \n]+:\d+>)|"
+                        + r"(?P<url>" + Utils.URL_MATCHER.pattern + r")|(?P<word>[^\W\d_]+)|(?P<number>\d{5,})",
+                        re.IGNORECASE)
+NAME_KEYS = {"username", "global_name", "nick"}
+DROP_KEYS = {"avatar", "banner", "avatar_decoration", "bio", "email", "phone", "embeds", "nonce"}
+
+
+class Recorder:
+    """
+    Opt-in recorder of raw gateway events, for replaying real traffic shapes in benchmarks (test/replay.py).
+    Events are anonymized as they arrive and written as gzipped JSON lines: {"t": seconds, "event": name, "data": ...}
+
+    Ids are remapped with a key that only lives as long as the recorder. The timestamp part of a snowflake is kept,
+    because message order and account age checks depend on it. Names are replaced, and so are message words except
+    bot command names, autoresponder trigger words and `gateway_record_keep_words`
+    """
+
+    def __init__(self, bot, path, events=None, max_bytes=None):
+        self.bot = bot
+        self.path = path
+        self.events = events or Configuration.get_var("gateway_record_events", DEFAULT_EVENTS)
+        self.max_bytes = max_bytes or Configuration.get_var("gateway_record_max_mb", 100) * 1024 * 1024
+        self.key = secrets.token_bytes(32)
+        self.lines = []
+        self.keep_words = set()
+        # event name -> original parser
+        self.parsers = dict()
+        self.started_at = 0.0
+        self.flush_task = None
+
+    def start(self):
+        self.started_at = time.monotonic()
+        self.refresh_keep_words()
+        parsers = self.bot._connection.parsers
+        for event in self.events:
+            if event in parsers:
+                self.parsers[event] = parsers[event]
+                parsers[event] = self.make_parser(event, parsers[event])
+        self.flush_task = asyncio.create_task(self.flush_loop())
+        Logging.info(f"recording gateway events {', '.join(self.parsers)} to {self.path}")
+
+    async def stop(self):
+        parsers = self.bot._connection.parsers
+        for event, parser in self.parsers.items():
+            parsers[event] = parser
+        self.parsers.clear()
+        if self.flush_task is not None:
+            self.flush_task.cancel()
+            self.flush_task = None
+        await self.flush()
+
+    def make_parser(self, event, parser):
+        def record_and_parse(data):
+            try:
+                self.record(event, data)
+            except Exception as e:
+                Logging.error(f"gateway recorder failed on {event}: {e}")
+            parser(data)
+        return record_and_parse
+
+    def record(self, event, data):
+        author = data.get("author")
+        if author and self.bot.user and author.get("id") == str(self.bot.user.id):
+            # the bot's own messages are produced again by the replay
+            return
+        line = {"t": round(time.monotonic() - self.started_at, 4), "event": event, "data": self.anonymize(data)}
+        self.lines.append(json.dumps(line, separators=(",", ":"), ensure_ascii=False) + "\n")
+
+    def refresh_keep_words(self):
+        words = {word.lower() for word in Configuration.get_var("gateway_record_keep_words", [])}
+        words.update(name.lower() for name in self.bot.all_commands)
+        autoresponders = self.bot.get_cog("AutoResponders")
+        if autoresponders is not None:
+            for triggers in autoresponders.triggers.values():
+                for trigger in triggers:
+                    words.update(match.lower() for match in re.findall(r"[^\W\d_]+", trigger))
+        self.keep_words = words
+
+    def get_digest(self, value):
+        return hmac.new(self.key, str(value).encode("utf-8"), hashlib.sha256).digest()
+
+    def map_id(self, value):
+        snowflake = int(value)
+        low_bits = int.from_bytes(self.get_digest(snowflake)[:4], "big") & 0x3FFFFF
+        return str(snowflake >> 22 << 22 | low_bits)
+
+    def pseudo_word(self, word):
+        if word.lower() in self.keep_words:
+            return word
+        digest = self.get_digest(word.lower())
+        pseudo = "".join(chr(ord("a") + digest[i % len(digest)] % 26) for i in range(len(word)))
+        return pseudo.capitalize() if word[0].isupper() else pseudo
+
+    def anonymize_text(self, text):
+        def replace(match):
+            token = match.group(0)
+            if match.group("mention") or match.group("emoji"):
+                return re.sub(r"\d+(?=>)", lambda m: self.map_id(m.group(0)), token)
+            if match.group("url"):
+                return f"https://example.com/{self.get_digest(token).hex()[:8]}"
+            if match.group("word"):
+                return self.pseudo_word(token)
+            return "9" * len(token)
+        return TEXT_TOKEN.sub(replace, text)
+
+    def anonymize(self, value, key=None):
+        if isinstance(value, dict):
+            return {k: self.anonymize(v, k) for k, v in value.items() if k not in DROP_KEYS}
+        if isinstance(value, list):
+            return [self.anonymize(item, key) for item in value]
+        if not isinstance(value, str):
+            return value
+        if SNOWFLAKE.match(value):
+            return self.map_id(value)
+        if key in NAME_KEYS:
+            return f"user-{self.get_digest(value).hex()[:6]}"
+        if key == "content":
+            return self.anonymize_text(value)
+        if key == "filename":
+            return f"file{os.path.splitext(value)[1]}"
+        if key in ("url", "proxy_url"):
+            return f"https://example.com/{self.get_digest(value).hex()[:8]}"
+        return value
+
+    async def flush_loop(self):
+        while True:
+            await asyncio.sleep(FLUSH_SECONDS)
+            self.refresh_keep_words()
+            await self.flush()
+
+    async def flush(self):
+        lines, self.lines = self.lines, []
+        if not lines:
+            return
+        # compressing and writing stays off the event loop
+        size = await asyncio.to_thread(self.write, lines)
+        if size >= self.max_bytes:
+            Logging.warn(f"gateway recording {self.path} reached {size} bytes. recording stopped")
+            await self.stop()
+
+    def write(self, lines):
+        # appending a new gzip member per flush keeps the file readable as one stream
+        with gzip.open(self.path, "at", encoding="utf-8") as file:
+            file.writelines(lines)
+        return os.path.getsize(self.path)
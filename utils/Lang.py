@@ -1,10 +1,12 @@
-import yaml
 import operator
+from dataclasses import dataclass
 from discord.ext.commands import Context
 from functools import reduce  # forward compatibility for Python 3
-from utils import Logging, Configuration, Utils
+from utils import Logging, Configuration, Utils, LazyImport
 from utils.Database import Localization, Guild
 
+yaml = LazyImport.lazy("yaml")
+
 LANG = dict()
 loaded = False
 locales_loaded = False
@@ -24,6 +26,25 @@ async def load_local_overrides():
     CHANNEL_LOCALES = {row.channelid: row.locale for row in channel_locales}
 
 
+@dataclass()
+class LocaleContext:
+    """
+    The parts of a command Context that locale lookups and replies use, built from objects already in hand.
+    Use instead of fetching a message just to call bot.get_context
+    """
+    guild: object
+    channel: object
+    author: object = None
+
+    async def send(self, *args, **kwargs):
+        return await self.channel.send(*args, **kwargs)
+
+
+def locale_context(channel, author=None):
+    # DM channels have no guild
+    return LocaleContext(getattr(channel, "guild", None), channel, author)
+
+
 def get_by_path(root, items):
     try:
         """Access a nested object in root by item sequence."""
@@ -67,7 +88,7 @@ def get_string(key, **kwargs):
 
 def get_defaulted_locale(ctx):
     locale = 'en_US'
-    if isinstance(ctx, Context):
+    if isinstance(ctx, (Context, LocaleContext)):
         # TODO: move guild/channel checks to LangConfig, store in dict, update there on guild events and config changes
         cid = ctx.channel.id
 
@@ -0,0 +1,125 @@
+import builtins
+import importlib
+import sys
+import threading
+import time
+
+from utils import Logging, Utils
+
+# module name -> seconds its first load took
+LOAD_TIMES = dict()
+LOCK = threading.RLock()
+
+
+def record(name, seconds):
+    LOAD_TIMES[name] = seconds
+    metrics = getattr(Utils.BOT, "metrics", None)
+    if metrics:
+        metrics.lazy_import_seconds.labels(module=name).set(seconds)
+
+
+class LazyModule:
+    """
+    Stand-in for a heavy module that is imported on first attribute access, so cogs that rarely need it don't pay for
+    it at startup. `path` is added to sys.path right before the import, for packages that live outside the venv.
+
+        yaml = LazyImport.lazy("yaml")
+        yaml.safe_load(text)  # imported here
+    """
+
+    def __init__(self, name, path=None):
+        self.__dict__["_name"] = name
+        self.__dict__["_path"] = path
+        self.__dict__["_module"] = None
+
+    def _load(self):
+        module = self.__dict__["_module"]
+        if module is not None:
+            return module
+        with LOCK:
+            if self.__dict__["_module"] is None:
+                name = self.__dict__["_name"]
+                path = self.__dict__["_path"]
+                if path is not None and path not in sys.path:
+                    sys.path.append(path)
+                # another stand-in or a regular import may have loaded it already
+                first = name not in sys.modules
+                started_at = time.perf_counter()
+                module = importlib.import_module(name)
+                seconds = time.perf_counter() - started_at
+                if first:
+                    record(name, seconds)
+                    Logging.info(f"lazy import of {name} took {seconds * 1000:.1f}ms")
+                self.__dict__["_module"] = module
+            return self.__dict__["_module"]
+
+    def __getattr__(self, item):
+        return getattr(self._load(), item)
+
+    def __setattr__(self, key, value):
+        setattr(self._load(), key, value)
+
+    def __repr__(self):
+        state = "loaded" if self.__dict__["_module"] is not None else "not loaded"
+        return f"<lazy module {self.__dict__['_name']} ({state})>"
+
+
+def lazy(name, path=None):
+    return LazyModule(name, path)
+
+
+class ImportTimer:
+    """
+    Times the modules imported inside the block, like `python -X importtime`: self time excludes the nested imports
+    each module made. Only modules not imported before are counted, and imports from other tasks running at the same
+    time are counted too.
+
+        with LazyImport.ImportTimer() as timer:
+            await bot.load_extension("cogs.Music")
+        timer.top(5)
+    """
+
+    def __init__(self):
+        # module name -> [self seconds, cumulative seconds]
+        self.times = dict()
+        self.stack = []
+        self.original_import = None
+        self.started_at = 0.0
+        self.elapsed = 0.0
+        # time spent in top level imports, nested ones are part of those
+        self.import_seconds = 0.0
+
+    def __enter__(self):
+        self.original_import = builtins.__import__
+        builtins.__import__ = self.timed_import
+        self.started_at = time.perf_counter()
+        return self
+
+    def __exit__(self, *args):
+        self.elapsed = time.perf_counter() - self.started_at
+        builtins.__import__ = self.original_import
+        return False
+
+    def timed_import(self, name, globals=None, locals=None, fromlist=(), level=0):
+        if level or name in sys.modules:
+            return self.original_import(name, globals, locals, fromlist, level)
+        self.stack.append(0.0)
+        started_at = time.perf_counter()
+        try:
+            return self.original_import(name, globals, locals, fromlist, level)
+        finally:
+            cumulative = time.perf_counter() - started_at
+            nested = self.stack.pop()
+            if self.stack:
+                self.stack[-1] += cumulative
+            else:
+                self.import_seconds += cumulative
+            self.times[name] = [cumulative - nested, cumulative]
+
+    def top(self, count=5):
+        """Slowest imports by self time, as (module, self seconds, cumulative seconds)"""
+        ranked = sorted(self.times.items(), key=lambda item: item[1][0], reverse=True)
+        return [(name, own, cumulative) for name, (own, cumulative) in ranked[:count]]
+
+    def format(self, count=5):
+        return ", ".join(f"{name} {own * 1000:.1f}ms" for name, own, cumulative in self.top(count))
@@ -0,0 +1,127 @@
+import linecache
+import resource
+import tracemalloc
+from collections import OrderedDict, deque
+from collections.abc import Mapping
+
+from utils import Questions, Utils
+
+CONTAINER_TYPES = (Mapping, set, list, tuple, deque, frozenset)
+# named tracemalloc snapshots for diffing, oldest first
+SNAPSHOTS = OrderedDict()
+MAX_SNAPSHOTS = 5
+
+
+def count_entries(value):
+    """Entries in a container. For a mapping of containers (e.g. per guild state) the entries of those containers"""
+    if isinstance(value, Mapping) and value and \
+            all(isinstance(item, CONTAINER_TYPES) for item in value.values()):
+        return sum(len(item) for item in value.values())
+    try:
+        return len(value)
+    except TypeError:
+        return 0
+
+
+def get_container_sizes(bot):
+    """
+    Sizes of the state containers cogs list in `state_containers`, and of module level caches
+    :return: {(owner, container name): entries}
+    """
+    sizes = {
+        ("Utils", "known_invalid_users"): count_entries(Utils.known_invalid_users),
+        ("Utils", "user_cache"): count_entries(Utils.user_cache),
+        ("Utils", "GUILD_CONFIGS"): count_entries(Utils.GUILD_CONFIGS),
+        ("Questions", "DIALOGS"): count_entries(Questions.DIALOGS),
+    }
+    for name, cog in bot.cogs.items():
+        for container in getattr(cog, "state_containers", ()):
+            sizes[(name, container)] = count_entries(getattr(cog, container, ()))
+    return sizes
+
+
+def get_cache_sizes(bot):
+    """discord.py caches"""
+    return {
+        "guilds": len(bot.guilds),
+        "members": sum(len(guild.members) for guild in bot.guilds),
+        "users": len(bot.users),
+        "messages": len(bot.cached_messages),
+    }
+
+
+def get_max_rss():
+    # kilobytes on linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def update_metrics(bot):
+    metrics = getattr(bot, "metrics", None)
+    if not metrics:
+        return
+    for (owner, container), size in get_container_sizes(bot).items():
+        metrics.state_container_size.labels(owner=owner, container=container).set(size)
+    for cache, size in get_cache_sizes(bot).items():
+        metrics.discord_cache_size.labels(cache=cache).set(size)
+
+
+def is_tracing():
+    return tracemalloc.is_tracing()
+
+
+def get_traced_bytes():
+    return tracemalloc.get_traced_memory()[0] if tracemalloc.is_tracing() else 0
+
+
+def start_tracing(frames=1):
+    """Tracing slows every allocation down. Stop it when done"""
+    if tracemalloc.is_tracing():
+        return False
+    tracemalloc.start(frames)
+    return True
+
+
+def stop_tracing():
+    SNAPSHOTS.clear()
+    if not tracemalloc.is_tracing():
+        return False
+    tracemalloc.stop()
+    return True
+
+
+def take_snapshot():
+    # allocations made by tracemalloc itself would drown out everything else
+    return tracemalloc.take_snapshot().filter_traces((
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, linecache.__file__),
+    ))
+
+
+def save_snapshot(name):
+    snapshot = take_snapshot()
+    SNAPSHOTS.pop(name, None)
+    SNAPSHOTS[name] = snapshot
+    while len(SNAPSHOTS) > MAX_SNAPSHOTS:
+        SNAPSHOTS.popitem(last=False)
+    return snapshot
+
+
+def format_size(size):
+    for unit in ("B", "KiB", "MiB"):
+        if abs(size) < 1024:
+            return f"{size:.0f}{unit}" if unit == "B" else f"{size:.1f}{unit}"
+        size /= 1024
+    return f"{size:.1f}GiB"
+
+
+def get_top(limit=10, key_type="lineno"):
+    """Allocation sites holding the most memory right now, as text lines"""
+    stats = take_snapshot().statistics(key_type)
+    return [f"{format_size(stat.size):>9} {stat.count:>7} {stat.traceback}" for stat in stats[:limit]]
+
+
+def get_diff(name, limit=10, key_type="lineno"):
+    """Allocation sites that grew the most since snapshot `name`, as text lines"""
+    stats = take_snapshot().compare_to(SNAPSHOTS[name], key_type)
+    return [f"{('+' if stat.size_diff > 0 else '') + format_size(stat.size_diff):>10} {stat.count_diff:>+7} "
+            f"{stat.traceback}" for stat in stats[:limit]]
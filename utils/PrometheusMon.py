@@ -1,5 +1,7 @@
 import prometheus_client as prom
 
+from utils import Questions, Database, SongCache, MemoryStats
+
 
 class PrometheusMon:
     def __init__(self, bot) -> None:
@@ -99,6 +101,93 @@ class PrometheusMon:
         self.auto_responder_mod_delete_trigger = prom.Counter("auto_responder_mod_delete_trigger",
                                                               "Auto-responder - mod action: delete trigger")
 
+        self.open_dialogs = prom.Gauge("open_dialogs", "Number of text dialogs waiting for a user reply")
+        self.open_dialogs.set_function(Questions.open_dialog_count)
+        self.oldest_dialog_age = prom.Gauge("oldest_dialog_age", "Age in seconds of the oldest open text dialog")
+        self.oldest_dialog_age.set_function(Questions.oldest_dialog_age)
+        self.dialog_wait_seconds = prom.Histogram("dialog_wait_seconds",
+                                                  "How long text dialogs stayed open (answered or timed out)",
+                                                  buckets=(1, 5, 15, 30, 60, 120, 180, 300, 600))
+
+        self.discord_call_retries = prom.Counter("discord_call_retries",
+                                                 "Outbound Discord API calls retried after a transient error",
+                                                 ["route"])
+        self.discord_call_failures = prom.Counter("discord_call_failures",
+                                                  "Outbound Discord API calls given up on",
+                                                  ["route", "reason"])
+        self.discord_circuit_state = prom.Gauge("discord_circuit_state",
+                                                "Circuit breakers of a route (one per channel) in state half_open "
+                                                "or open",
+                                                ["route", "state"])
+
+        self.bug_report_stage_seconds = prom.Histogram("bug_report_stage_seconds",
+                                                       "Time spent in each stage of submitting a bug report",
+                                                       ["stage"],
+                                                       buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30))
+
+        self.db_query_seconds = prom.Histogram("db_query_seconds", "Database query latency",
+                                               ["model", "operation", "cog"],
+                                               buckets=(.001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5))
+        self.db_slow_queries = prom.Counter("db_slow_queries", "Database queries slower than db_slow_query_ms",
+                                            ["model", "operation", "cog"])
+        self.db_pool_size = prom.Gauge("db_pool_size", "Connections open in the database pool")
+        self.db_pool_size.set_function(Database.get_pool_size)
+        self.db_pool_free = prom.Gauge("db_pool_free", "Idle connections in the database pool")
+        self.db_pool_free.set_function(Database.get_pool_free)
+        self.db_healthy = prom.Gauge("db_healthy", "1 if the last database health check passed")
+        self.db_health_check_seconds = prom.Gauge("db_health_check_seconds",
+                                                  "Duration of the last database health check")
+
+        self.ttl_map_evictions = prom.Counter("ttl_map_evictions", "Entries dropped from bounded maps",
+                                              ["map", "reason"])
+        self.exceptions = prom.Counter("exceptions", "Handled exceptions, reported in full or left for the digest",
+                                       ["result"])
+
+        self.state_container_size = prom.Gauge("state_container_size", "Entries in cog state containers",
+                                               ["owner", "container"])
+        self.discord_cache_size = prom.Gauge("discord_cache_size", "Entries in discord.py caches", ["cache"])
+        self.traced_memory_bytes = prom.Gauge("traced_memory_bytes",
+                                              "Memory held by traced allocations, while tracing is on")
+        self.traced_memory_bytes.set_function(MemoryStats.get_traced_bytes)
+
+        self.lazy_import_seconds = prom.Gauge("lazy_import_seconds", "Time the first use of a lazy module took to import",
+                                              ["module"])
+        self.cog_load_seconds = prom.Gauge("cog_load_seconds", "Time loading each cog took at startup", ["cog"])
+
+        self.music_cache_requests = prom.Counter("music_cache_requests", "Music sheet cache lookups", ["result"])
+        self.music_cache_bytes_served = prom.Counter("music_cache_bytes_served",
+                                                     "Bytes of music sheets served from the cache")
+        self.music_cache_bytes = prom.Gauge("music_cache_bytes", "Bytes of music sheets in the cache")
+        self.music_cache_bytes.set_function(SongCache.get_size)
+
+        self.music_zip_seconds = prom.Histogram("music_zip_seconds", "Time spent zipping song files")
+        self.music_zip_bytes = prom.Counter("music_zip_bytes", "Bytes of song files going into and out of zips",
+                                            ["direction"])
+
+        self.render_queue_depth = prom.Gauge("render_queue_depth", "Jobs waiting in a render scheduler", ["scheduler"])
+        self.render_running = prom.Gauge("render_running", "Jobs running in a render scheduler", ["scheduler"])
+        self.render_wait_seconds = prom.Histogram("render_wait_seconds", "Time render jobs wait for a worker",
+                                                  ["scheduler"],
+                                                  buckets=(1, 5, 10, 30, 60, 120, 300, 600, 1200))
+        self.render_seconds = prom.Histogram("render_seconds", "Time render jobs run, by outcome",
+                                             ["scheduler", "status"],
+                                             buckets=(.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300))
+
+        self.worker_pool_workers = prom.Gauge("worker_pool_workers", "Workers alive in a worker pool", ["pool"])
+        self.worker_pool_busy = prom.Gauge("worker_pool_busy", "Workers running a job in a worker pool", ["pool"])
+        self.worker_pool_queue_depth = prom.Histogram("worker_pool_queue_depth",
+                                                      "Worker pool queue depth seen by each new work item",
+                                                      ["pool"],
+                                                      buckets=(0, 1, 2, 5, 10, 20, 50, 100, 200, 500))
+        self.worker_pool_wait_seconds = prom.Histogram("worker_pool_wait_seconds",
+                                                       "Time work items waited in a worker pool queue",
+                                                       ["pool"],
+                                                       buckets=(0.1, 0.5, 1, 5, 15, 30, 60, 120, 300, 600))
+        self.worker_pool_service_seconds = prom.Histogram("worker_pool_service_seconds",
+                                                          "Time worker pool jobs ran",
+                                                          ["pool"],
+                                                          buckets=(1, 5, 15, 30, 60, 120, 300, 600, 1200, 2400))
+
         bot.metrics_reg.register(self.command_counter)
         bot.metrics_reg.register(self.word_counter)
         bot.metrics_reg.register(self.guild_messages)
@@ -145,3 +234,46 @@ class PrometheusMon:
         bot.metrics_reg.register(self.auto_responder_mod_manual)
         bot.metrics_reg.register(self.auto_responder_mod_auto)
         bot.metrics_reg.register(self.auto_responder_mod_delete_trigger)
+
+        bot.metrics_reg.register(self.open_dialogs)
+        bot.metrics_reg.register(self.oldest_dialog_age)
+        bot.metrics_reg.register(self.dialog_wait_seconds)
+
+        bot.metrics_reg.register(self.discord_call_retries)
+        bot.metrics_reg.register(self.discord_call_failures)
+        bot.metrics_reg.register(self.discord_circuit_state)
+
+        bot.metrics_reg.register(self.worker_pool_workers)
+        bot.metrics_reg.register(self.worker_pool_busy)
+        bot.metrics_reg.register(self.worker_pool_queue_depth)
+        bot.metrics_reg.register(self.worker_pool_wait_seconds)
+        bot.metrics_reg.register(self.worker_pool_service_seconds)
+
+        bot.metrics_reg.register(self.bug_report_stage_seconds)
+
+        bot.metrics_reg.register(self.db_query_seconds)
+        bot.metrics_reg.register(self.db_slow_queries)
+        bot.metrics_reg.register(self.db_pool_size)
+        bot.metrics_reg.register(self.db_pool_free)
+        bot.metrics_reg.register(self.db_healthy)
+        bot.metrics_reg.register(self.db_health_check_seconds)
+
+        bot.metrics_reg.register(self.render_queue_depth)
+        bot.metrics_reg.register(self.render_running)
+        bot.metrics_reg.register(self.render_wait_seconds)
+        bot.metrics_reg.register(self.render_seconds)
+
+        bot.metrics_reg.register(self.music_cache_requests)
+        bot.metrics_reg.register(self.music_cache_bytes_served)
+        bot.metrics_reg.register(self.music_cache_bytes)
+        bot.metrics_reg.register(self.music_zip_seconds)
+        bot.metrics_reg.register(self.music_zip_bytes)
+
+        bot.metrics_reg.register(self.lazy_import_seconds)
+        bot.metrics_reg.register(self.cog_load_seconds)
+
+        bot.metrics_reg.register(self.state_container_size)
+        bot.metrics_reg.register(self.discord_cache_size)
+        bot.metrics_reg.register(self.traced_memory_bytes)
+        bot.metrics_reg.register(self.ttl_map_evictions)
+        bot.metrics_reg.register(self.exceptions)
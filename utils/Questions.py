@@ -1,14 +1,24 @@
 import asyncio
 import inspect
 import re
+import time
 import typing
 
-from discord import Embed, Reaction
-from utils import Emoji, Utils, Configuration, Lang
+from discord import Embed, Reaction, ButtonStyle, Interaction, HTTPException, ui
+from utils import Emoji, Utils, Configuration, Lang, Logging, Retry
 from dataclasses import dataclass
 
 # Option = namedtuple("Option", "emoji text handler args", defaults=(None, None, None, None))
 
+# open text dialogs keyed by (channel_id, user_id). fed by Skybot.on_message
+DIALOGS = dict()
+
+
+@dataclass()
+class DialogWaiter:
+    future: asyncio.Future
+    started_at: float
+
 
 @dataclass
 class Option:
@@ -29,22 +39,168 @@ def timeout_format(total_seconds: int) -> str:
     return ", ".join(output)
 
 
-async def ask(bot, channel, author, text, options, timeout=60, show_embed=False, delete_after=False, locale="en_US"):
+def route_message(message):
+    """
+    Hand a message to the dialogs waiting on its channel and author. Everything else is ignored with a single lookup
+    :param message: incoming message
+    """
+    waiters = DIALOGS.get((message.channel.id, message.author.id))
+    if not waiters:
+        return
+    for waiter in waiters:
+        if not waiter.future.done():
+            waiter.future.set_result(message)
+
+
+def open_dialog_count():
+    return sum(len(waiters) for waiters in DIALOGS.values())
+
+
+def oldest_dialog_age():
+    now = time.monotonic()
+    return max((now - waiter.started_at for waiters in DIALOGS.values() for waiter in waiters), default=0)
+
+
+async def wait_for_message(channel, user, timeout):
+    """
+    Wait for the next message from user in channel
+    :param channel: the channel to listen in
+    :param user: the user to listen to
+    :param timeout: seconds to wait before raising asyncio.TimeoutError
+    :return: the message
+    """
+    key = (channel.id, user.id)
+    waiter = DialogWaiter(asyncio.get_running_loop().create_future(), time.monotonic())
+    DIALOGS.setdefault(key, []).append(waiter)
+    try:
+        return await asyncio.wait_for(waiter.future, timeout)
+    finally:
+        waiters = DIALOGS.get(key, [])
+        if waiter in waiters:
+            waiters.remove(waiter)
+        if not waiters:
+            DIALOGS.pop(key, None)
+        metrics = getattr(Utils.BOT, "metrics", None)
+        if metrics:
+            metrics.dialog_wait_seconds.observe(time.monotonic() - waiter.started_at)
+
+
+class OptionView(ui.View):
+    """One button per option, answered through interaction callbacks instead of reactions"""
+
+    def __init__(self, author, options, timeout, delete_after=False):
+        super().__init__(timeout=timeout)
+        self.author = author
+        self.delete_after = delete_after
+        self.choice = None
+        for option in options:
+            emoji = Emoji.get_emoji(option.emoji) if Emoji.is_emoji_defined(option.emoji) else None
+            label = Utils.trim_message(option.text, 80) if option.text else None
+            if emoji is None and label is None:
+                label = option.emoji
+            button = ui.Button(style=ButtonStyle.secondary, emoji=emoji, label=label)
+            button.callback = self.make_callback(button, option)
+            self.add_item(button)
+
+    def make_callback(self, button, option):
+        async def callback(interaction: Interaction):
+            self.choice = option
+            button.style = ButtonStyle.success
+            for item in self.children:
+                item.disabled = True
+            if self.delete_after:
+                await interaction.response.defer()
+            else:
+                # acknowledging the click and disabling the buttons is a single interaction response
+                await interaction.response.edit_message(view=self)
+            self.stop()
+        return callback
+
+    async def interaction_check(self, interaction: Interaction):
+        if interaction.user.id == self.author.id:
+            return True
+        # not your question. acknowledge quietly so the click doesn't show as failed
+        await interaction.response.defer()
+        return False
+
+
+async def run_handler(option):
+    h = option.handler
+    a = option.args
+    if h is None:
+        return
+    if inspect.iscoroutinefunction(h):
+        await h(*a) if a is not None else await h()
+    else:
+        h(*a) if a is not None else h()
+
+
+async def send_timeout_notice(channel, message, timeout, delete_after, locale):
+    try:
+        if delete_after:
+            await message.delete()
+        await channel.send(
+            Lang.get_locale_string("questions/error_reaction_timeout", locale,
+                                   error_emoji=Emoji.get_emoji("WARNING"),
+                                   timeout=timeout_format(timeout)),
+            delete_after=10 if delete_after else None)
+    except HTTPException as e:
+        # the prompt or the channel may be gone by now. the timeout is raised either way
+        Logging.info(f"failed to send question timeout notice in {channel.id}: {e}")
+
+
+async def ask(bot, channel, author, text, options, timeout=60, show_embed=False, delete_after=False, locale="en_US",
+              buttons=None):
+    """
+    Ask a multiple-choice question and run the handler of the chosen option
+    :param buttons: answer with message components. None uses the `question_buttons` config (default on).
+        False uses the old reaction prompt
+    """
+    if buttons is None:
+        buttons = Configuration.get_var("question_buttons", True)
+    if buttons:
+        await ask_buttons(channel, author, text, options, timeout, show_embed, delete_after, locale)
+    else:
+        await ask_reactions(bot, channel, author, text, options, timeout, show_embed, delete_after, locale)
+
+
+def get_options_embed(options):
     description = '\n'.join(f"{Emoji.get_chat_emoji(option.emoji)} {option.text or ''}" for option in options)
-    embed = Embed(color=0x68a910, description=description)
-    message = await channel.send(text, embed=embed if show_embed else None)
+    return Embed(color=0x68a910, description=description)
+
+
+async def ask_buttons(channel, author, text, options, timeout=60, show_embed=False, delete_after=False,
+                      locale="en_US"):
+    view = OptionView(author, options, timeout, delete_after)
+    message = await channel.send(text, embed=get_options_embed(options) if show_embed else None, view=view)
+
+    if await view.wait():
+        # timed out. take the buttons away so nobody clicks a dead prompt
+        if not delete_after:
+            try:
+                await message.edit(view=None)
+            except HTTPException as e:
+                Logging.info(f"failed to remove buttons from timed out question {message.id}: {e}")
+        await send_timeout_notice(channel, message, timeout, delete_after, locale)
+        raise asyncio.TimeoutError()
+
+    if delete_after:
+        await message.delete()
+    await run_handler(view.choice)
+
+
+async def ask_reactions(bot, channel, author, text, options, timeout=60, show_embed=False, delete_after=False,
+                        locale="en_US"):
+    message = await channel.send(text, embed=get_options_embed(options) if show_embed else None)
     handlers = dict()
     for option in options:
         emoji = Emoji.get_emoji(option.emoji)
-        add_attempts = 10
-        # try reaction 10x in case it fails to add
-        while add_attempts > 0:
-            try:
-                await message.add_reaction(emoji)
-                break
-            except Exception as ex:
-                add_attempts = add_attempts - 1
-        handlers[str(emoji)] = {'handler': option.handler, 'args': option.args}
+        try:
+            await Retry.call("add_reaction", message.add_reaction, emoji, scope=channel.id)
+        except Exception:
+            # a missing option reaction shouldn't kill the prompt
+            pass
+        handlers[str(emoji)] = option
 
     def check(reaction: Reaction, user):
         return user == author and str(reaction.emoji) in handlers.keys() and reaction.message.id == message.id
@@ -52,29 +208,19 @@ async def ask(bot, channel, author, text, options, timeout=60, show_embed=False,
     try:
         reaction, user = await bot.wait_for('reaction_add', timeout=timeout, check=check)
     except asyncio.TimeoutError as ex:
-        try:
-            if delete_after:
-                await message.delete()
-            await channel.send(
-                Lang.get_locale_string("questions/error_reaction_timeout", locale,
-                                       error_emoji=Emoji.get_emoji("WARNING"),
-                                       timeout=timeout_format(timeout)),
-                delete_after=10 if delete_after else None)
-        except Exception as e:
-            # ignore all failures at this point
-            pass
+        await send_timeout_notice(channel, message, timeout, delete_after, locale)
         raise ex
     else:
         if delete_after:
             await message.delete()
-        h = handlers[str(reaction.emoji)]['handler']
-        a = handlers[str(reaction.emoji)]['args']
-        if h is None:
-            return
-        if inspect.iscoroutinefunction(h):
-            await h(*a) if a is not None else await h()
-        else:
-            h(*a) if a is not None else h()
+        await run_handler(handlers[str(reaction.emoji)])
+
+
+def clean_text(txt):
+    """Remove multiple spaces and multiple newlines from input txt."""
+    txt = re.sub(r' +', ' ', txt)
+    txt = re.sub(r'\n\s*\n', '\n\n', txt)
+    return txt
 
 
 async def ask_text(
@@ -89,21 +235,12 @@ async def ask_text(
         delete_after=False,
         locale="en_US"):
 
-    def check(msg):
-        return user == msg.author and msg.channel == channel
-
     ask_again = True
 
     def confirmed():
         nonlocal ask_again
         ask_again = False
 
-    def clean_text(txt):
-        """Remove multiple spaces and multiple newlines from input txt."""
-        txt = re.sub(r' +', ' ', txt)
-        txt = re.sub(r'\n\s*\n', '\n\n', txt)
-        return txt
-
     my_messages = []
 
     async def clean_dialog():
@@ -122,7 +259,7 @@ async def ask_text(
         my_messages.append(await channel.send(text))
         try:
             while True:
-                message = await bot.wait_for('message', timeout=timeout, check=check)
+                message = await wait_for_message(channel, user, timeout)
                 my_messages.append(message)
                 if message.content is None or message.content == "":
                     result = Lang.get_locale_string("questions/text_only", locale)
@@ -173,9 +310,6 @@ async def ask_attachements(
         max_files=Configuration.get_var('max_attachments'),
         locale="en_US"):
 
-    def check(message):
-        return user == message.author and message.channel == channel
-
     done = False
 
     def ready():
@@ -216,7 +350,7 @@ async def ask_attachements(
 
             try:
                 while True:
-                    message = await bot.wait_for('message', timeout=timeout, check=check)
+                    message = await wait_for_message(channel, user, timeout)
                     links = Utils.URL_MATCHER.findall(message.content)
                     attachment_links = [str(a.url) for a in message.attachments]
                     if len(links) != 0 or len(message.attachments) != 0:
@@ -1,9 +1,90 @@
-from utils import Utils, Questions, Logging, Emoji, Configuration
+import asyncio
+import importlib
+import time
+
+from utils import Utils, Questions, Logging, Emoji, Configuration, Retry
 
 components = [
     Configuration,
     Emoji,
     Logging,
     Questions,
+    Retry,
     Utils
-]
\ No newline at end of file
+]
+
+# module globals holding live state (loaded config, open dialogs, the bot itself) that a reload must not reset
+KEEP = {
+    "utils.Configuration": ("MASTER_CONFIG", "MASTER_LOADED", "PERSISTENT", "PERSISTENT_LOADED", "PERSISTENT_DEQUE",
+                            "PERSISTENT_LOCK", "PERSISTENT_AIO_QUEUE"),
+    "utils.Logging": ("BOT_LOG_CHANNEL",),
+    "utils.Questions": ("DIALOGS",),
+    "utils.Retry": ("BREAKERS",),
+    "utils.Utils": ("BOT", "GUILD_CONFIGS", "known_invalid_users", "user_cache"),
+}
+
+
+def reload_components():
+    for component in components:
+        kept = {name: getattr(component, name) for name in KEEP.get(component.__name__, ())
+                if hasattr(component, name)}
+        importlib.reload(component)
+        for name, value in kept.items():
+            setattr(component, name, value)
+
+
+def get_reload_order(bot, names):
+    """
+    Batches of cog names. Cogs in a batch can reload at the same time, each batch only after the cogs listed in the
+    `depends_on` of its cogs
+    """
+    pending = {name: {dependency for dependency in getattr(bot.get_cog(name), "depends_on", ()) if dependency in names}
+               for name in names}
+    batches = []
+    while pending:
+        ready = [name for name, dependencies in pending.items() if not dependencies]
+        if not ready:
+            # circular dependencies. take them one at a time
+            ready = [next(iter(pending))]
+        batches.append(ready)
+        for name in ready:
+            del pending[name]
+        for dependencies in pending.values():
+            dependencies.difference_update(ready)
+    return batches
+
+
+async def reload_cog(bot, name):
+    """
+    Unload and load cog `name`, carrying over what its export_state returns
+    :return: (seconds taken, whether state was carried over)
+    """
+    started_at = time.perf_counter()
+    cog = bot.get_cog(name)
+    state = cog.export_state() if hasattr(cog, "export_state") else None
+    await bot.unload_extension(f"cogs.{name}")
+    await bot.load_extension(f"cogs.{name}")
+    cog = bot.get_cog(name)
+    if state is not None and hasattr(cog, "import_state"):
+        await cog.import_state(state)
+    elif bot.is_ready() and hasattr(cog, "on_ready"):
+        # nothing carried over, load everything the way startup does
+        await cog.on_ready()
+    seconds = time.perf_counter() - started_at
+    metrics = getattr(bot, "metrics", None)
+    if metrics:
+        metrics.cog_load_seconds.labels(cog=name).set(seconds)
+    Logging.info(f"{name} reloaded in {seconds * 1000:.1f}ms{', state kept' if state is not None else ''}")
+    return seconds, state is not None
+
+
+async def reload_cogs(bot, names):
+    """
+    Reload cogs batch by batch
+    :return: {name: (seconds, state kept) or the exception that stopped it}
+    """
+    results = dict()
+    for batch in get_reload_order(bot, names):
+        outcomes = await asyncio.gather(*[reload_cog(bot, name) for name in batch], return_exceptions=True)
+        results.update(zip(batch, outcomes))
+    return results
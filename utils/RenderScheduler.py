@@ -0,0 +1,188 @@
+import asyncio
+import math
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass, field
+
+from utils import Logging, Utils
+
+
+class RenderTimeout(Exception):
+    pass
+
+
+@dataclass()
+class RenderJob:
+    key: object
+    function: object
+    args: tuple
+    future: asyncio.Future
+    enqueued_at: float
+    # set whenever the job moves up in the queue or starts
+    moved: asyncio.Event = field(default_factory=asyncio.Event)
+    task: asyncio.Task = None
+
+
+class RenderScheduler:
+    """
+    FIFO queue in front of a process pool, for CPU heavy work that would otherwise hold the GIL against the event loop.
+    At most `workers` jobs run at once, one job per key.
+    Functions and arguments must be picklable: top level functions and plain data.
+
+    A job that times out or is cancelled stops waiting right away and frees its slot. Its process can't be
+    interrupted, so the pool's processes are terminated and the pool is replaced. Other jobs that were running in it
+    start over on the new pool, with their full timeout.
+    """
+
+    def __init__(self, name, workers=2, timeout=120.0):
+        self.name = name
+        self.workers = max(1, workers)
+        self.timeout = timeout
+        self.executor = None
+        # jobs waiting for a slot, in order
+        self.queue = deque()
+        # key -> running job
+        self.running = dict()
+        # recent render durations, for wait estimates
+        self.durations = deque(maxlen=20)
+
+    def get_executor(self):
+        if self.executor is None:
+            self.executor = ProcessPoolExecutor(max_workers=self.workers)
+        return self.executor
+
+    def replace_executor(self):
+        if self.executor is not None:
+            executor, self.executor = self.executor, None
+            # shutdown alone leaves a hung job's process running for good
+            processes = list((executor._processes or dict()).values())
+            executor.shutdown(wait=False, cancel_futures=True)
+            for process in processes:
+                process.terminate()
+
+    def submit(self, key, function, *args):
+        """
+        Queue a job
+        :param key: who the job belongs to (e.g. user id). a key can only have one job at a time
+        :return: the RenderJob. await its future for the result
+        """
+        if self.find(key) is not None:
+            raise ValueError(f"{self.name} already has a job for {key}")
+        job = RenderJob(key, function, args, asyncio.get_running_loop().create_future(), time.monotonic())
+        self.queue.append(job)
+        self.start_next()
+        self.update_metrics()
+        return job
+
+    def find(self, key):
+        if key in self.running:
+            return self.running[key]
+        for job in self.queue:
+            if job.key == key:
+                return job
+        return None
+
+    def position(self, key):
+        """1-based queue position for key, or None if it isn't waiting"""
+        for i, job in enumerate(self.queue, 1):
+            if job.key == key:
+                return i
+        return None
+
+    def estimate_wait(self, position):
+        """Rough seconds until the job at position starts, from recent render times"""
+        average = sum(self.durations) / len(self.durations) if self.durations else self.timeout / 4
+        return math.ceil(position / self.workers) * average
+
+    def cancel(self, key):
+        """Drop a waiting job, or stop waiting for a running one. Returns True if there was a job"""
+        for job in self.queue:
+            if job.key == key:
+                self.queue.remove(job)
+                job.future.cancel()
+                self.notify_moved()
+                self.update_metrics()
+                return True
+        job = self.running.get(key)
+        if job is not None:
+            job.task.cancel()
+            return True
+        return False
+
+    def start_next(self):
+        while self.queue and len(self.running) < self.workers:
+            job = self.queue.popleft()
+            self.running[job.key] = job
+            job.task = asyncio.create_task(self.run(job))
+            job.moved.set()
+            self.notify_moved()
+
+    def notify_moved(self):
+        for job in self.queue:
+            job.moved.set()
+
+    async def run(self, job):
+        metrics = getattr(Utils.BOT, "metrics", None)
+        started_at = time.monotonic()
+        if metrics:
+            metrics.render_wait_seconds.labels(scheduler=self.name).observe(started_at - job.enqueued_at)
+        status = "ok"
+        try:
+            result = await self.execute(job)
+            self.durations.append(time.monotonic() - started_at)
+            if not job.future.done():
+                job.future.set_result(result)
+        except asyncio.TimeoutError:
+            status = "timeout"
+            Logging.warn(f"{self.name} job for {job.key} timed out after {self.timeout}s")
+            self.replace_executor()
+            if not job.future.done():
+                job.future.set_exception(RenderTimeout())
+        except asyncio.CancelledError:
+            status = "cancelled"
+            self.replace_executor()
+            job.future.cancel()
+        except Exception as e:
+            status = "error"
+            if isinstance(e, BrokenProcessPool):
+                # a worker process died. start over with a fresh pool
+                self.replace_executor()
+            if not job.future.done():
+                job.future.set_exception(e)
+        finally:
+            if metrics:
+                metrics.render_seconds.labels(scheduler=self.name, status=status).observe(
+                    time.monotonic() - started_at)
+            self.running.pop(job.key, None)
+            self.start_next()
+            self.update_metrics()
+
+    async def execute(self, job):
+        loop = asyncio.get_running_loop()
+        while True:
+            executor = self.get_executor()
+            try:
+                return await asyncio.wait_for(loop.run_in_executor(executor, job.function, *job.args), self.timeout)
+            except BrokenProcessPool:
+                if executor is self.executor:
+                    raise
+                # terminated because another job in the pool hung or was given up on. start over on the new pool.
+                # the time spent so far wasn't this job's fault, so it gets the whole timeout again
+
+    def update_metrics(self):
+        metrics = getattr(Utils.BOT, "metrics", None)
+        if metrics:
+            metrics.render_queue_depth.labels(scheduler=self.name).set(len(self.queue))
+            metrics.render_running.labels(scheduler=self.name).set(len(self.running))
+
+    async def shutdown(self):
+        for job in list(self.queue):
+            job.future.cancel()
+        self.queue.clear()
+        tasks = [job.task for job in self.running.values()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self.replace_executor()
@@ -0,0 +1,213 @@
+import asyncio
+import random
+import time
+from dataclasses import dataclass, field
+
+from aiohttp import ClientOSError, ServerDisconnectedError
+from discord import ConnectionClosed, DiscordServerError, HTTPException, RateLimited
+
+from utils import Logging, Utils
+
+CLOSED = 0
+HALF_OPEN = 1
+OPEN = 2
+
+ATTEMPTS = 5
+BASE_DELAY = 0.5
+MAX_DELAY = 30.0
+FAILURE_THRESHOLD = 5
+RESET_SECONDS = 30.0
+# closed breakers not used for this long are dropped. a channel that's gone would keep its breaker forever
+IDLE_SECONDS = 3600.0
+
+# errors worth trying again. anything else (Forbidden, NotFound, other 4xx, bugs in our code) is permanent
+TRANSIENT_ERRORS = (DiscordServerError, RateLimited, ClientOSError, ServerDisconnectedError, ConnectionClosed,
+                    asyncio.TimeoutError)
+
+# "route:scope" -> CircuitBreaker
+BREAKERS = dict()
+last_pruned = time.monotonic()
+STATE_NAMES = {HALF_OPEN: "half_open", OPEN: "open"}
+
+
+class CircuitOpenError(Exception):
+    def __init__(self, route, retry_in):
+        super().__init__(f"circuit for `{route}` is open. retry in {retry_in:.1f}s")
+        self.route = route
+        self.retry_in = retry_in
+
+
+@dataclass()
+class CircuitBreaker:
+    # "route:scope", in logs
+    name: str
+    # kind of call, in metrics. one series per channel would grow without limit
+    route: str
+    state: int = CLOSED
+    # calls that gave up in a row. a call that needed retries counts once
+    failures: int = 0
+    opened_at: float = 0.0
+    # a call is testing the route. in HALF_OPEN only that one goes through
+    probing: bool = False
+    used_at: float = field(default_factory=time.monotonic)
+
+    def allow(self):
+        self.used_at = time.monotonic()
+        if self.state == OPEN:
+            if time.monotonic() - self.opened_at < RESET_SECONDS:
+                return False
+            # cool-down elapsed. let one call through to probe the route
+            self.set_state(HALF_OPEN)
+        if self.state == HALF_OPEN:
+            if self.probing:
+                return False
+            self.probing = True
+        return True
+
+    def release(self):
+        """The probe ended without telling whether the route works (permanent error, cancelled). let another probe"""
+        self.probing = False
+
+    def record_success(self):
+        self.failures = 0
+        self.probing = False
+        if self.state != CLOSED:
+            Logging.info(f"circuit for `{self.name}` closed")
+            self.set_state(CLOSED)
+
+    def record_failure(self):
+        self.failures += 1
+        self.probing = False
+        if self.state == HALF_OPEN or self.failures >= FAILURE_THRESHOLD:
+            if self.state != OPEN:
+                Logging.warn(f"circuit for `{self.name}` opened after {self.failures} failed calls")
+            self.opened_at = time.monotonic()
+            self.set_state(OPEN)
+
+    def retry_in(self):
+        return max(0.0, RESET_SECONDS - (time.monotonic() - self.opened_at))
+
+    def set_state(self, state):
+        self.state = state
+        metrics = get_metrics()
+        if metrics:
+            # state changes are rare, so counting again is fine
+            counts = {counted: 0 for counted in STATE_NAMES}
+            for breaker in BREAKERS.values():
+                if breaker.route == self.route and breaker.state in counts:
+                    counts[breaker.state] += 1
+            for counted, count in counts.items():
+                metrics.discord_circuit_state.labels(route=self.route, state=STATE_NAMES[counted]).set(count)
+
+
+def get_metrics():
+    return getattr(Utils.BOT, "metrics", None)
+
+
+def get_breaker(route, scope=None):
+    """
+    Breaker for one kind of call to one target, so a single broken channel doesn't cut off the others
+    :param route: kind of call (e.g. "send")
+    :param scope: what it is called on (e.g. a channel id). None for calls that don't target anything in particular
+    """
+    prune()
+    name = route if scope is None else f"{route}:{scope}"
+    if name not in BREAKERS:
+        BREAKERS[name] = CircuitBreaker(name, route)
+    return BREAKERS[name]
+
+
+def prune(now=None):
+    """Drop closed breakers that haven't been used for IDLE_SECONDS. checks at most once a minute"""
+    global last_pruned
+    now = time.monotonic() if now is None else now
+    if now - last_pruned < 60:
+        return
+    last_pruned = now
+    for name, breaker in list(BREAKERS.items()):
+        if breaker.state == CLOSED and not breaker.probing and now - breaker.used_at > IDLE_SECONDS:
+            del BREAKERS[name]
+
+
+def is_transient(exception):
+    if isinstance(exception, TRANSIENT_ERRORS):
+        return True
+    return isinstance(exception, HTTPException) and exception.status == 429
+
+
+def get_retry_after(exception):
+    """
+    Server-requested wait time for a failed call, if any
+    :param exception: exception raised by the call
+    :return: seconds to wait, or None when the server did not say
+    """
+    if isinstance(exception, RateLimited):
+        return exception.retry_after
+    response = getattr(exception, "response", None)
+    headers = getattr(response, "headers", None)
+    if headers:
+        try:
+            return float(headers.get("Retry-After"))
+        except (TypeError, ValueError):
+            pass
+    return None
+
+
+def backoff_delay(attempt):
+    # "full jitter" exponential backoff: sleep somewhere between 0 and the capped exponential step
+    return random.uniform(0, min(MAX_DELAY, BASE_DELAY * (2 ** attempt)))
+
+
+async def call(route, func, *args, scope=None, attempts=ATTEMPTS, **kwargs):
+    """
+    Make an outbound Discord API call with backoff, jitter and a circuit breaker per route and scope
+    :param route: short name for the kind of call (e.g. "send", "add_reaction")
+    :param func: coroutine function to call. called again for every attempt
+    :param args: positional arguments for func
+    :param scope: what the call targets, usually the channel id. one breaker exists per route and scope
+    :param attempts: maximum number of tries before giving up. a probe of a half-open circuit gets one
+    :param kwargs: keyword arguments for func
+    :return: whatever func returns
+    """
+    breaker = get_breaker(route, scope)
+    metrics = get_metrics()
+    if not breaker.allow():
+        if metrics:
+            metrics.discord_call_failures.labels(route=route, reason="circuit_open").inc()
+        raise CircuitOpenError(breaker.name, breaker.retry_in())
+    probe = breaker.state == HALF_OPEN
+    if probe:
+        attempts = 1
+    try:
+        for attempt in range(attempts):
+            if breaker.state != CLOSED and not probe:
+                # other calls gave up on the route while this one was waiting to try again
+                if metrics:
+                    metrics.discord_call_failures.labels(route=route, reason="circuit_open").inc()
+                raise CircuitOpenError(breaker.name, breaker.retry_in())
+            try:
+                result = await func(*args, **kwargs)
+            except Exception as e:
+                if not is_transient(e):
+                    # permanent failure. retrying won't help and doesn't count against the route
+                    if metrics:
+                        metrics.discord_call_failures.labels(route=route, reason="permanent").inc()
+                    raise
+                if attempt == attempts - 1:
+                    breaker.record_failure()
+                    if metrics:
+                        metrics.discord_call_failures.labels(route=route, reason="exhausted").inc()
+                    raise
+                delay = get_retry_after(e)
+                delay = backoff_delay(attempt) if delay is None else min(delay, MAX_DELAY)
+                Logging.info(f"`{breaker.name}` failed ({type(e).__name__}), attempt {attempt + 1} of {attempts}. "
+                             f"retry in {delay:.2f}s")
+                if metrics:
+                    metrics.discord_call_retries.labels(route=route).inc()
+                await asyncio.sleep(delay)
+            else:
+                breaker.record_success()
+                return result
+    finally:
+        if probe:
+            breaker.release()
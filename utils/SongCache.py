@@ -0,0 +1,153 @@
+import hashlib
+import json
+import os
+import re
+import shutil
+import threading
+from collections import OrderedDict
+
+from utils import Configuration, Logging, Utils
+
+# bump when rendering changes, so sheets rendered by older code are not served
+CACHE_VERSION = 2
+FILE_NAME = re.compile(r"^(\d{2})_(\d{3})(\..+)$")
+
+# key -> bytes on disk, least recently used first
+ENTRIES = OrderedDict()
+LOCK = threading.Lock()
+loaded = False
+
+
+def get_dir():
+    return Configuration.get_var("music_cache_dir", "music_cache")
+
+
+def get_max_bytes():
+    return Configuration.get_var("music_cache_max_mb", 500) * 1024 * 1024
+
+
+def get_size():
+    return sum(ENTRIES.values())
+
+
+def normalize(value):
+    # enums by name so keys don't depend on how the music maker prints them
+    return getattr(value, "name", value)
+
+
+def get_key(locale, notes, input_mode, song_key, octave_shift, aspect_ratio, meta, song_bpm):
+    """Hash of everything that goes into a render. Sheets carry text in the locale they were rendered in"""
+    parts = {
+        "version": CACHE_VERSION,
+        "locale": locale,
+        "notes": " ".join(notes.split()) if isinstance(notes, str) else notes,
+        "input_mode": normalize(input_mode),
+        "song_key": normalize(song_key),
+        "octave_shift": octave_shift,
+        "aspect_ratio": normalize(aspect_ratio),
+        "meta": list(meta),
+        "song_bpm": song_bpm,
+    }
+    text = json.dumps(parts, sort_keys=True, default=str, ensure_ascii=False)
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def get_entry_size(path):
+    return sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+
+
+def load():
+    """Index what is already on disk, oldest first. Runs on first use"""
+    global loaded
+    ENTRIES.clear()
+    directory = get_dir()
+    os.makedirs(directory, exist_ok=True)
+    found = []
+    for name in os.listdir(directory):
+        path = os.path.join(directory, name)
+        if not os.path.isdir(path):
+            continue
+        if ".tmp" in name:
+            # left behind by an interrupted write
+            shutil.rmtree(path, ignore_errors=True)
+            continue
+        found.append((os.path.getmtime(path), name, get_entry_size(path)))
+    for mtime, key, size in sorted(found):
+        ENTRIES[key] = size
+    loaded = True
+    Logging.info(f"music cache has {len(ENTRIES)} songs, {get_size()} bytes")
+
+
+def record(result, size=0):
+    metrics = getattr(Utils.BOT, "metrics", None)
+    if metrics:
+        metrics.music_cache_requests.labels(result=result).inc()
+        if size:
+            metrics.music_cache_bytes_served.inc(size)
+
+
+def get(key):
+    """
+    Blocking. Call from a worker thread
+    :return: list of (file extension, list of file contents) like render_song_files, or None on a miss
+    """
+    with LOCK:
+        if not loaded:
+            load()
+        if key not in ENTRIES:
+            record("miss")
+            return None
+        ENTRIES.move_to_end(key)
+
+    path = os.path.join(get_dir(), key)
+    renders = OrderedDict()
+    try:
+        for name in sorted(os.listdir(path)):
+            match = FILE_NAME.match(name)
+            if match is None:
+                continue
+            with open(os.path.join(path, name), "rb") as file:
+                renders.setdefault((match[1], match[3]), []).append(file.read())
+        # recency survives restarts through the directory mtime
+        os.utime(path)
+    except OSError as e:
+        Logging.warn(f"music cache entry {key} unreadable: {e}")
+        with LOCK:
+            ENTRIES.pop(key, None)
+        shutil.rmtree(path, ignore_errors=True)
+        record("miss")
+        return None
+
+    record("hit", ENTRIES.get(key, 0))
+    return [(extension, contents) for (mode, extension), contents in renders.items()]
+
+
+def put(key, renders):
+    """Blocking. Store rendered files, then evict least recently used songs down to the size limit"""
+    directory = get_dir()
+    with LOCK:
+        if not loaded:
+            load()
+        if key in ENTRIES:
+            return
+    temp_path = os.path.join(directory, f"{key}.tmp{threading.get_ident()}")
+    os.makedirs(temp_path, exist_ok=True)
+    for mode, (extension, contents) in enumerate(renders):
+        for i, data in enumerate(contents):
+            with open(os.path.join(temp_path, f"{mode:02d}_{i:03d}{extension}"), "wb") as file:
+                file.write(data)
+    size = get_entry_size(temp_path)
+    try:
+        os.replace(temp_path, os.path.join(directory, key))
+    except OSError:
+        # the same song was stored by someone else in the meantime
+        shutil.rmtree(temp_path, ignore_errors=True)
+        return
+
+    with LOCK:
+        ENTRIES[key] = size
+        evicted = []
+        while get_size() > get_max_bytes() and len(ENTRIES) > 1:
+            evicted.append(ENTRIES.popitem(last=False)[0])
+    for old_key in evicted:
+        shutil.rmtree(os.path.join(directory, old_key), ignore_errors=True)
@@ -0,0 +1,108 @@
+import asyncio
+import time
+from dataclasses import dataclass
+
+from discord import NotFound, HTTPException
+
+from utils import Logging, Utils, Retry
+
+# wait this long after the last repost request before reposting. more requests in the window push it back
+DEBOUNCE_SECONDS = 5.0
+# but never hold a repost back longer than this during a steady stream of requests
+MAX_DELAY_SECONDS = 30.0
+
+# channel id -> Sticky
+STICKIES = dict()
+
+
+@dataclass()
+class Sticky:
+    channel_id: int
+    message_id: int = None
+    render: object = None
+    due: float = 0.0
+    requested_at: float = 0.0
+    task: asyncio.Task = None
+
+
+def get_sticky(channel_id):
+    if channel_id not in STICKIES:
+        STICKIES[channel_id] = Sticky(channel_id)
+    return STICKIES[channel_id]
+
+
+def get_message_id(channel_id):
+    sticky = STICKIES.get(channel_id)
+    return sticky.message_id if sticky else None
+
+
+def adopt(channel_id, message_id):
+    """
+    Take over a sticky message posted earlier, e.g. one remembered from before a restart
+    :param channel_id: channel the message is in
+    :param message_id: id of the message
+    """
+    get_sticky(channel_id).message_id = message_id
+
+
+def forget(channel_id):
+    """
+    Stop tracking a channel and cancel its pending repost
+    :return: id of the sticky message that was tracked, if any
+    """
+    sticky = STICKIES.pop(channel_id, None)
+    if sticky is None:
+        return None
+    if sticky.task is not None and not sticky.task.done():
+        sticky.task.cancel()
+    return sticky.message_id
+
+
+def request(channel, render, delay=DEBOUNCE_SECONDS):
+    """
+    Ask for the sticky message in a channel to be reposted at the bottom. Requests for the same channel are
+    coalesced, and nothing is posted if the sticky message is still the last message in the channel
+    :param channel: the channel
+    :param render: coroutine function taking the channel, which sends the new sticky message and returns it
+        (or None if it failed). the latest render requested for a channel wins
+    :param delay: debounce window in seconds
+    """
+    sticky = get_sticky(channel.id)
+    now = time.monotonic()
+    sticky.render = render
+    sticky.due = now + delay
+    if sticky.task is None or sticky.task.done():
+        sticky.requested_at = now
+        sticky.task = asyncio.create_task(repost(channel, sticky))
+
+
+async def repost(channel, sticky):
+    try:
+        while True:
+            # keep waiting while requests keep coming, up to the max delay
+            wait = min(sticky.due, sticky.requested_at + MAX_DELAY_SECONDS) - time.monotonic()
+            if wait <= 0:
+                break
+            await asyncio.sleep(wait)
+
+        if sticky.message_id is not None and channel.last_message_id == sticky.message_id:
+            # already at the bottom. nothing to do
+            return
+
+        # post the new message before removing the old one so the channel is never without it
+        message = await sticky.render(channel)
+        if message is None:
+            return
+        old_message_id = sticky.message_id
+        sticky.message_id = message.id
+        Logging.info(f"Sticky message reposted in channel #{channel.name} ({channel.id})")
+
+        if old_message_id is not None:
+            try:
+                await Retry.call("delete", channel.get_partial_message(old_message_id).delete, scope=channel.id)
+            except (NotFound, HTTPException):
+                pass
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        await Utils.handle_exception(f"Sticky message repost failed in channel {channel.id}", Utils.BOT, e)
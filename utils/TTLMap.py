@@ -0,0 +1,155 @@
+import heapq
+import itertools
+import time
+from collections import OrderedDict
+from collections.abc import MutableMapping
+
+from utils import Configuration, Utils
+
+
+class TTLMap(MutableMapping):
+    """
+    Dict with a size limit and per entry expiry, for cooldowns and tracking state that would otherwise only grow.
+
+    Entries expire lazily: every access first pops whatever is due off a heap of expiry times, so nothing needs a
+    cleanup task. Past `max_size` the entries set longest ago are evicted. `on_expire(key, value)` is called for
+    entries that expire or are evicted, for cogs that have to undo something when tracking ends.
+
+    With `persist_key` the map is loaded from and saved to that Configuration persistent var on every change.
+    JSON keys are strings, `key_type` turns them back (e.g. int). `initial` entries, in the saved format
+    {key: [value, expires_at]}, are used instead of the saved ones and saved right away, for cogs converting an
+    older format. Persistent writes are queued, so the converted entries can't go through set_persistent_var first.
+    """
+
+    def __init__(self, name, ttl=None, max_size=None, on_expire=None, persist_key=None, key_type=None, initial=None):
+        self.name = name
+        self.ttl = ttl
+        self.max_size = max_size
+        self.on_expire = on_expire
+        self.persist_key = persist_key
+        self.key_type = key_type
+        # key -> (value, expiry timestamp or None). oldest set first
+        self.entries = OrderedDict()
+        # (expiry timestamp, sequence, key). replaced and removed entries leave stale items that are skipped
+        self.heap = []
+        self.sequence = itertools.count()
+        self.expirations = 0
+        self.evictions = 0
+        if initial is not None:
+            self.load(initial)
+            self.save()
+        elif persist_key is not None:
+            self.load()
+
+    def set(self, key, value, ttl=None, expires_at=None):
+        """Set key, expiring after `ttl` seconds (default: the map's ttl) or at timestamp `expires_at`"""
+        self.expire()
+        self.put(key, value, ttl, expires_at)
+        self.evict()
+        self.save()
+
+    def put(self, key, value, ttl=None, expires_at=None):
+        if expires_at is None:
+            ttl = self.ttl if ttl is None else ttl
+            expires_at = None if ttl is None else time.time() + ttl
+        self.entries.pop(key, None)
+        self.entries[key] = (value, expires_at)
+        if expires_at is not None:
+            heapq.heappush(self.heap, (expires_at, next(self.sequence), key))
+
+    def get_expiry(self, key):
+        """Timestamp key expires at, None if it never does. KeyError if it isn't there"""
+        self.expire()
+        return self.entries[key][1]
+
+    def expire(self):
+        now = time.time()
+        expired = []
+        while self.heap and self.heap[0][0] <= now:
+            expires_at, _, key = heapq.heappop(self.heap)
+            entry = self.entries.get(key)
+            if entry is None or entry[1] != expires_at:
+                continue
+            del self.entries[key]
+            expired.append((key, entry[0]))
+        if len(self.heap) > 2 * len(self.entries) + 64:
+            # mostly stale items from replaced keys
+            self.heap = [item for item in self.heap if self.entries.get(item[2], (None, None))[1] == item[0]]
+            heapq.heapify(self.heap)
+        if expired:
+            self.expirations += len(expired)
+            self.removed(expired, "expired")
+            self.save()
+
+    def evict(self):
+        evicted = []
+        while self.max_size is not None and len(self.entries) > self.max_size:
+            key, (value, expires_at) = self.entries.popitem(last=False)
+            evicted.append((key, value))
+        if evicted:
+            self.evictions += len(evicted)
+            self.removed(evicted, "size")
+
+    def removed(self, entries, reason):
+        metrics = getattr(Utils.BOT, "metrics", None)
+        if metrics:
+            metrics.ttl_map_evictions.labels(map=self.name, reason=reason).inc(len(entries))
+        if self.on_expire is not None:
+            for key, value in entries:
+                self.on_expire(key, value)
+
+    def load(self, saved=None):
+        """Add saved entries, by default the ones in the persistent var"""
+        if saved is None:
+            saved = Configuration.get_persistent_var(self.persist_key, dict())
+        now = time.time()
+        expired = []
+        for key, item in saved.items():
+            if not isinstance(item, list) or len(item) != 2:
+                # not written by a TTLMap
+                continue
+            value, expires_at = item
+            key = self.key_type(key) if self.key_type else key
+            if expires_at is not None and expires_at <= now:
+                # ran out while the bot was down
+                expired.append((key, value))
+                continue
+            self.put(key, value, expires_at=expires_at)
+        if expired:
+            self.expirations += len(expired)
+            self.removed(expired, "expired")
+        self.evict()
+
+    def save(self):
+        if self.persist_key is not None:
+            Configuration.set_persistent_var(
+                self.persist_key, {str(key): [value, expires_at] for key, (value, expires_at) in self.entries.items()})
+
+    def __setitem__(self, key, value):
+        self.set(key, value)
+
+    def __getitem__(self, key):
+        self.expire()
+        return self.entries[key][0]
+
+    def __delitem__(self, key):
+        self.expire()
+        del self.entries[key]
+        self.save()
+
+    def __iter__(self):
+        self.expire()
+        # a copy, so entries can be deleted while iterating
+        return iter(list(self.entries))
+
+    def __len__(self):
+        self.expire()
+        return len(self.entries)
+
+    def clear(self):
+        self.entries.clear()
+        self.heap.clear()
+        self.save()
+
+    def __repr__(self):
+        return f"<TTLMap {self.name} {len(self.entries)} entries>"
@@ -5,7 +5,7 @@ import re
 import time
 import traceback
 import typing
-from collections import OrderedDict, namedtuple
+from collections import namedtuple
 from datetime import datetime
 from json import JSONDecodeError
 
@@ -15,7 +15,8 @@ from aiohttp import ClientOSError, ServerDisconnectedError
 from discord import Embed, Colour, ConnectionClosed, NotFound, guild
 from discord.abc import PrivateChannel
 
-from utils import Logging, Configuration
+from utils import Logging, Configuration, ErrorDigest
+from utils.TTLMap import TTLMap
 
 BOT: typing.Any = None
 GUILD_CONFIGS = dict()
@@ -112,6 +113,9 @@ def extract_info(o):
 
 
 def get_embed_and_log_exception(exception_type, bot, exception, event=None, message=None, ctx=None, *args, **kwargs):
+    if not ErrorDigest.record(exception_type, exception):
+        # seen recently. counted for the digest, nothing below gets formatted
+        return None
     with sentry_sdk.push_scope() as scope:
         embed = Embed(colour=Colour(0xff0000), timestamp=datetime.utcfromtimestamp(time.time()))
 
@@ -213,6 +217,8 @@ def get_embed_and_log_exception(exception_type, bot, exception, event=None, mess
 
 async def handle_exception(exception_type, bot, exception, event=None, message=None, ctx=None, *args, **kwargs):
     embed = get_embed_and_log_exception(exception_type, bot, exception, event, message, ctx, *args, **kwargs)
+    if embed is None:
+        return
     try:
         await Logging.bot_log(embed=embed)
     except Exception as ex:
@@ -227,8 +233,10 @@ def trim_message(message, limit):
     return f"{message[:limit - 3]}..."
 
 
-known_invalid_users = []
-user_cache = OrderedDict()
+# user ids fetch_user didn't find. rechecked after a day in case of an outage
+known_invalid_users = TTLMap("Utils.known_invalid_users", ttl=86400, max_size=10000)
+# recently fetched users that aren't in the bot's cache
+user_cache = TTLMap("Utils.user_cache", ttl=3600, max_size=10)
 
 
 async def get_user(uid, fetch=True):
@@ -237,16 +245,15 @@ async def get_user(uid, fetch=True):
     if user is None:
         if uid in known_invalid_users:
             return None
-        if uid in user_cache:
-            return user_cache[uid]
+        cached = user_cache.get(uid)
+        if cached is not None:
+            return cached
         if fetch:
             try:
                 user = await BOT.fetch_user(uid)
-                if len(user_cache) >= 10:  # Limit the cache size to the most recent 10
-                    user_cache.popitem()
                 user_cache[uid] = user
             except NotFound:
-                known_invalid_users.append(uid)
+                known_invalid_users[uid] = True
                 return None
     return user
 
@@ -7,8 +7,15 @@ db_user = Configuration.get_var("DATABASE_USER")
 db_pass = Configuration.get_var("DATABASE_PASS")
 db_host = Configuration.get_var("DATABASE_HOST")
 db_port = Configuration.get_var("DATABASE_PORT")
+# "mysql" in production. "sqlite" is for tests, with db name as the file path or ":memory:"
+db_engine = Configuration.get_var("DATABASE_ENGINE", "mysql")
 app_name = "skybot"
 
+# env var BOT_DB_ENGINE will override db engine from config.json
+override_db_engine = os.getenv('BOT_DB_ENGINE')
+if override_db_engine:
+    db_engine = override_db_engine
+
 # env var BOT_DB will override db name from both init call AND config.json
 override_db_name = os.getenv('BOT_DB')
 if override_db_name:
@@ -18,18 +25,34 @@ override_model_name = os.getenv('BOT_MODEL')
 if override_model_name:
     db_model = override_model_name
 
-TORTOISE_ORM = {
-    'connections': {
-        'default': {
-            'engine': 'tortoise.backends.mysql',
+
+def get_connection(db_name):
+    if db_engine == "sqlite":
+        return {
+            'engine': 'tortoise.backends.sqlite',
             'credentials': {
-                'host': db_host,
-                'port': db_port,
-                'user': db_user,
-                'password': db_pass,
-                'database': db_name,
+                'file_path': db_name or ':memory:',
             }
         }
+    return {
+        'engine': 'tortoise.backends.mysql',
+        'credentials': {
+            'host': db_host,
+            'port': db_port,
+            'user': db_user,
+            'password': db_pass,
+            'database': db_name,
+            'minsize': Configuration.get_var("DATABASE_POOL_MIN", 1),
+            'maxsize': Configuration.get_var("DATABASE_POOL_MAX", 5),
+            # recycle pooled connections before the server's wait_timeout drops them
+            'pool_recycle': Configuration.get_var("DATABASE_POOL_RECYCLE", 3600),
+        }
+    }
+
+
+TORTOISE_ORM = {
+    'connections': {
+        'default': get_connection(db_name)
     },
     'apps': {
         app_name: {'models': [db_model, 'aerich.models']}